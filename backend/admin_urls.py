@@ -0,0 +1,13 @@
+"""
+Admin URLs, loaded on the first request to /admin/ (or the first reverse())
+rather than at startup.
+
+Registering the ModelAdmins imports the admin forms, widgets and views,
+which the API never needs, so settings use SimpleAdminConfig and the
+registrations are discovered here.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
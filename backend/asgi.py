@@ -8,21 +8,31 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
-import django
 
-from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+from whiteboard import startup
+
+startup.begin()
+
+with startup.phase('django imports'):
+    import django
+    from django.core.asgi import get_asgi_application
+    from channels.routing import ProtocolTypeRouter, URLRouter
+    from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 # Initialize Django BEFORE importing anything that uses models
-django.setup()
+with startup.phase('django.setup'):
+    django.setup()
+
+with startup.phase('http handler'):
+    http_application = get_asgi_application()
 
-import whiteboard.routing
+with startup.phase('websocket routing'):
+    import whiteboard.routing
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": http_application,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             whiteboard.routing.websocket_urlpatterns
@@ -30,3 +40,5 @@ application = ProtocolTypeRouter({
     ),
 })
 
+startup.warm_up()
+startup.finish()
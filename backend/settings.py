@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,7 +35,8 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(','
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # The admin is discovered on first use by backend/admin_urls.py
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -46,11 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'whiteboard.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'whiteboard.replicas.ReplicaRoutingMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -76,12 +81,22 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 ASGI_APPLICATION = 'backend.asgi.application'
 
-# Channels
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Channels: in memory, which only reaches the sockets of the same process,
+# unless REDIS_URL names a Redis server shared by all processes
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 # CORS settings - configurable via environment variables
 CORS_ALLOW_ALL_ORIGINS = os.environ.get('CORS_ALLOW_ALL_ORIGINS', 'True').lower() in ('true', '1', 'yes', 'on')
@@ -124,6 +139,41 @@ CSRF_TRUSTED_ORIGINS = [origin.strip() for origin in csrf_origins_str.split(',')
     'http://127.0.0.1:5174',
 ]
 
+# Cache: "locmem" (per process), "file" (shared by the processes of one
+# host, under CACHE_LOCATION), "db" (shared, table CACHE_LOCATION, created
+# by `manage.py createcachetable`) or "redis" (shared, CACHE_LOCATION is the URL)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION', '')
+CACHES = {
+    'default': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+            'db': 'django.core.cache.backends.db.DatabaseCache',
+            'redis': 'django.core.cache.backends.redis.RedisCache',
+        }[CACHE_BACKEND],
+        'LOCATION': CACHE_LOCATION or {
+            'locmem': 'stickytux',
+            'file': '/tmp/stickytux-cache',
+            'db': 'stickytux_cache',
+            'redis': 'redis://localhost:6379/1',
+        }[CACHE_BACKEND],
+    }
+}
+# Whether every worker process and pod sees the same cache
+SHARED_CACHE = CACHE_BACKEND in ('db', 'redis')
+
+# Sessions and the users they belong to are read from the cache
+# (whiteboard/auth_cache.py), but only from a shared one: a logout or a
+# deactivation must reach every worker at once, not only the one that
+# handled it
+if SHARED_CACHE:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+AUTHENTICATION_BACKENDS = ['whiteboard.auth_cache.CachedModelBackend']
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', '60')) if SHARED_CACHE else 0
+
 # Session and CSRF cookie settings for cross-origin
 SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = True  # Required for SameSite=None
@@ -154,6 +204,92 @@ REST_FRAMEWORK = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
 
+# Whiteboard preview thumbnails (rendered in the background, cached under MEDIA_ROOT)
+PREVIEW_ENABLED = os.environ.get('PREVIEW_ENABLED', 'True').lower() in ('true', '1', 'yes', 'on')
+PREVIEW_DIR = 'previews'
+PREVIEW_FORMAT = os.environ.get('PREVIEW_FORMAT', 'PNG').upper()  # PNG or WEBP
+PREVIEW_SIZE = (320, 240)
+PREVIEW_PADDING = 8
+PREVIEW_DEBOUNCE_SECONDS = float(os.environ.get('PREVIEW_DEBOUNCE_SECONDS', '5'))
+
+# Raster tiles of the drawing strokes for zoomed-out views (whiteboard/tiles.py):
+# TILE_SIZE pixels square, at zoom levels 1/2, 1/4, ... down to 1/2**TILE_LEVELS
+TILES_ENABLED = os.environ.get('TILES_ENABLED', 'True').lower() in ('true', '1', 'yes', 'on')
+TILE_DIR = 'tiles'
+TILE_SIZE = 256
+TILE_LEVELS = int(os.environ.get('TILE_LEVELS', '5'))
+TILE_DEBOUNCE_SECONDS = float(os.environ.get('TILE_DEBOUNCE_SECONDS', '3'))
+
+# Sticky note order keys longer than this trigger a background re-keying of the board
+ORDER_KEY_REBALANCE_LENGTH = 32
+
+# Drawing compaction: old strokes are merged into per-board layer rows in the background
+DRAWING_COMPACTION_ENABLED = os.environ.get('DRAWING_COMPACTION_ENABLED', 'True').lower() in ('true', '1', 'yes', 'on')
+DRAWING_COMPACT_AFTER_SECONDS = int(os.environ.get('DRAWING_COMPACT_AFTER_SECONDS', '300'))
+DRAWING_COMPACT_DEBOUNCE_SECONDS = 60
+DRAWING_COMPACT_MIN_STROKES = 50
+DRAWING_COMPACT_BATCH = 5000
+DRAWING_LAYER_MAX_STROKES = 1000
+
+# Full-text note search (SQLite FTS5 or PostgreSQL tsvector, depending on DATABASES)
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'english')  # PostgreSQL text search configuration
+SEARCH_MAX_TERMS = 8
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# User search for the sharing dialog (trigram/prefix indexed, cached per query)
+USER_SEARCH_LIMIT = 10
+USER_SEARCH_CANDIDATES = 100
+USER_SEARCH_CACHE_SECONDS = int(os.environ.get('USER_SEARCH_CACHE_SECONDS', '30'))
+
+# Board export/import: rows per NDJSON archive member and per bulk_create batch
+BOARD_TRANSFER_CHUNK_SIZE = int(os.environ.get('BOARD_TRANSFER_CHUNK_SIZE', '1000'))
+
+# Operation log: snapshot a board every N operations, keep operations and
+# older snapshots for this many days (the newest snapshots are always kept)
+OPLOG_SNAPSHOT_EVERY = int(os.environ.get('OPLOG_SNAPSHOT_EVERY', '500'))
+OPLOG_RETENTION_DAYS = int(os.environ.get('OPLOG_RETENTION_DAYS', '30'))
+OPLOG_KEEP_SNAPSHOTS = int(os.environ.get('OPLOG_KEEP_SNAPSHOTS', '2'))
+OPLOG_PAGE_SIZE = int(os.environ.get('OPLOG_PAGE_SIZE', '500'))
+
+# Deleted boards are purged in the background, this many rows per transaction
+BOARD_PURGE_BATCH_SIZE = int(os.environ.get('BOARD_PURGE_BATCH_SIZE', '1000'))
+
+# Optional authoritative room state in the WebSocket processes (whiteboard/rooms.py):
+# open boards are kept in memory, socket ops are applied there and the changed
+# rows are written back every ROOM_FLUSH_SECONDS; rooms without clients are
+# flushed and dropped, and kept for another try every ROOM_IDLE_SECONDS if
+# that write fails. Every process keeps its own rooms and
+# learns the others' ops through the channel layer, so it must be shared
+ROOM_STATE = os.environ.get('ROOM_STATE', 'False') == 'True'
+if ROOM_STATE and not REDIS_URL:
+    raise ImproperlyConfigured('ROOM_STATE=True needs a shared channel layer: set REDIS_URL')
+ROOM_FLUSH_SECONDS = float(os.environ.get('ROOM_FLUSH_SECONDS', '2'))
+ROOM_IDLE_SECONDS = float(os.environ.get('ROOM_IDLE_SECONDS', '300'))
+
+# Pan/zoom saves are buffered per user and board and written in bulk this
+# often (whiteboard/view_settings.py); 0 writes each save through
+VIEW_SETTINGS_FLUSH_SECONDS = float(os.environ.get('VIEW_SETTINGS_FLUSH_SECONDS', '5'))
+
+# Changes outside a WebSocket client's registered viewport are sent to it in
+# batches this often (whiteboard/viewports.py)
+VIEWPORT_BATCH_SECONDS = float(os.environ.get('VIEWPORT_BATCH_SECONDS', '1'))
+
+# Prometheus metrics at /metrics; when set, scrapes must send "Authorization: Bearer <token>".
+# Multi-process servers aggregate through PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Background work (previews, drawing compaction, snapshots, purges, ...):
+# "threads" runs it on timer threads of the web process, "worker" queues it in
+# the database for `manage.py run_worker`
+BACKGROUND_TASKS = os.environ.get('BACKGROUND_TASKS', 'threads')
+TASK_WORKER_PROCESSES = int(os.environ.get('TASK_WORKER_PROCESSES', '2'))
+TASK_POLL_SECONDS = float(os.environ.get('TASK_POLL_SECONDS', '1'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '3'))
+TASK_RETRY_DELAY_SECONDS = int(os.environ.get('TASK_RETRY_DELAY_SECONDS', '30'))  # doubled on each retry
+TASK_TIMEOUT_SECONDS = int(os.environ.get('TASK_TIMEOUT_SECONDS', '3600'))  # running longer = worker lost
+TASK_KEEP_DAYS = int(os.environ.get('TASK_KEEP_DAYS', '7'))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -169,6 +305,42 @@ DATABASES = {
     )
 }
 
+# SQLite production profile: WAL journal so readers never block the writer,
+# fsync only at checkpoints, a generous busy timeout instead of "database is
+# locked", and BEGIN IMMEDIATE so transactions take the write lock up front
+# rather than failing on upgrade. Set SQLITE_TUNING=False to use plain SQLite.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' and os.environ.get('SQLITE_TUNING', 'True') == 'True':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '20')),
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+            f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_SIZE_KB', '65536'))}",
+            'PRAGMA temp_store=MEMORY',
+        ]),
+    })
+
+# Funnel note and drawing writes of this process through one writer thread
+# that commits them in batches (SQLite only)
+SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', 'False') == 'True'
+SQLITE_WRITE_BATCH_SIZE = int(os.environ.get('SQLITE_WRITE_BATCH_SIZE', '64'))
+SQLITE_WRITE_BATCH_WAIT = float(os.environ.get('SQLITE_WRITE_BATCH_WAIT', '0.002'))
+
+# Optional read replicas: comma-separated database URLs. Reads of safe-method
+# requests are spread over them; a client that writes is pinned to the
+# primary for REPLICA_PIN_SECONDS so it reads its own writes.
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=600, conn_health_checks=True)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['whiteboard.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
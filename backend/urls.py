@@ -14,15 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from whiteboard.metrics import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # A module name rather than include(), so that the admin is only
+    # imported once a URL under admin/ is resolved
+    path('admin/', ('backend.admin_urls', 'admin', 'admin')),
     path('api/', include('whiteboard.urls')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+from whiteboard import startup
+
+startup.begin()
+
+with startup.phase('django imports'):
+    from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_wsgi_application()
+# get_wsgi_application() runs django.setup() and loads the middleware
+with startup.phase('django.setup and handler'):
+    application = get_wsgi_application()
+
+startup.warm_up()
+startup.finish()
@@ -96,7 +96,16 @@ export default {
   },
   
   getWhiteboard(id) {
-    return api.get(`/whiteboards/${id}/`)
+    return api.get(`/live/whiteboards/${id}/`)
+  },
+
+  // Board, view settings, custom colors, role, CSRF and resume tokens in one response
+  async getWhiteboardBootstrap(id) {
+    const response = await api.get(`/whiteboards/${id}/bootstrap/`)
+    if (response.data && response.data.csrftoken) {
+      storedCsrfToken = response.data.csrftoken
+    }
+    return response
   },
   
   createWhiteboard(data) {
@@ -110,6 +119,40 @@ export default {
   deleteWhiteboard(id) {
     return api.delete(`/whiteboards/${id}/`)
   },
+
+  getWhiteboardPreview(id) {
+    return api.get(`/whiteboards/${id}/preview/`, { responseType: 'blob' })
+  },
+
+  getDrawingTiles(id, level) {
+    return api.get(`/whiteboards/${id}/tiles/`, { params: { level } })
+  },
+
+  exportWhiteboard(id) {
+    return api.get(`/whiteboards/${id}/export/`, { responseType: 'blob' })
+  },
+
+  importWhiteboard(archiveFile, name) {
+    const formData = new FormData()
+    formData.append('archive', archiveFile)
+    if (name) {
+      formData.append('name', name)
+    }
+    return api.post('/whiteboards/import/', formData)
+  },
+
+  // data: { name, is_template }, both optional
+  duplicateWhiteboard(id, data = {}) {
+    return api.post(`/whiteboards/${id}/duplicate/`, data)
+  },
+  
+  getWhiteboardState(whiteboardId) {
+    return api.get(`/whiteboards/${whiteboardId}/state/`)
+  },
+  
+  getWhiteboardHistory(whiteboardId, since = 0) {
+    return api.get(`/whiteboards/${whiteboardId}/history/`, { params: { since } })
+  },
   
   grantAccess(whiteboardId, username, role) {
     return api.post(`/whiteboards/${whiteboardId}/grant_access/`, {
@@ -124,8 +167,12 @@ export default {
     })
   },
 
+  searchNotes(query, page = 1) {
+    return api.get('/search/', { params: { q: query, page } })
+  },
+
   searchUsers(query) {
-    return api.get(`/users/search/?q=${encodeURIComponent(query)}`)
+    return api.get(`/live/users/search/?q=${encodeURIComponent(query)}`)
   },
   
   // Sticky Notes
@@ -138,13 +185,36 @@ export default {
   },
   
   updateStickyNote(id, data) {
-    return api.patch(`/sticky-notes/${id}/`, data)
+    return api.patch(`/live/sticky-notes/${id}/`, data)
   },
   
   deleteStickyNote(id) {
     return api.delete(`/sticky-notes/${id}/`)
   },
+
+  // position: 'front' | 'back', or { above: noteId } / { below: noteId }
+  reorderStickyNote(id, position) {
+    const data = typeof position === 'string' ? { position } : position
+    return api.post(`/sticky-notes/${id}/reorder/`, data)
+  },
   
+  // Note Groups (members store coordinates relative to the group)
+  createNoteGroup(whiteboardId, noteIds) {
+    return api.post('/note-groups/', { whiteboard: whiteboardId, note_ids: noteIds })
+  },
+
+  moveNoteGroup(id, offsetX, offsetY, scale) {
+    const data = { offset_x: offsetX, offset_y: offsetY }
+    if (scale !== undefined) {
+      data.scale = scale
+    }
+    return api.patch(`/note-groups/${id}/`, data)
+  },
+
+  ungroupNotes(id) {
+    return api.post(`/note-groups/${id}/ungroup/`)
+  },
+
   // Sticky Note Images
   addImageToNote(noteId, imageFile) {
     const formData = new FormData()
@@ -188,14 +258,11 @@ export default {
   
   // View Settings
   getViewSettings(whiteboardId) {
-    return api.get('/view-settings/for_whiteboard/', {
-      params: { whiteboard_id: whiteboardId }
-    })
+    return api.get(`/live/view-settings/${whiteboardId}/`)
   },
   
   saveViewSettings(whiteboardId, zoom, panX, panY) {
-    return api.post('/view-settings/for_whiteboard/', {
-      whiteboard: whiteboardId,
+    return api.post(`/live/view-settings/${whiteboardId}/`, {
       zoom: zoom,
       pan_x: panX,
       pan_y: panY
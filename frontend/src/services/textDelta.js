@@ -0,0 +1,111 @@
+// Text deltas for sticky note content, see whiteboard/textops.py on the
+// server. A delta is a list of operations applied in order, each either
+// { pos, insert } or { pos, delete }; positions are string indices.
+
+export function applyDelta(text, ops) {
+  for (const op of ops) {
+    if (op.insert !== undefined) {
+      text = text.slice(0, op.pos) + op.insert + text.slice(op.pos)
+    } else {
+      text = text.slice(0, op.pos) + text.slice(op.pos + op.delete)
+    }
+  }
+  return text
+}
+
+// The delta turning `before` into `after`, as one replaced range
+export function diffText(before, after) {
+  let start = 0
+  while (start < before.length && start < after.length && before[start] === after[start]) {
+    start++
+  }
+  let end = 0
+  while (
+    end < before.length - start &&
+    end < after.length - start &&
+    before[before.length - 1 - end] === after[after.length - 1 - end]
+  ) {
+    end++
+  }
+  const ops = []
+  if (before.length - start - end > 0) {
+    ops.push({ pos: start, delete: before.length - start - end })
+  }
+  if (after.length - start - end > 0) {
+    ops.push({ pos: start, insert: after.slice(start, after.length - end) })
+  }
+  return ops
+}
+
+function transformOp(a, b, aFirst) {
+  let pos = a.pos
+  if (b.insert !== undefined) {
+    const inserted = b.insert.length
+    if (a.insert !== undefined) {
+      if (b.pos < pos || (b.pos === pos && !aFirst)) {
+        pos += inserted
+      }
+      return [{ ...a, pos }]
+    }
+    const end = pos + a.delete
+    if (b.pos <= pos) {
+      return [{ ...a, pos: pos + inserted }]
+    }
+    if (b.pos >= end) {
+      return [a]
+    }
+    const before = b.pos - pos
+    return [{ pos, delete: before }, { pos: pos + inserted, delete: a.delete - before }]
+  }
+
+  const bEnd = b.pos + b.delete
+  if (a.insert !== undefined) {
+    if (pos <= b.pos) {
+      return [a]
+    }
+    return [{ ...a, pos: Math.max(pos - b.delete, b.pos) }]
+  }
+  const end = pos + a.delete
+  const overlap = Math.max(0, Math.min(end, bEnd) - Math.max(pos, b.pos))
+  const count = a.delete - overlap
+  if (count === 0) {
+    return []
+  }
+  if (pos >= b.pos) {
+    pos = Math.max(pos - b.delete, b.pos)
+  }
+  return [{ pos, delete: count }]
+}
+
+// Deltas a and b, made against the same text, rewritten to apply after
+// each other: returns [a2, b2] so that b then a2 equals a then b2
+export function transformDelta(a, b, aFirst = false) {
+  if (!a.length || !b.length) {
+    return [a, b]
+  }
+  if (a.length > 1) {
+    const [head, b1] = transformDelta(a.slice(0, 1), b, aFirst)
+    const [rest, b2] = transformDelta(a.slice(1), b1, aFirst)
+    return [head.concat(rest), b2]
+  }
+  if (b.length > 1) {
+    const [a1, head] = transformDelta(a, b.slice(0, 1), aFirst)
+    const [a2, rest] = transformDelta(a1, b.slice(1), aFirst)
+    return [a2, head.concat(rest)]
+  }
+  return [transformOp(a[0], b[0], aFirst), transformOp(b[0], a[0], !aFirst)]
+}
+
+// Where a cursor position ends up once the delta is applied
+export function transformIndex(index, ops) {
+  for (const op of ops) {
+    if (op.insert !== undefined) {
+      if (op.pos < index) {
+        index += op.insert.length
+      }
+    } else if (op.pos < index) {
+      index -= Math.min(op.delete, index - op.pos)
+    }
+  }
+  return index
+}
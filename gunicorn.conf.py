@@ -0,0 +1,36 @@
+"""
+Gunicorn settings picked up automatically from the working directory.
+
+Worker processes come and go (--max-requests), so Prometheus metrics are
+kept in prometheus_client's multiprocess mode: each worker writes to files
+in PROMETHEUS_MULTIPROC_DIR and /metrics sums them over all workers.
+"""
+import os
+import shutil
+import tempfile
+
+multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'stickytux-metrics')
+)
+# Samples of a previous run would otherwise be added to this one
+shutil.rmtree(multiproc_dir, ignore_errors=True)
+os.makedirs(multiproc_dir, exist_ok=True)
+
+# Load and warm up the application once in the master and fork the workers
+# from it, instead of every worker importing everything again on start and
+# on each --max-requests restart (see whiteboard/startup.py)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the exited worker's gauges (open connections, queue depth)
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from whiteboard.view_settings import buffer
+
+    # Write the pan/zoom saves still buffered in this worker
+    buffer.flush()
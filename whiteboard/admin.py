@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Whiteboard, WhiteboardAccess, StickyNote, StickyNoteImage, Drawing, CustomColor
+from .models import Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, DrawingLayer, BoardOperation, BoardSnapshot, BackgroundTask, CustomColor
 
 
 @admin.register(Whiteboard)
@@ -23,6 +23,13 @@ class StickyNoteAdmin(admin.ModelAdmin):
     search_fields = ['content', 'whiteboard__name']
 
 
+@admin.register(NoteGroup)
+class NoteGroupAdmin(admin.ModelAdmin):
+    list_display = ['whiteboard', 'offset_x', 'offset_y', 'scale', 'created_by', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['whiteboard__name']
+
+
 @admin.register(StickyNoteImage)
 class StickyNoteImageAdmin(admin.ModelAdmin):
     list_display = ['sticky_note', 'order', 'created_at']
@@ -37,6 +44,34 @@ class DrawingAdmin(admin.ModelAdmin):
     search_fields = ['whiteboard__name']
 
 
+@admin.register(DrawingLayer)
+class DrawingLayerAdmin(admin.ModelAdmin):
+    list_display = ['whiteboard', 'stroke_count', 'first_stroke_id', 'last_stroke_id', 'updated_at']
+    search_fields = ['whiteboard__name']
+    exclude = ['strokes']
+
+
+@admin.register(BoardOperation)
+class BoardOperationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'whiteboard', 'op_type', 'target_id', 'user', 'created_at']
+    list_filter = ['op_type', 'created_at']
+    search_fields = ['whiteboard__name', 'user__username']
+
+
+@admin.register(BoardSnapshot)
+class BoardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['whiteboard', 'last_operation_id', 'created_at']
+    search_fields = ['whiteboard__name']
+    exclude = ['state']
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'args', 'status', 'priority', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['dedup_key', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at']
+
+
 @admin.register(CustomColor)
 class CustomColorAdmin(admin.ModelAdmin):
     list_display = ['user', 'name', 'nickname', 'hex_color', 'created_at']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WhiteboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'whiteboard'
+
+    def ready(self):
+        from . import signals  # noqa: F401
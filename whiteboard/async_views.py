@@ -0,0 +1,168 @@
+"""
+Native async versions of the hottest REST endpoints.
+
+Under ASGI every DRF view runs in a worker thread, so each request pays a
+thread hop and concurrency is capped by the thread pool. These views stay
+on the event loop and use Django's async ORM; only the parts that have no
+async API yet (model saves with their signals, the raw-SQL user search)
+are handed to a thread. Responses match their sync counterparts:
+
+    GET   /api/live/whiteboards/<id>/           ~ GET /api/whiteboards/<id>/
+    PATCH /api/live/sticky-notes/<id>/          ~ PATCH /api/sticky-notes/<id>/ (move/resize/style)
+    GET   /api/live/view-settings/<board id>/   ~ GET /api/view-settings/for_whiteboard/
+    POST  /api/live/view-settings/<board id>/   ~ POST /api/view-settings/for_whiteboard/
+    GET   /api/live/users/search/?q=            ~ GET /api/users/search/
+
+Authentication is the Django session, as with the DRF endpoints.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods
+
+from .background import run_write
+from .models import Whiteboard, WhiteboardAccess, StickyNote, Drawing, WhiteboardViewSettings
+from .oplog import changed_fields, note_data, record_operation
+from .search import search_users as find_users
+from .serializers import StickyNoteSerializer, WhiteboardSerializer, WhiteboardViewSettingsSerializer
+from .view_settings import DEFAULT_VIEW_SETTINGS, buffer as view_settings_buffer, clean_view_settings
+
+# Fields the live note endpoint accepts; anything touching relations goes through the viewset
+NOTE_PATCH_FIELDS = ['content', 'link', 'color', 'x', 'y', 'width', 'height', 'group_id', 'z_index']
+WRITE_ROLES = ['owner', 'edit', 'admin']
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def _not_authenticated():
+    return _error('Authentication credentials were not provided.', 403)
+
+
+def _not_found():
+    return _error('Not found.', 404)
+
+
+def _parse_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _role(user, whiteboard_id):
+    """The user's role on a whiteboard ('owner', 'view', 'edit', 'admin') or None"""
+    owner_id = await Whiteboard.objects.filter(id=whiteboard_id).values_list('owner_id', flat=True).afirst()
+    if owner_id is None:
+        return None
+    if owner_id == user.id:
+        return 'owner'
+    return await WhiteboardAccess.objects.filter(
+        whiteboard_id=whiteboard_id, user=user
+    ).values_list('role', flat=True).afirst()
+
+
+@require_GET
+async def whiteboard_snapshot(request, pk):
+    """Full board contents, same shape as the whiteboard retrieve endpoint"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _not_authenticated()
+    if await _role(user, pk) is None:
+        return _not_found()
+
+    # Everything the serializer touches is prefetched, so serializing below
+    # runs no queries
+    whiteboard = await Whiteboard.objects.select_related('owner').prefetch_related(
+        Prefetch('sticky_notes', queryset=StickyNote.objects.select_related('created_by').prefetch_related('images')),
+        Prefetch('drawings', queryset=Drawing.objects.select_related('created_by')),
+        'drawing_layers',
+        'note_groups',
+        Prefetch('access_rights', queryset=WhiteboardAccess.objects.select_related('user')),
+    ).aget(id=pk)
+    return JsonResponse(WhiteboardSerializer(whiteboard, context={'request': request}).data)
+
+
+def _update_note(serializer, user):
+    previous = changed_fields(serializer.instance, serializer.validated_data)
+    note = serializer.save()
+    record_operation(
+        note.whiteboard_id, 'note_updated', {'note': note_data(note)},
+        target_id=note.id, user=user, previous=previous,
+    )
+    return serializer.data
+
+
+@require_http_methods(['PATCH'])
+async def update_note(request, pk):
+    """Move, resize or restyle a sticky note"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _not_authenticated()
+    data = _parse_body(request)
+    if data is None:
+        return _error('JSON object body required', 400)
+
+    note = await StickyNote.objects.filter(id=pk).afirst()
+    role = await _role(user, note.whiteboard_id) if note else None
+    if role is None:
+        return _not_found()
+    if role not in WRITE_ROLES:
+        return _error('You do not have permission to perform this action.', 403)
+
+    serializer = StickyNoteSerializer(
+        note,
+        data={field: value for field, value in data.items() if field in NOTE_PATCH_FIELDS},
+        partial=True,
+        context={'request': request},
+    )
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    # Saving fires the model signals, which are sync
+    return JsonResponse(await sync_to_async(run_write)(_update_note, serializer, user))
+
+
+@require_http_methods(['GET', 'POST'])
+async def view_settings(request, whiteboard_id):
+    """Get or update the user's zoom and pan for a whiteboard"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _not_authenticated()
+    # Unsaved settings are newer than the row; access was checked when they were buffered
+    buffered = view_settings_buffer.get(user.id, whiteboard_id)
+    if buffered is None and await _role(user, whiteboard_id) is None:
+        return _error('Whiteboard not found', 404)
+
+    if request.method == 'GET':
+        if buffered is not None:
+            return JsonResponse(buffered)
+        settings = await WhiteboardViewSettings.objects.filter(user=user, whiteboard_id=whiteboard_id).afirst()
+        if settings is None:
+            return JsonResponse(DEFAULT_VIEW_SETTINGS)
+        return JsonResponse(WhiteboardViewSettingsSerializer(settings).data)
+
+    data = _parse_body(request)
+    if data is None:
+        return _error('JSON object body required', 400)
+    try:
+        values = clean_view_settings(data)
+    except ValueError as exc:
+        return _error(str(exc), 400)
+    return JsonResponse(await view_settings_buffer.aput(user.id, whiteboard_id, values))
+
+
+@require_GET
+async def search_users(request):
+    """Search for users by username or email, recent collaborators first"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _not_authenticated()
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse([], safe=False)
+    # The trigram index lookup is raw SQL, which has no async API
+    return JsonResponse(await sync_to_async(find_users)(user, query), safe=False)
@@ -0,0 +1,56 @@
+"""
+Cached user resolution for session authentication.
+
+Resolving the user of a request (``AuthenticationMiddleware`` for REST
+calls, ``AuthMiddlewareStack`` for WebSocket connects) reads the session
+and then the user row. With a shared cache (``CACHE_BACKEND`` ``db`` or
+``redis``) sessions use the ``cached_db`` engine and this backend keeps
+the user row in the cache for ``AUTH_USER_CACHE_SECONDS``, so both come
+from the cache on most requests.
+
+Entries are dropped whenever a user is saved or deleted and on logout.
+Since every worker reads the same cache, that takes effect everywhere at
+once. A per-process cache could not guarantee this, so with one the
+settings keep the ``db`` session engine and turn the user cache off.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop a user's cached row so the next request reads it again"""
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose ``get_user`` is served from the cache for a short time"""
+
+    def get_user(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_SECONDS
+        if not timeout:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+        return user
+
+    async def aget_user(self, user_id):
+        # Used by request.auser() in the async views
+        timeout = settings.AUTH_USER_CACHE_SECONDS
+        if not timeout:
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, timeout)
+        return user
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.csrf import ensure_csrf_cookie
+from .auth_cache import forget_user
 
 
 @api_view(['POST'])
@@ -41,6 +42,7 @@ def login_view(request):
 @api_view(['POST'])
 def logout_view(request):
     """Logout endpoint"""
+    forget_user(request.user.id)
     logout(request)
     return Response({'message': 'Successfully logged out'})
 
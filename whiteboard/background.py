@@ -0,0 +1,181 @@
+"""
+Small helpers for running per-board maintenance off the request path, and
+the single-writer queue used to batch writes on SQLite.
+"""
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import tasks
+
+
+class Debouncer:
+    """Runs ``func(key)`` on a background thread ``delay`` seconds after the last request
+
+    Calls for the same key within the delay are coalesced into one run, and
+    runs are only requested once the current transaction commits. ``delay``
+    may be a callable so it can follow settings overridden at runtime.
+
+    With ``settings.BACKGROUND_TASKS = 'worker'`` the run is queued in the
+    database for ``manage.py run_worker`` instead; identical pending runs
+    are de-duplicated there, so calls within the delay still coalesce.
+    """
+
+    def __init__(self, func, delay, name=None, priority=0):
+        self.func = func
+        self.delay = delay
+        self.name = name or func.__name__
+        self._lock = threading.Lock()
+        self._timers = {}
+        self.task = tasks.register(func, priority=priority)
+
+    def schedule(self, key, delay=None):
+        """Request a run; ``delay`` overrides the default for this request"""
+        if delay is None:
+            delay = self._delay()
+        if settings.BACKGROUND_TASKS == 'worker':
+            # Queued in the current transaction, so it commits (or not) with the change
+            self.task.enqueue(key, delay=delay)
+            return
+        transaction.on_commit(lambda: self._start(key, delay))
+
+    def _delay(self):
+        return self.delay() if callable(self.delay) else self.delay
+
+    def _start(self, key, delay):
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(delay, self._run, args=[key])
+            timer.daemon = True
+            self._timers[key] = timer
+            timer.start()
+
+    def _run(self, key):
+        with self._lock:
+            self._timers.pop(key, None)
+        try:
+            self.func(key)
+        except Exception as exc:
+            print(f"{self.name} failed for {key}: {exc}")
+        finally:
+            # Timer threads get their own DB connection; don't leak it
+            connection.close()
+
+
+class WriteQueue:
+    """Runs write callables on one dedicated thread, committing them in batches
+
+    SQLite allows a single writer at a time, so concurrent request threads
+    otherwise queue up on the database lock and pay one fsync each. Here
+    they hand their write to ``submit()`` and wait on the returned future;
+    the writer thread runs up to ``batch_size`` queued writes in one
+    transaction (each in its own savepoint, so one failure doesn't abort
+    the others), waiting at most ``batch_wait`` seconds for a batch to fill.
+    """
+
+    def __init__(self, batch_size=None, batch_wait=None, name='SQLite writer'):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch_size = self.batch_size or settings.SQLITE_WRITE_BATCH_SIZE
+        batch_wait = settings.SQLITE_WRITE_BATCH_WAIT if self.batch_wait is None else self.batch_wait
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + batch_wait
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        results = []
+        try:
+            with transaction.atomic():
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        results.append(None)
+                        continue
+                    try:
+                        with transaction.atomic():
+                            results.append((True, func(*args, **kwargs)))
+                    except Exception as exc:
+                        results.append((False, exc))
+        except Exception as exc:
+            # The commit itself failed, so none of the batch was written
+            for future, *_ in batch:
+                if future.running():
+                    future.set_exception(exc)
+            connection.close()
+            return
+
+        for (future, *_), result in zip(batch, results):
+            if result is None:
+                continue
+            ok, value = result
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_writer = WriteQueue()
+
+
+def run_write(func, *args, **kwargs):
+    """Run ``func`` in a transaction, through the single-writer queue when it is enabled
+
+    Writes already inside a transaction run inline: the writer thread could
+    not take the database lock that transaction holds. Either way a change
+    and the operation it logs commit together.
+    """
+    if (
+        not settings.SQLITE_WRITE_QUEUE
+        or connection.vendor != 'sqlite'
+        or connection.in_atomic_block
+        or _writer.in_writer_thread()
+    ):
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    return _writer.submit(func, *args, **kwargs).result()
+
+
+def queued_write(method):
+    """Decorator running a viewset's ``perform_*`` method through ``run_write``"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        return run_write(method, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,121 @@
+"""
+Everything the canvas needs to open a board, in one response.
+
+Opening a board used to take a CSRF request, the board itself, the
+caller's view settings and their custom colors, one after the other. The
+bootstrap endpoint returns all of them together, plus the caller's role
+and a WebSocket resume token:
+
+    {"role": ..., "csrftoken": ..., "resume_token": ..., "view_settings": {...},
+     "custom_colors": [...], "whiteboard": {... as GET /api/whiteboards/<id>/ ...}}
+
+The board comes from the viewset's prefetched queryset, which also holds
+the access rights the role is read from. The JSON is streamed: the small
+parts first, then the notes and strokes in chunks as they are serialized.
+
+The resume token is signed and carries the board's operation log
+position. Passed as ``?resume=`` when the socket connects, it lets the
+consumer tell the client to reload (a ``resync`` message) if the board
+changed in between. It does not vouch for the role: that is looked up
+again on every connect, so revoked access takes effect right away.
+"""
+import json
+
+from django.core import signing
+from django.db.models import Max
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import BoardOperation
+from .serializers import (
+    WhiteboardSummarySerializer, StickyNoteSerializer, DrawingSerializer, NoteGroupSerializer,
+    WhiteboardAccessSerializer, CustomColorSerializer,
+)
+from .compaction import serialize_stroke
+
+RESUME_SALT = 'whiteboard.resume'
+CHUNK_SIZE = 500
+
+
+def board_role(whiteboard, user):
+    """The user's role from a board with prefetched ``access_rights``, or None"""
+    if whiteboard.owner_id == user.id:
+        return 'owner'
+    for access in whiteboard.access_rights.all():
+        if access.user_id == user.id:
+            return access.role
+    return None
+
+
+def operation_seq(whiteboard_id):
+    """Id of the board's latest logged operation (0 if none)"""
+    return BoardOperation.objects.filter(whiteboard_id=whiteboard_id).aggregate(seq=Max('id'))['seq'] or 0
+
+
+def resume_token(whiteboard_id, user_id, seq):
+    return signing.dumps({'w': whiteboard_id, 'u': user_id, 's': seq}, salt=RESUME_SALT)
+
+
+def read_resume_token(token, whiteboard_id, user_id):
+    """The log position of a token issued for this board and user, or None"""
+    try:
+        data = signing.loads(token, salt=RESUME_SALT)
+    except signing.BadSignature:
+        return None
+    if data.get('w') != whiteboard_id or data.get('u') != user_id:
+        return None
+    return data.get('s', 0)
+
+
+def _dumps(value):
+    return json.dumps(value, cls=JSONEncoder)
+
+
+def _json_array(chunks):
+    """Stream a JSON array from an iterable of lists of items"""
+    yield '['
+    first = True
+    for items in chunks:
+        if items:
+            yield ('' if first else ',') + _dumps(items)[1:-1]
+            first = False
+    yield ']'
+
+
+def _serialized_chunks(serializer_class, objects, context):
+    objects = list(objects)
+    for start in range(0, len(objects), CHUNK_SIZE):
+        yield serializer_class(objects[start:start + CHUNK_SIZE], many=True, context=context).data
+
+
+def _stroke_chunks(whiteboard, context):
+    # Compacted strokes first, then the live ones, as WhiteboardSerializer does
+    for layer in whiteboard.drawing_layers.all():
+        yield [serialize_stroke(stroke, whiteboard.id) for stroke in layer.strokes]
+    yield from _serialized_chunks(DrawingSerializer, whiteboard.drawings.all(), context)
+
+
+def bootstrap_head(whiteboard, user, role, csrftoken, view_settings, custom_colors):
+    """The small parts of the bootstrap response"""
+    return {
+        'role': role,
+        'csrftoken': csrftoken,
+        'resume_token': resume_token(whiteboard.id, user.id, operation_seq(whiteboard.id)),
+        'view_settings': view_settings,
+        'custom_colors': CustomColorSerializer(custom_colors, many=True).data,
+    }
+
+
+def iter_bootstrap(whiteboard, head, context):
+    """Yield the bootstrap JSON of a prefetched board in pieces"""
+    yield _dumps(head)[:-1] + ', "whiteboard": '
+    # The rest of the board, then its contents in chunks
+    yield _dumps(WhiteboardSummarySerializer(whiteboard, context=context).data)[:-1]
+    yield ', "sticky_notes": '
+    yield from _json_array(_serialized_chunks(StickyNoteSerializer, whiteboard.sticky_notes.all(), context))
+    yield ', "drawings": '
+    yield from _json_array(_stroke_chunks(whiteboard, context))
+    yield ', "note_groups": '
+    yield from _json_array(_serialized_chunks(NoteGroupSerializer, whiteboard.note_groups.all(), context))
+    yield ', "access_rights": '
+    yield from _json_array(_serialized_chunks(WhiteboardAccessSerializer, whiteboard.access_rights.all(), context))
+    yield '}}'
@@ -0,0 +1,230 @@
+"""
+Compaction of old drawing strokes into per-board layers.
+
+Every stroke starts life as its own ``Drawing`` row. Once strokes are older
+than ``settings.DRAWING_COMPACT_AFTER_SECONDS`` a background job moves them,
+oldest first, into ``DrawingLayer`` rows holding up to
+``settings.DRAWING_LAYER_MAX_STROKES`` strokes each. Loading a heavily drawn
+board then reads a handful of layers plus the few recent strokes.
+
+Compacted strokes keep their ``Drawing`` id, so the drawings API can still
+retrieve, delete and update them individually. Editing one moves it back
+into its own row with a fresh ``created_at``; it is compacted again once
+that is old enough, into a later layer than its id would suggest.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .background import Debouncer
+from .models import Drawing, DrawingLayer
+
+STROKE_FIELDS = ['id', 'path_data', 'color', 'stroke_width', 'created_by', 'created_by__username', 'created_at']
+
+
+def _stroke_from_values(values):
+    return {
+        'id': values['id'],
+        'path_data': values['path_data'],
+        'color': values['color'],
+        'stroke_width': values['stroke_width'],
+        'created_by': values['created_by'],
+        'created_by_username': values['created_by__username'],
+        'created_at': values['created_at'].isoformat(),
+    }
+
+
+def _stroke_bounds(stroke):
+    from .previews import parse_path_data
+
+    points = parse_path_data(stroke['path_data'])
+    if not points:
+        return None
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _add_to_layer(layer, strokes):
+    for stroke in strokes:
+        bounds = _stroke_bounds(stroke)
+        if bounds:
+            if layer.stroke_count == 0 and not layer.strokes:
+                layer.min_x, layer.min_y, layer.max_x, layer.max_y = bounds
+            else:
+                layer.min_x = min(layer.min_x, bounds[0])
+                layer.min_y = min(layer.min_y, bounds[1])
+                layer.max_x = max(layer.max_x, bounds[2])
+                layer.max_y = max(layer.max_y, bounds[3])
+        layer.strokes.append(stroke)
+        layer.stroke_count = len(layer.strokes)
+    ids = [stroke['id'] for stroke in layer.strokes]
+    layer.first_stroke_id = min(ids)
+    layer.last_stroke_id = max(ids)
+
+
+def compact_board(whiteboard_id, max_strokes=None):
+    """Move a board's old strokes into layers; returns the number of strokes compacted"""
+    max_strokes = max_strokes or settings.DRAWING_COMPACT_BATCH
+    layer_size = settings.DRAWING_LAYER_MAX_STROKES
+    cutoff = timezone.now() - timedelta(seconds=settings.DRAWING_COMPACT_AFTER_SECONDS)
+
+    with transaction.atomic():
+        # Lowest ids first; a restored stroke can be fresh among old ones,
+        # so fresh strokes are skipped rather than ending the batch
+        rows = (
+            Drawing.objects.filter(whiteboard_id=whiteboard_id, created_at__lt=cutoff)
+            .order_by('id')
+            .values(*STROKE_FIELDS)[:max_strokes]
+        )
+        strokes = [_stroke_from_values(values) for values in rows]
+        if len(strokes) < settings.DRAWING_COMPACT_MIN_STROKES:
+            return 0
+
+        layer = (
+            DrawingLayer.objects.select_for_update()
+            .filter(whiteboard_id=whiteboard_id)
+            .order_by('-first_stroke_id')
+            .first()
+        )
+        remaining = strokes
+        while remaining:
+            if layer is None or layer.stroke_count >= layer_size:
+                layer = DrawingLayer(whiteboard_id=whiteboard_id, strokes=[])
+            room = layer_size - layer.stroke_count
+            _add_to_layer(layer, remaining[:room])
+            layer.save()
+            remaining = remaining[room:]
+
+        # The strokes now live in layers; skip per-row delete signals since
+        # nothing visible changed
+        Drawing.objects.filter(id__in=[stroke['id'] for stroke in strokes])._raw_delete(Drawing.objects.db)
+    return len(strokes)
+
+
+def iter_strokes(whiteboard, chunk_size=1000, area=None):
+    """Yield every stroke of a board (compacted and live) as a stroke dict
+
+    With ``area`` (min_x, min_y, max_x, max_y), layers lying entirely
+    outside it are skipped; live strokes are always included.
+    """
+    layers = DrawingLayer.objects.filter(whiteboard=whiteboard)
+    if area is not None:
+        layers = layers.filter(min_x__lte=area[2], max_x__gte=area[0], min_y__lte=area[3], max_y__gte=area[1])
+    for layer in layers.iterator(chunk_size=16):
+        yield from layer.strokes
+    rows = Drawing.objects.filter(whiteboard=whiteboard).order_by('id').values(*STROKE_FIELDS)
+    for values in rows.iterator(chunk_size=chunk_size):
+        yield _stroke_from_values(values)
+
+
+def serialize_stroke(stroke, whiteboard_id):
+    """Render a compacted stroke like DrawingSerializer does"""
+    return {
+        'id': stroke['id'],
+        'whiteboard': whiteboard_id,
+        'path_data': stroke['path_data'],
+        'color': stroke['color'],
+        'stroke_width': stroke['stroke_width'],
+        'created_by': {'id': stroke['created_by'], 'username': stroke['created_by_username']},
+        'created_at': stroke['created_at'],
+    }
+
+
+def compacted_strokes_data(whiteboard):
+    return [
+        serialize_stroke(stroke, whiteboard.id)
+        for layer in whiteboard.drawing_layers.all()
+        for stroke in layer.strokes
+    ]
+
+
+def find_compacted_stroke(layers, stroke_id):
+    """Return ``(layer, stroke)`` for a compacted stroke id, or ``(None, None)``"""
+    candidates = layers.filter(first_stroke_id__lte=stroke_id, last_stroke_id__gte=stroke_id)
+    for layer in candidates:
+        for stroke in layer.strokes:
+            if stroke['id'] == stroke_id:
+                return layer, stroke
+    return None, None
+
+
+def remove_compacted_stroke(layer, stroke_id):
+    """Drop one stroke from a layer, deleting the layer when it becomes empty"""
+    layer.strokes = [stroke for stroke in layer.strokes if stroke['id'] != stroke_id]
+    if not layer.strokes:
+        layer.delete()
+        return
+    layer.stroke_count = len(layer.strokes)
+    ids = [stroke['id'] for stroke in layer.strokes]
+    layer.first_stroke_id = min(ids)
+    layer.last_stroke_id = max(ids)
+    layer.save(update_fields=['strokes', 'stroke_count', 'first_stroke_id', 'last_stroke_id', 'updated_at'])
+
+
+def restore_stroke(layer, stroke):
+    """Move a compacted stroke back into its own Drawing row (same id) for editing
+
+    Concurrent requests for the same stroke all get the one restored row;
+    returns None if the stroke was deleted meanwhile.
+    """
+    try:
+        with transaction.atomic():
+            layer = DrawingLayer.objects.select_for_update().filter(id=layer.id).first()
+            if layer is None or not any(s['id'] == stroke['id'] for s in layer.strokes):
+                # Restored (or deleted) by another request since we looked it up
+                return Drawing.objects.filter(id=stroke['id']).first()
+            remove_compacted_stroke(layer, stroke['id'])
+            drawing = Drawing(
+                id=stroke['id'],
+                whiteboard_id=layer.whiteboard_id,
+                path_data=stroke['path_data'],
+                color=stroke['color'],
+                stroke_width=stroke['stroke_width'],
+                created_by_id=stroke['created_by'],
+            )
+            drawing.save(force_insert=True)
+    except IntegrityError:
+        # Another request inserted the row between our read and our insert
+        return Drawing.objects.filter(id=stroke['id']).first()
+    return drawing
+
+
+def layers_for_user(user):
+    from .models import Whiteboard
+
+    accessible_whiteboards = Whiteboard.objects.filter(Q(owner=user) | Q(access_rights__user=user)).values('id')
+    return DrawingLayer.objects.filter(whiteboard__in=accessible_whiteboards)
+
+
+def compact_board_fully(whiteboard_id):
+    """Compact in bounded batches until nothing old enough is left
+
+    Strokes skipped for being too fresh get one follow-up run, once the
+    newest of them is old enough, so a session's last strokes don't wait
+    for the board's next activity.
+    """
+    total = 0
+    while True:
+        compacted = compact_board(whiteboard_id)
+        total += compacted
+        if compacted < settings.DRAWING_COMPACT_BATCH:
+            break
+
+    left = Drawing.objects.filter(whiteboard_id=whiteboard_id).aggregate(count=Count('id'), newest=Max('created_at'))
+    if left['count'] >= settings.DRAWING_COMPACT_MIN_STROKES:
+        ready_at = left['newest'] + timedelta(seconds=settings.DRAWING_COMPACT_AFTER_SECONDS)
+        schedule_compaction(whiteboard_id, delay=max((ready_at - timezone.now()).total_seconds(), 0) + 1)
+    return total
+
+
+_debouncer = Debouncer(compact_board_fully, lambda: settings.DRAWING_COMPACT_DEBOUNCE_SECONDS, name='Drawing compaction')
+
+
+def schedule_compaction(whiteboard_id, delay=None):
+    """Compact a board's old strokes in the background once things quiet down"""
+    if settings.DRAWING_COMPACTION_ENABLED:
+        _debouncer.schedule(whiteboard_id, delay=delay)
@@ -1,11 +1,28 @@
+import asyncio
 import json
+import time
+import uuid
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from .bootstrap import operation_seq, read_resume_token, resume_token
 from .models import Whiteboard, WhiteboardAccess
+from .metrics import FANOUT_SECONDS, WS_CONNECTIONS, WS_MESSAGES, WS_VIEWPORT_FILTERED, sample_channel_layer
+from .rooms import OpRejected, rooms
+from .viewports import EPHEMERAL_TYPES, HeldMessages, intersects, message_bounds, parse_viewport
 
 
 class WhiteboardConsumer(AsyncWebsocketConsumer):
+    connected = False
+    # The board's in-memory state when settings.ROOM_STATE is on
+    room = None
+    # The board rectangle the client shows, once it registered one
+    viewport = None
+    _held_task = None
+    
     async def connect(self):
+        self.held = HeldMessages()
         self.whiteboard_id = self.scope['url_route']['kwargs']['whiteboard_id']
         self.room_group_name = f'whiteboard_{self.whiteboard_id}'
         
@@ -16,6 +33,17 @@ class WhiteboardConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
+        # Clients that loaded the board through the bootstrap endpoint pass its resume token
+        resume = self.read_resume()
+        use_room = settings.ROOM_STATE and self.whiteboard_id.isdigit()
+        if use_room:
+            # Looked up on every connect, so revoked access takes effect right away
+            self.role = await self.get_role()
+            if self.role is None:
+                # The room hands every socket the whole board on connect
+                await self.close()
+                return
+        
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -23,8 +51,26 @@ class WhiteboardConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        self.connected = True
+        WS_CONNECTIONS.inc()
+        
+        if use_room:
+            self.room = await rooms.join(int(self.whiteboard_id))
+            if self.room is not None:
+                await self.send(text_data=self.room.snapshot())
+        if resume is not None and self.room is None:
+            await self.resync_if_behind(resume)
     
     async def disconnect(self, close_code):
+        if self.connected:
+            WS_CONNECTIONS.dec()
+            self.connected = False
+        if self._held_task is not None:
+            self._held_task.cancel()
+            self._held_task = None
+        if self.room is not None:
+            room, self.room = self.room, None
+            await rooms.leave(room)
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -33,21 +79,116 @@ class WhiteboardConsumer(AsyncWebsocketConsumer):
     
     async def receive(self, text_data):
         data = json.loads(text_data)
+        WS_MESSAGES.labels('in').inc()
+        if isinstance(data, dict) and data.get('type') == 'viewport':
+            await self.set_viewport(data)
+            return
+        event = {
+            'type': 'whiteboard_message',
+            'message': data,
+            # Wall clock, so fan-out latency is measurable across processes
+            'sent_at': time.time(),
+        }
+        
+        if self.room is not None:
+            # Peers get the op as applied; the id keeps every process from
+            # applying it twice
+            event['op_id'] = uuid.uuid4().hex
+            try:
+                event['message'] = await self.room.apply(data, self.scope.get('user'), self.role, event['op_id'])
+            except OpRejected as exc:
+                await self.send(text_data=json.dumps({'type': 'error', 'detail': str(exc), 'op': data}))
+                if exc.resync is not None:
+                    await self.send(text_data=json.dumps(exc.resync))
+                return
+        
+        # Computed once here rather than by every receiving consumer
+        event['bounds'] = message_bounds(event['message'], self.room)
         
         # Broadcast the message to the room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'whiteboard_message',
-                'message': data
-            }
-        )
+        await self.channel_layer.group_send(self.room_group_name, event)
     
     async def whiteboard_message(self, event):
         message = event['message']
+        if self.room is not None and 'op_id' in event:
+            await self.room.apply_remote(message, event['op_id'])
+        
+        bounds = event.get('bounds')
+        if self.viewport is not None and bounds is not None and not intersects(bounds, self.viewport):
+            if message.get('type') in EPHEMERAL_TYPES:
+                WS_VIEWPORT_FILTERED.labels('dropped').inc()
+                return
+            WS_VIEWPORT_FILTERED.labels('held').inc()
+            self.held.add(message)
+            if self._held_task is None:
+                self._held_task = asyncio.ensure_future(self.send_held_later())
+            return
         
         # Send message to WebSocket
+        await self.send_held()
         await self.send(text_data=json.dumps(message))
+        WS_MESSAGES.labels('out').inc()
+        if 'sent_at' in event:
+            FANOUT_SECONDS.observe(max(time.time() - event['sent_at'], 0))
+        sample_channel_layer(self.channel_layer)
+    
+    async def notes_reordered(self, event):
+        """Order keys rewritten by a rebalance of the board (see ordering.py)"""
+        if self.room is not None:
+            self.room.set_order_keys(event['order_keys'])
+        await self.whiteboard_message({'message': {'type': 'notes_reordered', 'order_keys': event['order_keys']}})
+    
+    async def set_viewport(self, data):
+        try:
+            self.viewport = parse_viewport(data)
+        except ValueError as exc:
+            await self.send(text_data=json.dumps({'type': 'error', 'detail': str(exc), 'op': data}))
+            return
+        # Held-back changes may be in view now
+        await self.send_held()
+    
+    async def send_held_later(self):
+        await asyncio.sleep(settings.VIEWPORT_BATCH_SECONDS)
+        self._held_task = None
+        await self.send_held()
+    
+    async def send_held(self):
+        """Send the changes held back for being outside the viewport, as one batch"""
+        if self._held_task is not None:
+            self._held_task.cancel()
+            self._held_task = None
+        messages = self.held.take()
+        if messages:
+            await self.send(text_data=json.dumps({'type': 'batch', 'messages': messages}))
+            WS_MESSAGES.labels('out').inc()
+    
+    def read_resume(self):
+        """The log position in a valid ``?resume=`` token of the bootstrap endpoint, or None"""
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('resume', [None])[0]
+        user = self.scope.get('user')
+        if not token or user is None or not user.is_authenticated or not self.whiteboard_id.isdigit():
+            return None
+        return read_resume_token(token, int(self.whiteboard_id), user.id)
+    
+    async def resync_if_behind(self, seq):
+        """Tell the client to reload if the board changed after its token was issued"""
+        latest = await database_sync_to_async(operation_seq)(int(self.whiteboard_id))
+        if latest > seq:
+            token = resume_token(int(self.whiteboard_id), self.scope['user'].id, latest)
+            await self.send(text_data=json.dumps({'type': 'resync', 'resume_token': token}))
+    
+    @database_sync_to_async
+    def get_role(self):
+        """The user's role on the board ('owner', 'view', 'edit', 'admin') or None"""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return None
+        owner_id = Whiteboard.objects.filter(id=self.whiteboard_id).values_list('owner_id', flat=True).first()
+        if owner_id == user.id:
+            return 'owner'
+        return WhiteboardAccess.objects.filter(
+            whiteboard_id=self.whiteboard_id, user=user
+        ).values_list('role', flat=True).first()
     
     @database_sync_to_async
     def check_whiteboard_access(self):
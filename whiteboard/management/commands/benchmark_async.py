@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+import uuid
+
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from whiteboard.models import Whiteboard, WhiteboardAccess, StickyNote, Drawing
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/s and latency of the sync DRF endpoints with their async '
+        '/api/live/ versions, driving the ASGI application in-process with concurrent '
+        'requests. Uses a scratch board and users that are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--notes', type=int, default=100, help='Notes on the scratch board')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:12]
+        user = User.objects.create_user(username=f'benchmark-{suffix}')
+        for i in range(20):
+            User.objects.create_user(username=f'benchmark-peer{i}-{suffix}')
+        whiteboard = Whiteboard.objects.create(name='Async benchmark', owner=user)
+        StickyNote.objects.bulk_create([
+            StickyNote(whiteboard=whiteboard, content=f'Note {i}', x=i * 10, order_key=f'a{i:04d}', created_by=user)
+            for i in range(options['notes'])
+        ])
+        Drawing.objects.bulk_create([
+            Drawing(whiteboard=whiteboard, path_data=f'M {i},0 L {i},10', created_by=user)
+            for i in range(options['notes'])
+        ])
+        note = StickyNote.objects.filter(whiteboard=whiteboard).first()
+
+        client = Client()
+        client.force_login(user)
+        csrf = get_random_string(32)
+        self.headers = [
+            (b'host', b'localhost'),
+            (b'cookie', f'sessionid={client.cookies["sessionid"].value}; csrftoken={csrf}'.encode()),
+            (b'x-csrftoken', csrf.encode()),
+            (b'content-type', b'application/json'),
+        ]
+
+        board, query = whiteboard.id, 'benchmark-peer'
+        pairs = [
+            ('board snapshot', ('GET', f'/api/whiteboards/{board}/', ''), ('GET', f'/api/live/whiteboards/{board}/', '')),
+            ('note move', ('PATCH', f'/api/sticky-notes/{note.id}/', ''), ('PATCH', f'/api/live/sticky-notes/{note.id}/', '')),
+            ('view settings read', ('GET', '/api/view-settings/for_whiteboard/', f'whiteboard_id={board}'),
+             ('GET', f'/api/live/view-settings/{board}/', '')),
+            ('view settings write', ('POST', '/api/view-settings/for_whiteboard/', ''),
+             ('POST', f'/api/live/view-settings/{board}/', '')),
+            ('user search', ('GET', '/api/users/search/', f'q={query}'), ('GET', '/api/live/users/search/', f'q={query}')),
+        ]
+        bodies = {
+            'PATCH': lambda i: {'x': i, 'y': i},
+            'POST': lambda i: {'whiteboard': board, 'zoom': 1 + i % 3, 'pan_x': i, 'pan_y': -i},
+            'GET': lambda i: None,
+        }
+
+        try:
+            self.stdout.write(f"{'endpoint':<22}{'mode':<7}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+            for name, sync, live in pairs:
+                for mode, (method, path, query_string) in (('sync', sync), ('async', live)):
+                    rps, p50, p99, errors = asyncio.run(self._load(
+                        method, path, query_string, bodies[method], options['requests'], options['concurrency']
+                    ))
+                    self.stdout.write(f'{name:<22}{mode:<7}{rps:>9.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}')
+        finally:
+            WhiteboardAccess.objects.filter(whiteboard=whiteboard).delete()
+            whiteboard.delete()
+            User.objects.filter(username__endswith=suffix, username__startswith='benchmark-').delete()
+
+    async def _request(self, app, method, path, query_string, body):
+        payload = json.dumps(body).encode() if body is not None else b''
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': self.headers + [(b'content-length', str(len(payload)).encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        communicator = ApplicationCommunicator(app, scope)
+        await communicator.send_input({'type': 'http.request', 'body': payload, 'more_body': False})
+        start = await communicator.receive_output(timeout=60)
+        while True:
+            message = await communicator.receive_output(timeout=60)
+            if not message.get('more_body'):
+                break
+        await communicator.wait(timeout=60)
+        return start['status']
+
+    async def _load(self, method, path, query_string, body, total, concurrency):
+        app = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                status = await self._request(app, method, path, query_string, body(i))
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+
+        # Warm up connections and caches outside of the measurement
+        await asyncio.gather(*(one(i) for i in range(min(concurrency, total))))
+        latencies.clear()
+        errors = 0
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+        return total / elapsed, p50, p99, errors
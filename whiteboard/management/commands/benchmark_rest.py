@@ -0,0 +1,197 @@
+import io
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from PIL import Image
+
+from whiteboard.models import Whiteboard, NoteGroup, StickyNote, StickyNoteImage, Drawing
+
+SCENARIOS = ['board_retrieve', 'board_list', 'bulk_move', 'note_create', 'image_add', 'user_search']
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the main REST paths against a generated dataset (see generate_dataset) and '
+        'write the timings, query counts and memory use to JSON, optionally comparing '
+        'them with an earlier run. Requests go through the full middleware stack in-process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='dataset', help='Prefix the dataset was generated with')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per scenario')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(username=f"{options['prefix']}-owner").first()
+        whiteboard = Whiteboard.objects.filter(owner=owner).order_by('id').first() if owner else None
+        if whiteboard is None:
+            raise CommandError(f"No dataset \"{options['prefix']}\"; run manage.py generate_dataset first")
+
+        self.client = Client()
+        self.client.force_login(owner)
+        self.whiteboard = whiteboard
+        self.prefix = options['prefix']
+        self.group = NoteGroup.objects.filter(whiteboard=whiteboard).order_by('id').first()
+        self.note = StickyNote.objects.filter(whiteboard=whiteboard).order_by('id').first()
+        self.image = self._png()
+        self.created_notes = []
+        self.created_images = []
+
+        results = {}
+        try:
+            self.stdout.write(
+                f"{'scenario':<16}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'queries':>9}{'peak KiB':>10}{'errors':>8}"
+            )
+            for name in options['scenarios']:
+                results[name] = self._run(name, options['iterations'], options['warmup'])
+                result = results[name]
+                self.stdout.write(
+                    f"{name:<16}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['mean_ms']:>9.1f}"
+                    f"{result['queries']:>9}{result['peak_memory_kib']:>10}{result['errors']:>8}"
+                )
+        finally:
+            self._cleanup()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'git_commit': self._git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'prefix': self.prefix,
+                'board': whiteboard.id,
+                'notes': StickyNote.objects.filter(whiteboard=whiteboard).count(),
+                'strokes': Drawing.objects.filter(whiteboard=whiteboard).count(),
+                'images': StickyNoteImage.objects.filter(sticky_note__whiteboard=whiteboard).count(),
+                'collaborators': whiteboard.access_rights.count(),
+            },
+            'iterations': options['iterations'],
+            'results': results,
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 120, 40)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def _request(self, name, i):
+        board = self.whiteboard.id
+        if name == 'board_retrieve':
+            return self.client.get(f'/api/whiteboards/{board}/')
+        if name == 'board_list':
+            return self.client.get('/api/whiteboards/')
+        if name == 'bulk_move':
+            # Moving a group moves all its notes with one row write
+            return self.client.patch(
+                f'/api/note-groups/{self.group.id}/', {'offset_x': 100 + i, 'offset_y': 200 + i},
+                content_type='application/json',
+            )
+        if name == 'note_create':
+            response = self.client.post(
+                '/api/sticky-notes/', {'whiteboard': board, 'content': f'Benchmark note {i}', 'x': i, 'y': i},
+                content_type='application/json',
+            )
+            if response.status_code == 201:
+                self.created_notes.append(response.json()['id'])
+            return response
+        if name == 'image_add':
+            upload = io.BytesIO(self.image)
+            upload.name = f'benchmark-{i}.png'
+            response = self.client.post(f'/api/sticky-notes/{self.note.id}/add_image/', {'image': upload})
+            if response.status_code == 201:
+                self.created_images.append(response.json()['id'])
+            return response
+        if name == 'user_search':
+            return self.client.get('/api/users/search/', {'q': f'{self.prefix}-00'})
+        raise CommandError(f'Unknown scenario {name}')
+
+    def _run(self, name, iterations, warmup):
+        if (name == 'bulk_move' and self.group is None) or (name == 'image_add' and self.note is None):
+            raise CommandError(f'The dataset has nothing to run {name} on')
+        for i in range(warmup):
+            self._request(name, i)
+
+        timings = []
+        queries = []
+        errors = 0
+        for i in range(iterations):
+            started = time.perf_counter()
+            response = self._request(name, i)
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(response.profile.queries)
+            if response.status_code >= 400:
+                errors += 1
+
+        # Separate pass: tracing allocations slows the request down severalfold
+        tracemalloc.start()
+        try:
+            self._request(name, iterations)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'min_ms': round(timings[0], 2),
+            'max_ms': round(timings[-1], 2),
+            'queries': max(queries),
+            'peak_memory_kib': peak // 1024,
+            'errors': errors,
+        }
+
+    def _cleanup(self):
+        for image in StickyNoteImage.objects.filter(id__in=self.created_images):
+            image.image.delete(save=False)
+            image.delete()
+        StickyNote.objects.filter(id__in=self.created_notes).delete()
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+        self.stdout.write(f"Compared with {path} (commit {previous.get('git_commit') or 'unknown'}):")
+        for name, result in results.items():
+            before = previous['results'].get(name)
+            if before is None:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            line = (
+                f"{name:<16}p50 {before['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms ({change:+.0f}%), "
+                f"queries {before['queries']} -> {result['queries']}, "
+                f"peak {before['peak_memory_kib']} -> {result['peak_memory_kib']} KiB"
+            )
+            self.stdout.write(self.style.WARNING(line) if change > 10 else line)
@@ -0,0 +1,98 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+# Run in a fresh interpreter: loads the ASGI application and sends it two
+# requests in-process, printing the timings as one JSON line
+CHILD = '''
+import asyncio, json, sys, time
+started = time.perf_counter()
+import backend.asgi
+loaded = time.perf_counter()
+from asgiref.testing import ApplicationCommunicator
+
+async def get(path, cookie):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 1), 'server': ('localhost', 80),
+    }
+    communicator = ApplicationCommunicator(backend.asgi.application, scope)
+    await communicator.send_input({'type': 'http.request', 'body': b''})
+    response = await communicator.receive_output(60)
+    while (await communicator.receive_output(60)).get('more_body'):
+        pass
+    return response['status']
+
+async def main(path, cookie):
+    timings = []
+    for _ in range(2):
+        request_started = time.perf_counter()
+        status = await get(path, cookie)
+        timings.append((status, time.perf_counter() - request_started))
+    return timings
+
+(status, first), (_, second) = asyncio.run(main(sys.argv[1], sys.argv[2]))
+print(json.dumps({'status': status, 'load': loaded - started, 'first': first, 'second': second}), flush=True)
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the cold start of a web process: start fresh interpreters that load '
+        'backend.asgi (including the warm-up) and time their first and second request. '
+        'Uses a scratch user that is deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes to start')
+        parser.add_argument('--path', default='/api/whiteboards/', help='URL of the first request')
+        parser.add_argument('--profile', action='store_true', help='Print the STARTUP_PROFILE report of the last run')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        try:
+            client = Client()
+            client.force_login(user)
+            cookie = f'sessionid={client.cookies["sessionid"].value}'
+            runs = [self._run(options['path'], cookie, options['profile'] and i == options['runs'] - 1)
+                    for i in range(options['runs'])]
+        finally:
+            user.delete()
+
+        def median_ms(key):
+            return statistics.median(run[key] for run in runs) * 1000
+
+        self.stdout.write(f"Cold start, median of {options['runs']} processes ({options['path']} -> {runs[0]['status']}):")
+        self.stdout.write(f"  load backend.asgi      {median_ms('load'):8.1f} ms")
+        self.stdout.write(f"  first request          {median_ms('first'):8.1f} ms")
+        self.stdout.write(f"  second request         {median_ms('second'):8.1f} ms")
+        self.stdout.write(f"  spawn to first response{median_ms('total'):8.1f} ms")
+
+    def _run(self, path, cookie, profile):
+        env = dict(os.environ)
+        if profile:
+            env['STARTUP_PROFILE'] = 'True'
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-c', CHILD, path, cookie], cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        line = process.stdout.readline()
+        total = time.perf_counter() - started
+        _, errors = process.communicate()
+        if process.returncode or not line:
+            raise CommandError(f'The process failed:\n{errors}')
+        if profile:
+            self.stdout.write(errors)
+        return {**json.loads(line), 'total': total}
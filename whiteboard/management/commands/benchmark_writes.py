@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from whiteboard.background import WriteQueue
+from whiteboard.models import Whiteboard, StickyNote
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure sustained write throughput with concurrent writers, writing directly '
+        'and through the batching single-writer queue. Uses a scratch board that is '
+        'deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent writer threads')
+        parser.add_argument('--writes', type=int, default=200, help='Writes per thread')
+        parser.add_argument('--mode', choices=['direct', 'queued', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'SQLite journal_mode={cursor.fetchone()[0]}')
+
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        whiteboard = Whiteboard.objects.create(name='Write benchmark', owner=user)
+        try:
+            modes = ['direct', 'queued'] if options['mode'] == 'both' else [options['mode']]
+            for mode in modes:
+                self._run(mode, whiteboard, user, options['threads'], options['writes'])
+        finally:
+            whiteboard.delete()
+            user.delete()
+
+    def _run(self, mode, whiteboard, user, threads, writes):
+        writer = WriteQueue(name='Benchmark writer') if mode == 'queued' else None
+        notes = StickyNote.objects.bulk_create([
+            StickyNote(whiteboard=whiteboard, content=f'note {i}', order_key=f'a{i}', created_by=user)
+            for i in range(threads)
+        ])
+        errors = []
+        latencies = []
+        lock = threading.Lock()
+
+        def write(note_id, i):
+            # A typical drag: move the note and touch its updated_at
+            note = StickyNote.objects.get(id=note_id)
+            note.x = i
+            note.y = i
+            note.save(update_fields=['x', 'y', 'updated_at'])
+
+        def worker(note_id):
+            local = []
+            try:
+                for i in range(writes):
+                    started = time.perf_counter()
+                    try:
+                        if writer is not None:
+                            writer.submit(write, note_id, i).result()
+                        else:
+                            write(note_id, i)
+                    except OperationalError as exc:
+                        with lock:
+                            errors.append(str(exc))
+                    local.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local)
+
+        workers = [threading.Thread(target=worker, args=[note.id]) for note in notes]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        total = threads * writes
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+        self.stdout.write(
+            f'{mode:>6}: {total} writes from {threads} threads in {elapsed:.2f}s '
+            f'= {total / elapsed:.0f} writes/s, p50 {p50:.1f}ms, p99 {p99:.1f}ms, '
+            f'{len(errors)} lock errors'
+        )
+        StickyNote.objects.filter(id__in=[note.id for note in notes]).delete()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from whiteboard.compaction import compact_board_fully
+from whiteboard.models import Drawing
+
+
+class Command(BaseCommand):
+    help = 'Compact old drawing strokes into per-board layers (safe to run repeatedly, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--whiteboard', type=int, help='Only compact this whiteboard')
+
+    def handle(self, *args, **options):
+        if options['whiteboard']:
+            whiteboard_ids = [options['whiteboard']]
+        else:
+            whiteboard_ids = Drawing.objects.values_list('whiteboard_id', flat=True).distinct()
+
+        total = 0
+        for whiteboard_id in whiteboard_ids:
+            compacted = compact_board_fully(whiteboard_id)
+            if compacted:
+                self.stdout.write(f'Whiteboard {whiteboard_id}: compacted {compacted} strokes')
+            total += compacted
+
+        self.stdout.write(self.style.SUCCESS(f'Compacted {total} strokes'))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.models import Whiteboard
+from whiteboard.transfer import iter_export
+
+
+class Command(BaseCommand):
+    help = 'Export a whiteboard with its notes, images, drawings and access rights as a .tar.gz archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('whiteboard_id', type=int)
+        parser.add_argument('-o', '--output', help='Output file (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            whiteboard = Whiteboard.objects.select_related('owner').get(id=options['whiteboard_id'])
+        except Whiteboard.DoesNotExist:
+            raise CommandError(f"Whiteboard {options['whiteboard_id']} does not exist")
+
+        output = options['output']
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in iter_export(whiteboard):
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+
+        if output:
+            self.stdout.write(self.style.SUCCESS(f'Exported whiteboard {whiteboard.id} to {output}'))
@@ -0,0 +1,197 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image
+
+from whiteboard.models import (
+    Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, WhiteboardViewSettings,
+)
+from whiteboard.ordering import evenly_spaced_keys
+from whiteboard.purge import purge_board
+
+WORDS = (
+    'roadmap launch backlog sprint retro customer feedback idea risk budget design review api latency '
+    'release onboarding metrics growth pricing churn interview persona journey bug fix refactor cache '
+    'database migration deadline owner blocker question decision experiment hypothesis survey workshop '
+    'kanban milestone dependency security audit docs support ticket escalation mobile web desktop'
+).split()
+COLORS = [color for color, _ in StickyNote.COLOR_CHOICES]
+STROKE_COLORS = ['black', '#e53935', '#1e88e5', '#43a047', '#fdd835', '#8e24aa']
+ROLES = ['view'] * 5 + ['edit'] * 4 + ['admin']
+BOARD_SIZE = 20000
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate large synthetic whiteboards (notes, groups, strokes, images, collaborators) '
+        'for benchmarking. The same seed always produces the same content. Users are named '
+        '"<prefix>-owner" and "<prefix>-NNNNN", boards "<prefix> board N".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='dataset', help='Name prefix of the generated users and boards')
+        parser.add_argument('--boards', type=int, default=1)
+        parser.add_argument('--notes', type=int, default=10000, help='Notes per board')
+        parser.add_argument('--groups', type=int, default=100, help='Note groups per board (20 notes each)')
+        parser.add_argument('--strokes', type=int, default=100000, help='Drawing strokes per board')
+        parser.add_argument('--images', type=int, default=2000, help='Note images per board')
+        parser.add_argument('--image-files', type=int, default=20, help='Distinct image files the images share')
+        parser.add_argument('--collaborators', type=int, default=300, help='Users with access to every board')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_create')
+        parser.add_argument('--replace', action='store_true', help='Delete an existing dataset with this prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username=f'{prefix}-owner').exists():
+            if not options['replace']:
+                raise CommandError(f'Dataset "{prefix}" exists; use --replace to regenerate it')
+            self._delete(prefix)
+
+        self.batch_size = options['batch_size']
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        owner, collaborators = self._users(prefix, options['collaborators'])
+        image_names = self._image_files(prefix, options['image_files'], rng)
+        for index in range(options['boards']):
+            # One generator per board, so boards don't depend on each other's sizes
+            board_rng = random.Random(f"{options['seed']}-{index}")
+            whiteboard = Whiteboard.objects.create(name=f'{prefix} board {index + 1}', owner=owner)
+            self._board(whiteboard, board_rng, owner, collaborators, image_names, options)
+            self.stdout.write(f'Board {whiteboard.id}: "{whiteboard.name}"')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset "{prefix}" in {time.perf_counter() - started:.1f}s'))
+
+    def _delete(self, prefix):
+        boards = Whiteboard.all_objects.filter(owner__username=f'{prefix}-owner')
+        board_ids = list(boards.values_list('id', flat=True))
+        # Purged right here rather than by the background job soft_delete() schedules
+        boards.update(deleted_at=timezone.now())
+        for whiteboard_id in board_ids:
+            purge_board(whiteboard_id)
+        User.objects.filter(username__startswith=f'{prefix}-').delete()
+        self.stdout.write(f'Deleted dataset "{prefix}"')
+
+    def _step(self, label, func, *args):
+        started = time.perf_counter()
+        count = func(*args)
+        self.stdout.write(f'  {label}: {count} in {time.perf_counter() - started:.1f}s')
+
+    def _users(self, prefix, count):
+        # Unusable passwords: hashing real ones would dominate the run time
+        password = make_password(None)
+        owner = User.objects.create(username=f'{prefix}-owner', email=f'{prefix}-owner@example.com', password=password)
+        User.objects.bulk_create([
+            User(username=f'{prefix}-{i:05d}', email=f'{prefix}-{i:05d}@example.com', password=password)
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        collaborators = list(User.objects.filter(username__startswith=f'{prefix}-').exclude(id=owner.id).order_by('username'))
+        self.stdout.write(f'  users: {count + 1}')
+        return owner, collaborators
+
+    def _image_files(self, prefix, count, rng):
+        names = []
+        for i in range(count):
+            image = Image.new('RGB', (64, 48), tuple(rng.randrange(256) for _ in range(3)))
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+            name = f'sticky_notes/{prefix}-{i}.png'
+            # Overwrite rather than let the storage pick another name, so reruns match
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            names.append(default_storage.save(name, ContentFile(buffer.getvalue())))
+        return names
+
+    def _board(self, whiteboard, rng, owner, collaborators, image_names, options):
+        editors = [owner]
+        access = []
+        for user in collaborators:
+            role = rng.choice(ROLES)
+            access.append(WhiteboardAccess(whiteboard=whiteboard, user=user, role=role))
+            if role != 'view':
+                editors.append(user)
+        self._step('access rights', self._bulk, WhiteboardAccess, access)
+        self._step('notes', self._notes, whiteboard, rng, editors, options['notes'], options['groups'])
+        self._step('images', self._images, whiteboard, rng, image_names, options['images'])
+        self._step('strokes', self._strokes, whiteboard, rng, editors, options['strokes'])
+        self._step('view settings', self._bulk, WhiteboardViewSettings, [
+            WhiteboardViewSettings(
+                user=user, whiteboard=whiteboard, zoom=round(rng.uniform(0.25, 2), 2),
+                pan_x=rng.uniform(-BOARD_SIZE, 0), pan_y=rng.uniform(-BOARD_SIZE, 0),
+            )
+            for user in [owner, *collaborators]
+        ])
+
+    def _bulk(self, model, rows):
+        model.objects.bulk_create(rows, batch_size=self.batch_size)
+        return len(rows)
+
+    def _notes(self, whiteboard, rng, editors, count, group_count):
+        groups = NoteGroup.objects.bulk_create([
+            NoteGroup(
+                whiteboard=whiteboard, created_by=rng.choice(editors),
+                offset_x=rng.uniform(0, BOARD_SIZE), offset_y=rng.uniform(0, BOARD_SIZE),
+            )
+            for _ in range(group_count)
+        ], batch_size=self.batch_size)
+        # The first 20 notes per group are members, positioned relative to it
+        members = {i: groups[i // 20] for i in range(min(count, group_count * 20))}
+
+        notes = []
+        for i, order_key in enumerate(evenly_spaced_keys(count)):
+            group = members.get(i)
+            extent = 600 if group else BOARD_SIZE
+            notes.append(StickyNote(
+                whiteboard=whiteboard,
+                content=' '.join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                link=f'https://example.com/{rng.choice(WORDS)}/{i}' if rng.random() < 0.05 else None,
+                color=rng.choice(COLORS),
+                x=rng.uniform(0, extent),
+                y=rng.uniform(0, extent),
+                width=rng.choice([150, 200, 250]),
+                height=rng.choice([150, 200, 250]),
+                note_group=group,
+                created_by=rng.choice(editors),
+                order_key=order_key,
+            ))
+        return self._bulk(StickyNote, notes)
+
+    def _images(self, whiteboard, rng, image_names, count):
+        note_ids = list(StickyNote.objects.filter(whiteboard=whiteboard).order_by('id').values_list('id', flat=True))
+        if not note_ids or not image_names:
+            return 0
+        return self._bulk(StickyNoteImage, [
+            StickyNoteImage(sticky_note_id=rng.choice(note_ids), image=rng.choice(image_names), order=i)
+            for i in range(count)
+        ])
+
+    def _strokes(self, whiteboard, rng, editors, count):
+        total = 0
+        while total < count:
+            batch = []
+            for _ in range(min(self.batch_size, count - total)):
+                x, y = rng.uniform(0, BOARD_SIZE), rng.uniform(0, BOARD_SIZE)
+                points = [f'M {x:.1f},{y:.1f}']
+                for _ in range(rng.randint(4, 24)):
+                    x += rng.uniform(-15, 15)
+                    y += rng.uniform(-15, 15)
+                    points.append(f'L {x:.1f},{y:.1f}')
+                batch.append(Drawing(
+                    # Plain ids: the relation descriptors are measurable at this volume
+                    whiteboard_id=whiteboard.id,
+                    path_data=' '.join(points),
+                    color=rng.choice(STROKE_COLORS),
+                    stroke_width=rng.choice([1, 2, 2, 3, 5]),
+                    created_by_id=rng.choice(editors).id,
+                ))
+            # Built per batch so 100k strokes never sit in memory at once
+            total += self._bulk(Drawing, batch)
+        return total
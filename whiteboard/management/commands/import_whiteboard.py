@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.transfer import ArchiveError, import_board
+
+
+class Command(BaseCommand):
+    help = 'Import a whiteboard archive created by export_whiteboard as a new whiteboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help='Path to the .tar.gz archive')
+        parser.add_argument('--owner', required=True, help='Username of the new whiteboard owner')
+        parser.add_argument('--name', help='Name for the new whiteboard (defaults to the exported name)')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']} does not exist")
+
+        try:
+            with open(options['archive'], 'rb') as f:
+                whiteboard = import_board(f, owner, name=options['name'])
+        except (OSError, ArchiveError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Imported whiteboard {whiteboard.id} ({whiteboard.name})'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from whiteboard.models import BoardOperation
+from whiteboard.oplog import prune_board, take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot boards and drop operation log entries older than OPLOG_RETENTION_DAYS (e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--whiteboard', type=int, help='Only prune this whiteboard')
+        parser.add_argument('--no-snapshot', action='store_true', help='Only prune what existing snapshots cover')
+
+    def handle(self, *args, **options):
+        if options['whiteboard']:
+            whiteboard_ids = [options['whiteboard']]
+        else:
+            whiteboard_ids = BoardOperation.objects.values_list('whiteboard_id', flat=True).distinct()
+
+        total = 0
+        for whiteboard_id in whiteboard_ids:
+            if not options['no_snapshot']:
+                # Operations are only dropped once a snapshot covers them
+                take_snapshot(whiteboard_id)
+            deleted = prune_board(whiteboard_id)
+            if deleted:
+                self.stdout.write(f'Whiteboard {whiteboard_id}: pruned {deleted} operations')
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'Pruned {total} operations'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from whiteboard.purge import purge_board, purge_deleted_boards
+
+
+class Command(BaseCommand):
+    help = 'Purge the contents of deleted whiteboards in batches, removing their media files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--whiteboard', type=int, help='Only purge this (deleted) whiteboard')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        def report(label, count):
+            self.stdout.write(f'  {label}: {count}')
+
+        if options['whiteboard']:
+            counts = purge_board(options['whiteboard'], batch_size=options['batch_size'], report=report)
+            if not counts:
+                self.stdout.write(self.style.WARNING(f"Whiteboard {options['whiteboard']} is not deleted"))
+                return
+            purged = [options['whiteboard']]
+        else:
+            purged = purge_deleted_boards(batch_size=options['batch_size'], report=report)
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {len(purged)} whiteboards'))
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from whiteboard import tasks
+
+# Seconds between reclaiming tasks of lost workers and deleting old ones
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks (BACKGROUND_TASKS=worker) in a pool of processes. '
+        'Stops after the running tasks finish on SIGTERM or Ctrl-C.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.TASK_WORKER_PROCESSES,
+            help='Pool size; 0 runs tasks in this process',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        previous = {signum: signal.signal(signum, self._stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.stdout.write(f"Worker {self.worker} started with {options['processes'] or 'no'} pool processes")
+
+        try:
+            if options['processes'] == 0:
+                self._run_inline(options['burst'])
+            else:
+                self._run_pool(options['processes'], options['burst'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(f'Worker {self.worker} stopped')
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _housekeeping(self):
+        now = time.monotonic()
+        if now - getattr(self, '_last_housekeeping', float('-inf')) < HOUSEKEEPING_INTERVAL:
+            return
+        self._last_housekeeping = now
+        close_old_connections()
+        reclaimed = tasks.reclaim_stale()
+        if reclaimed:
+            self.stdout.write(self.style.WARNING(f'Reclaimed {reclaimed} tasks of lost workers'))
+        tasks.delete_finished()
+
+    def _report(self, task, outcome, elapsed):
+        line = f'{task.name}{tuple(task.args)} #{task.id}: {outcome} in {elapsed:.2f}s'
+        self.stdout.write(self.style.ERROR(line) if outcome == 'failed' else line)
+
+    def _run_inline(self, burst):
+        while not self.stopping:
+            self._housekeeping()
+            task = tasks.claim_next(self.worker)
+            if task is None:
+                if burst:
+                    return
+                time.sleep(settings.TASK_POLL_SECONDS)
+                continue
+            started = time.monotonic()
+            self._report(task, tasks.run_task(task), time.monotonic() - started)
+
+    def _new_pool(self, processes):
+        # Fresh interpreters rather than forks: nothing of this process's
+        # database connections or threads leaks into the children
+        return ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('spawn'), initializer=tasks.init_process,
+        )
+
+    def _run_pool(self, processes, burst):
+        pool = self._new_pool(processes)
+        running = {}
+        try:
+            while not (self.stopping and not running):
+                self._housekeeping()
+                while not self.stopping and len(running) < processes:
+                    task = tasks.claim_next(self.worker)
+                    if task is None:
+                        break
+                    running[pool.submit(tasks.execute, task.name, task.args)] = (task, time.monotonic())
+                if not running:
+                    if burst:
+                        return
+                    time.sleep(settings.TASK_POLL_SECONDS)
+                    continue
+
+                done, _ = wait(running, timeout=settings.TASK_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    task, started = running.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool as exc:
+                        error = f'Worker process died: {exc}'
+                        broken = True
+                    self._report(task, tasks.complete(task, error), time.monotonic() - started)
+                if broken:
+                    # Every task still in the dead pool failed with it
+                    for task, started in running.values():
+                        self._report(task, tasks.complete(task, 'Worker process died'), time.monotonic() - started)
+                    running.clear()
+                    pool.shutdown(wait=False)
+                    pool = self._new_pool(processes)
+        finally:
+            pool.shutdown(wait=True)
@@ -0,0 +1,234 @@
+"""
+Prometheus metrics, served at ``/metrics``, and per-request profiling.
+
+Gunicorn runs several worker processes, so metrics are kept in
+prometheus_client's multiprocess mode when ``PROMETHEUS_MULTIPROC_DIR`` is
+set (gunicorn.conf.py does that): every process writes its samples to
+memory-mapped files in that directory and the scrape sums them up. Without
+it, ``/metrics`` shows the serving process only, which is right for
+``runserver`` and the tests.
+
+Recording a sample is a dict lookup and an add, so the hot paths only pay
+a few microseconds. Each request's queries, database time and serializer
+time are also collected in a RequestProfile, which the tests use to
+enforce per-endpoint budgets.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+REQUEST_SECONDS = Histogram(
+    'stickytux_http_request_duration_seconds', 'Time to serve a request, by view',
+    ['view', 'method'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter('stickytux_http_requests_total', 'Requests served, by view and status', ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'stickytux_http_request_db_queries', 'Database queries run while serving a request, by view',
+    ['view'], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'stickytux_http_request_db_seconds', 'Time spent in database queries while serving a request, by view',
+    ['view'], buckets=LATENCY_BUCKETS,
+)
+SERIALIZER_SECONDS = Histogram(
+    'stickytux_serializer_duration_seconds', 'Time spent producing serializer data, by serializer',
+    ['serializer'], buckets=FAST_BUCKETS,
+)
+# Not labelled by board: one series per board ever opened would grow without bound
+WS_CONNECTIONS = Gauge(
+    'stickytux_websocket_connections', 'Open WebSocket connections',
+    multiprocess_mode='livesum',
+)
+WS_MESSAGES = Counter(
+    'stickytux_websocket_messages_total', 'WebSocket messages received from (in) and sent to (out) clients',
+    ['direction'],
+)
+WS_VIEWPORT_FILTERED = Counter(
+    'stickytux_websocket_viewport_filtered_total',
+    'Messages outside a client\'s viewport: ephemeral ones dropped, durable ones held for a batch',
+    ['action'],
+)
+FANOUT_SECONDS = Histogram(
+    'stickytux_websocket_fanout_seconds', 'Time from group_send until the message is sent to a client',
+    buckets=FAST_BUCKETS,
+)
+ROOMS_ACTIVE = Gauge(
+    'stickytux_rooms_active', 'Boards held in memory by the room state engine (ROOM_STATE)',
+    multiprocess_mode='livesum',
+)
+ROOM_ROWS_FLUSHED = Counter(
+    'stickytux_room_rows_flushed_total', 'Notes and groups written back to the database by the room state engine',
+)
+STARTUP_SECONDS = Histogram(
+    'stickytux_startup_seconds', 'Time a web process took to load and warm up, by phase (see startup.py)',
+    ['phase'], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CHANNEL_QUEUE_DEPTH = Gauge(
+    'stickytux_channel_layer_queue_depth', 'Messages waiting in the channel layer queues of a process',
+    multiprocess_mode='livesum',
+)
+
+
+class RequestProfile:
+    """Queries, database time and serializer time of one request
+
+    Attached to the response as ``response.profile``; with ``DEBUG`` on it
+    is also sent as a ``Server-Timing`` header for the browser dev tools.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.total_seconds = 0.0
+        self._serializer_depth = 0
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'serializer;dur={self.serializer_seconds * 1000:.1f}, '
+            f'total;dur={self.total_seconds * 1000:.1f}'
+        )
+
+
+# Profile of the request being served; None outside requests
+_request_profile = ContextVar('request_profile', default=None)
+
+
+def _profile_query(execute, sql, params, many, context):
+    profile = _request_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.db_seconds += time.perf_counter() - started
+
+
+def _install_query_profiler(connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+connection_created.connect(_install_query_profiler)
+# Connections opened before this module was imported
+for _connection in connections.all(initialized_only=True):
+    _install_query_profiler(_connection)
+
+
+class MetricsMiddleware:
+    """Profile every request and record its latency, status and database use per view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = _request_profile.set(profile := RequestProfile())
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_profile.reset(token)
+        return self._finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # Context variables follow the request into sync_to_async threads
+        token = _request_profile.set(profile := RequestProfile())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_profile.reset(token)
+        return self._finish(request, response, profile, started)
+
+    def _finish(self, request, response, profile, started):
+        profile.total_seconds = time.perf_counter() - started
+        match = request.resolver_match
+        # URL names keep the label set bounded, unlike raw paths
+        view = (match.view_name or match.route) if match else '<unmatched>'
+        REQUEST_SECONDS.labels(view, request.method).observe(profile.total_seconds)
+        REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+        REQUEST_QUERIES.labels(view).observe(profile.queries)
+        REQUEST_DB_SECONDS.labels(view).observe(profile.db_seconds)
+        response.profile = profile
+        if settings.DEBUG:
+            response['Server-Timing'] = profile.server_timing()
+        return response
+
+
+class SerializerTimer:
+    """Context manager recording the time spent in a serializer
+
+    Serializers used inside another one (e.g. from a SerializerMethodField)
+    get their own histogram samples but are not added to the request's
+    serializer time twice.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = _request_profile.get()
+        if self.profile is not None:
+            self.profile._serializer_depth += 1
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        SERIALIZER_SECONDS.labels(self.name).observe(elapsed)
+        if self.profile is not None:
+            self.profile._serializer_depth -= 1
+            if not self.profile._serializer_depth:
+                self.profile.serializer_seconds += elapsed
+
+
+_last_queue_sample = 0.0
+
+
+def sample_channel_layer(layer):
+    """Update the queue depth gauge, at most once per second per process"""
+    global _last_queue_sample
+    now = time.monotonic()
+    if now - _last_queue_sample < 1:
+        return
+    _last_queue_sample = now
+    # InMemoryChannelLayer keeps its queues in ``channels``; channels_redis
+    # buffers fetched but unconsumed messages in ``receive_buffer``
+    queues = getattr(layer, 'channels', None)
+    if queues is None:
+        queues = getattr(layer, 'receive_buffer', {})
+    CHANNEL_QUEUE_DEPTH.set(sum(queue.qsize() for queue in list(queues.values())))
+
+
+def metrics_view(request):
+    """Prometheus text exposition of all metrics"""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Unauthorized', status=401)
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0005_whiteboardviewsettings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whiteboard",
+            name="preview_version",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="whiteboard",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of whiteboard.ordering's alphabet and evenly_spaced_keys()
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def evenly_spaced_keys(count):
+    if count <= 0:
+        return []
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    keys = []
+    for i in range(1, count + 1):
+        value = i * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
+
+
+def z_index_to_order_key(apps, schema_editor):
+    """Give existing notes order keys that preserve their z_index stacking"""
+    StickyNote = apps.get_model("whiteboard", "StickyNote")
+    whiteboard_ids = StickyNote.objects.values_list("whiteboard_id", flat=True).distinct()
+    for whiteboard_id in list(whiteboard_ids):
+        notes = list(
+            StickyNote.objects.filter(whiteboard_id=whiteboard_id)
+            .order_by("z_index", "id")
+            .only("id")
+        )
+        for note, key in zip(notes, evenly_spaced_keys(len(notes))):
+            note.order_key = key
+        StickyNote.objects.bulk_update(notes, ["order_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0006_whiteboard_version_preview_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stickynote",
+            name="order_key",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.RunPython(z_index_to_order_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="stickynote",
+            index=models.Index(fields=["whiteboard", "order_key"], name="stickynote_board_order_idx"),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0007_stickynote_order_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NoteGroup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("offset_x", models.FloatField(default=0)),
+                ("offset_y", models.FloatField(default=0)),
+                ("scale", models.FloatField(default=1.0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("created_by", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="note_groups", to=settings.AUTH_USER_MODEL)),
+                ("whiteboard", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="note_groups", to="whiteboard.whiteboard")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="stickynote",
+            name="note_group",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name="notes", to="whiteboard.notegroup"),
+        ),
+    ]
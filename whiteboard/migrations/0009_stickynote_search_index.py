@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.db import migrations
+
+# Frozen copy of the note search index DDL; whiteboard.search only queries it
+
+
+def sqlite_has_fts5(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(probe)")
+        cursor.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            if not sqlite_has_fts5(cursor):
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE whiteboard_stickynote_fts USING fts5("
+                "content, link, content='whiteboard_stickynote', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_stickynote_fts_ai AFTER INSERT ON whiteboard_stickynote BEGIN "
+                "INSERT INTO whiteboard_stickynote_fts(rowid, content, link) VALUES (new.id, new.content, new.link); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_stickynote_fts_ad AFTER DELETE ON whiteboard_stickynote BEGIN "
+                "INSERT INTO whiteboard_stickynote_fts(whiteboard_stickynote_fts, rowid, content, link) "
+                "VALUES ('delete', old.id, old.content, old.link); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_stickynote_fts_au AFTER UPDATE OF content, link ON whiteboard_stickynote BEGIN "
+                "INSERT INTO whiteboard_stickynote_fts(whiteboard_stickynote_fts, rowid, content, link) "
+                "VALUES ('delete', old.id, old.content, old.link); "
+                "INSERT INTO whiteboard_stickynote_fts(rowid, content, link) VALUES (new.id, new.content, new.link); END"
+            )
+            cursor.execute("INSERT INTO whiteboard_stickynote_fts(whiteboard_stickynote_fts) VALUES ('rebuild')")
+        elif vendor == "postgresql":
+            # DDL takes no parameters, so the configured name goes in as a quoted literal
+            config = schema_editor.quote_value(settings.SEARCH_CONFIG)
+            cursor.execute(
+                "ALTER TABLE whiteboard_stickynote ADD COLUMN search_vector tsvector "
+                "GENERATED ALWAYS AS ("
+                f"setweight(to_tsvector({config}::regconfig, coalesce(content, '')), 'A') || "
+                "setweight(to_tsvector('simple'::regconfig, coalesce(link, '')), 'B')"
+                ") STORED"
+            )
+            cursor.execute(
+                "CREATE INDEX whiteboard_stickynote_search_idx ON whiteboard_stickynote USING GIN (search_vector)"
+            )
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS whiteboard_stickynote_fts_{suffix}")
+            cursor.execute("DROP TABLE IF EXISTS whiteboard_stickynote_fts")
+        elif vendor == "postgresql":
+            cursor.execute("DROP INDEX IF EXISTS whiteboard_stickynote_search_idx")
+            cursor.execute("ALTER TABLE whiteboard_stickynote DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0008_notegroup"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations
+
+# Frozen copy of the user search index DDL as first shipped; 0018 drops the
+# NOCASE index again
+
+TRGM_INDEXES = {
+    "whiteboard_user_username_trgm": "username",
+    "whiteboard_user_email_trgm": "email",
+}
+
+
+def sqlite_has_fts5(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(probe)")
+        cursor.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            cursor.execute("CREATE INDEX whiteboard_user_username_nocase ON auth_user (username COLLATE NOCASE)")
+            if not sqlite_has_fts5(cursor):
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE whiteboard_user_fts USING fts5("
+                "username, email, content='auth_user', content_rowid='id', tokenize='trigram')"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_user_fts_ai AFTER INSERT ON auth_user BEGIN "
+                "INSERT INTO whiteboard_user_fts(rowid, username, email) VALUES (new.id, new.username, new.email); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_user_fts_ad AFTER DELETE ON auth_user BEGIN "
+                "INSERT INTO whiteboard_user_fts(whiteboard_user_fts, rowid, username, email) "
+                "VALUES ('delete', old.id, old.username, old.email); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER whiteboard_user_fts_au AFTER UPDATE OF username, email ON auth_user BEGIN "
+                "INSERT INTO whiteboard_user_fts(whiteboard_user_fts, rowid, username, email) "
+                "VALUES ('delete', old.id, old.username, old.email); "
+                "INSERT INTO whiteboard_user_fts(rowid, username, email) VALUES (new.id, new.username, new.email); END"
+            )
+            cursor.execute("INSERT INTO whiteboard_user_fts(whiteboard_user_fts) VALUES ('rebuild')")
+        elif vendor == "postgresql":
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            # Django's icontains compiles to UPPER(col) LIKE UPPER(%s), so index that expression
+            for name, column in TRGM_INDEXES.items():
+                cursor.execute(f"CREATE INDEX {name} ON auth_user USING GIN (UPPER({column}) gin_trgm_ops)")
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS whiteboard_user_fts_{suffix}")
+            cursor.execute("DROP TABLE IF EXISTS whiteboard_user_fts")
+            cursor.execute("DROP INDEX IF EXISTS whiteboard_user_username_nocase")
+        elif vendor == "postgresql":
+            for name in TRGM_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0009_stickynote_search_index"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0010_user_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DrawingLayer",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("first_stroke_id", models.BigIntegerField()),
+                ("last_stroke_id", models.BigIntegerField()),
+                ("stroke_count", models.PositiveIntegerField(default=0)),
+                ("strokes", models.JSONField(default=list)),
+                ("min_x", models.FloatField(default=0)),
+                ("min_y", models.FloatField(default=0)),
+                ("max_x", models.FloatField(default=0)),
+                ("max_y", models.FloatField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("whiteboard", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="drawing_layers", to="whiteboard.whiteboard")),
+            ],
+            options={
+                "ordering": ["first_stroke_id"],
+                "indexes": [models.Index(fields=["whiteboard", "first_stroke_id"], name="drawinglayer_board_range_idx")],
+            },
+        ),
+    ]
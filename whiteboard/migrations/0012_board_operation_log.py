@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:11
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0011_drawinglayer"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BoardOperation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("op_type", models.CharField(choices=[("board_updated", "Board updated"), ("note_created", "Note created"), ("note_updated", "Note updated"), ("note_deleted", "Note deleted"), ("drawing_created", "Drawing created"), ("drawing_updated", "Drawing updated"), ("drawing_deleted", "Drawing deleted"), ("group_created", "Group created"), ("group_updated", "Group updated"), ("group_deleted", "Group deleted")], max_length=20)),
+                ("target_id", models.BigIntegerField(blank=True, null=True)),
+                ("payload", models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ("previous", models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("user", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="board_operations", to=settings.AUTH_USER_MODEL)),
+                ("whiteboard", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="operations", to="whiteboard.whiteboard")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["whiteboard", "id"], name="boardop_board_seq_idx"), models.Index(fields=["created_at"], name="boardop_created_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="BoardSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("last_operation_id", models.BigIntegerField(default=0)),
+                ("state", models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("whiteboard", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="snapshots", to="whiteboard.whiteboard")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["whiteboard", "last_operation_id"], name="boardsnapshot_board_seq_idx")],
+            },
+        ),
+    ]
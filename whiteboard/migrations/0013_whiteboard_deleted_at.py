@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0012_board_operation_log"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whiteboard",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
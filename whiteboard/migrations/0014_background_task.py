@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:37
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0013_whiteboard_deleted_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackgroundTask",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=200)),
+                ("args", models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ("priority", models.IntegerField(default=0)),
+                ("status", models.CharField(choices=[("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")], default="pending", max_length=10)),
+                ("dedup_key", models.CharField(max_length=64)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("max_attempts", models.PositiveIntegerField(default=3)),
+                ("run_after", models.DateTimeField()),
+                ("locked_by", models.CharField(blank=True, max_length=100)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "-priority", "run_after"], name="task_queue_idx"), models.Index(fields=["status", "finished_at"], name="task_finished_idx")],
+                "constraints": [models.UniqueConstraint(condition=models.Q(("status", "pending")), fields=("dedup_key",), name="task_pending_dedup")],
+            },
+        ),
+    ]
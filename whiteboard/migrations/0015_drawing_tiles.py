@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0014_background_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whiteboard",
+            name="tiles_seeded",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="DrawingTile",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("level", models.PositiveSmallIntegerField()),
+                ("x", models.IntegerField()),
+                ("y", models.IntegerField()),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("dirty", models.BooleanField(default=True)),
+                ("whiteboard", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="drawing_tiles", to="whiteboard.whiteboard")),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("whiteboard", "level", "x", "y"), name="drawingtile_position")],
+            },
+        ),
+    ]
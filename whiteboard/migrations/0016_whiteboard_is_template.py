@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0015_drawing_tiles"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whiteboard",
+            name="is_template",
+            field=models.BooleanField(default=False),
+        ),
+    ]
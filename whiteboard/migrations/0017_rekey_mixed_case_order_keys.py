@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:10
+
+from django.db import migrations
+
+# Frozen copy of whiteboard.ordering's alphabet and evenly_spaced_keys()
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def evenly_spaced_keys(count):
+    if count <= 0:
+        return []
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    keys = []
+    for i in range(1, count + 1):
+        value = i * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
+
+
+def is_valid_key(key):
+    return bool(key) and key[-1] != DIGITS[0] and all(digit in DIGITS for digit in key)
+
+
+def rekey_boards(apps, schema_editor):
+    """Re-key boards whose notes still have keys from the old mixed-case alphabet"""
+    StickyNote = apps.get_model("whiteboard", "StickyNote")
+    whiteboard_ids = StickyNote.objects.values_list("whiteboard_id", flat=True).distinct()
+    for whiteboard_id in list(whiteboard_ids):
+        rows = list(StickyNote.objects.filter(whiteboard_id=whiteboard_id).values_list("order_key", "id"))
+        if all(is_valid_key(key) for key, _ in rows):
+            continue
+        # Sorted here: the old keys were meant for code point order, not the column's collation
+        rows.sort()
+        notes = [StickyNote(id=note_id) for _, note_id in rows]
+        for note, key in zip(notes, evenly_spaced_keys(len(notes))):
+            note.order_key = key
+        StickyNote.objects.bulk_update(notes, ["order_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0016_whiteboard_is_template"),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_boards, migrations.RunPython.noop),
+    ]
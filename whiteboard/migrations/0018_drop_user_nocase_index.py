@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:40
+
+from django.db import migrations
+
+
+def drop_nocase_index(apps, schema_editor):
+    """Short user searches no longer use the username prefix index"""
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP INDEX IF EXISTS whiteboard_user_username_nocase")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("whiteboard", "0017_rekey_mixed_case_order_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_nocase_index, migrations.RunPython.noop),
+    ]
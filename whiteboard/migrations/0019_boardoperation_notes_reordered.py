@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whiteboard', '0018_drop_user_nocase_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='boardoperation',
+            name='op_type',
+            field=models.CharField(choices=[('board_updated', 'Board updated'), ('note_created', 'Note created'), ('note_updated', 'Note updated'), ('note_deleted', 'Note deleted'), ('drawing_created', 'Drawing created'), ('drawing_updated', 'Drawing updated'), ('drawing_deleted', 'Drawing deleted'), ('group_created', 'Group created'), ('group_updated', 'Group updated'), ('group_deleted', 'Group deleted'), ('notes_reordered', 'Notes reordered')], max_length=20),
+        ),
+    ]
@@ -1,5 +1,15 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Max
 from django.contrib.auth.models import User
+from .ordering import key_between, needs_rebalance, schedule_rebalance
+
+
+class ActiveWhiteboardManager(models.Manager):
+    """Hides whiteboards that are deleted and waiting to be purged"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Whiteboard(models.Model):
@@ -9,9 +19,35 @@ class Whiteboard(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     background_color = models.CharField(max_length=7, default='#ffffff')  # Hex color
+    # Offered as a starting point for new boards (see the duplicate action)
+    is_template = models.BooleanField(default=False)
+    
+    # Bumped whenever the board or anything its preview draws changes
+    version = models.PositiveIntegerField(default=0)
+    # Version the cached preview thumbnail was rendered from (null = never rendered)
+    preview_version = models.PositiveIntegerField(blank=True, null=True)
+    # Whether every stroke has been entered into the drawing tiles (tiles.py)
+    tiles_seeded = models.BooleanField(default=False)
+    # Set when the board is deleted; its contents are purged in the background
+    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    
+    objects = ActiveWhiteboardManager()
+    all_objects = models.Manager()
+    
+    # Only ever changed with queryset.update() (signals.py, previews.py)
+    COUNTER_FIELDS = ('version', 'preview_version')
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        # A stale instance must not write back the counters it was loaded with
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [field for field in update_fields if field not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
 
 
 class WhiteboardAccess(models.Model):
@@ -34,6 +70,34 @@ class WhiteboardAccess(models.Model):
         return f"{self.user.username} - {self.whiteboard.name} ({self.role})"
 
 
+class NoteGroup(models.Model):
+    """A set of sticky notes that moves and scales as one unit
+    
+    Member notes store their position and size relative to the group
+    (absolute = offset + scale * relative), so moving or scaling a whole
+    group only rewrites this row.
+    """
+    whiteboard = models.ForeignKey(Whiteboard, on_delete=models.CASCADE, related_name='note_groups')
+    offset_x = models.FloatField(default=0)
+    offset_y = models.FloatField(default=0)
+    scale = models.FloatField(default=1.0)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='note_groups')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Group on {self.whiteboard.name} at ({self.offset_x}, {self.offset_y})"
+    
+    def to_absolute(self, x, y, width, height):
+        """Convert a member's relative rectangle to board coordinates"""
+        return (
+            self.offset_x + x * self.scale,
+            self.offset_y + y * self.scale,
+            width * self.scale,
+            height * self.scale,
+        )
+
+
 class StickyNote(models.Model):
     """Represents a sticky note on a whiteboard"""
     COLOR_CHOICES = [
@@ -59,15 +123,54 @@ class StickyNote(models.Model):
     
     # Grouping
     group_id = models.CharField(max_length=100, blank=True, null=True)
+    # When set, x/y/width/height are relative to the group's transform.
+    # RESTRICT so a group can't be dropped without converting its members back.
+    note_group = models.ForeignKey(NoteGroup, on_delete=models.RESTRICT, blank=True, null=True, related_name='notes')
     
     # Metadata
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_notes')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     z_index = models.IntegerField(default=0)
+    # Fractional stacking key, notes are drawn bottom to top in key order
+    order_key = models.CharField(max_length=255, blank=True, default='')
+    
+    # What the board preview draws of a note (previews.py); saves that change
+    # none of these leave the board's version alone
+    PREVIEW_FIELDS = ('x', 'y', 'width', 'height', 'color', 'order_key', 'note_group_id', 'created_by_id')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['whiteboard', 'order_key'], name='stickynote_board_order_idx'),
+        ]
     
     def __str__(self):
         return f"Note on {self.whiteboard.name} at ({self.x}, {self.y})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        note = super().from_db(db, field_names, values)
+        note._saved_preview_values = note._preview_values()
+        return note
+    
+    def _preview_values(self):
+        # Deferred fields are left out rather than loaded
+        return {field: self.__dict__[field] for field in self.PREVIEW_FIELDS if field in self.__dict__}
+    
+    def preview_changed(self):
+        """Whether anything the board preview draws changed since the note was loaded or saved"""
+        saved = getattr(self, '_saved_preview_values', None)
+        return saved is None or self._preview_values() != saved
+    
+    def save(self, *args, **kwargs):
+        # New notes go on top of the stack
+        if not self.order_key:
+            top = StickyNote.objects.filter(whiteboard_id=self.whiteboard_id).aggregate(Max('order_key'))['order_key__max']
+            self.order_key = key_between(top, None)
+        super().save(*args, **kwargs)
+        self._saved_preview_values = self._preview_values()
+        if needs_rebalance(self.order_key):
+            schedule_rebalance(self.whiteboard_id)
 
 
 class StickyNoteImage(models.Model):
@@ -97,6 +200,62 @@ class Drawing(models.Model):
         return f"Drawing on {self.whiteboard.name}"
 
 
+class DrawingTile(models.Model):
+    """A raster image of the strokes in one square of a whiteboard, at one overview zoom level
+    
+    Only tiles some stroke touches exist. ``dirty`` is set when a stroke
+    crossing the tile changed; ``version`` counts the renders and is part
+    of the image URL so clients notice new ones.
+    """
+    whiteboard = models.ForeignKey(Whiteboard, on_delete=models.CASCADE, related_name='drawing_tiles')
+    level = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    version = models.PositiveIntegerField(default=0)
+    dirty = models.BooleanField(default=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['whiteboard', 'level', 'x', 'y'], name='drawingtile_position'),
+        ]
+    
+    def __str__(self):
+        return f"Tile {self.level}/{self.x}/{self.y} of whiteboard {self.whiteboard_id}"
+
+
+class DrawingLayer(models.Model):
+    """Many old drawing strokes of a whiteboard compacted into one row
+    
+    Strokes keep their original Drawing id inside ``strokes`` so they can
+    still be selected and deleted individually. ``first_stroke_id`` and
+    ``last_stroke_id`` bound the ids in a layer; a stroke restored for
+    editing and compacted again lands in a later layer, so the ranges of a
+    board's layers can overlap.
+    """
+    whiteboard = models.ForeignKey(Whiteboard, on_delete=models.CASCADE, related_name='drawing_layers')
+    first_stroke_id = models.BigIntegerField()
+    last_stroke_id = models.BigIntegerField()
+    stroke_count = models.PositiveIntegerField(default=0)
+    # [{"id", "path_data", "color", "stroke_width", "created_by", "created_by_username", "created_at"}, ...]
+    strokes = models.JSONField(default=list)
+    # Bounding box of all strokes in board coordinates
+    min_x = models.FloatField(default=0)
+    min_y = models.FloatField(default=0)
+    max_x = models.FloatField(default=0)
+    max_y = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['first_stroke_id']
+        indexes = [
+            models.Index(fields=['whiteboard', 'first_stroke_id'], name='drawinglayer_board_range_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.stroke_count} strokes on {self.whiteboard.name}"
+
+
 class CustomColor(models.Model):
     """Represents a custom color defined by a user"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='custom_colors')
@@ -129,3 +288,97 @@ class WhiteboardViewSettings(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.whiteboard.name} (zoom: {self.zoom})"
 
+
+class BoardOperation(models.Model):
+    """Append-only log entry for one change to a whiteboard"""
+    OP_CHOICES = [
+        ('board_updated', 'Board updated'),
+        ('note_created', 'Note created'),
+        ('note_updated', 'Note updated'),
+        ('note_deleted', 'Note deleted'),
+        ('drawing_created', 'Drawing created'),
+        ('drawing_updated', 'Drawing updated'),
+        ('drawing_deleted', 'Drawing deleted'),
+        ('group_created', 'Group created'),
+        ('group_updated', 'Group updated'),
+        ('group_deleted', 'Group deleted'),
+        ('notes_reordered', 'Notes reordered'),
+    ]
+    
+    whiteboard = models.ForeignKey(Whiteboard, on_delete=models.CASCADE, related_name='operations')
+    op_type = models.CharField(max_length=20, choices=OP_CHOICES)
+    target_id = models.BigIntegerField(blank=True, null=True)
+    # New state of the target (and anything else the op touched)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # Previous values of the fields that changed, for history and undo
+    previous = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='board_operations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['whiteboard', 'id'], name='boardop_board_seq_idx'),
+            models.Index(fields=['created_at'], name='boardop_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.op_type} #{self.id} on {self.whiteboard_id}"
+
+
+class BoardSnapshot(models.Model):
+    """Compacted state of a whiteboard as of a given operation"""
+    whiteboard = models.ForeignKey(Whiteboard, on_delete=models.CASCADE, related_name='snapshots')
+    # Operations with a higher id than this still need to be applied on top
+    last_operation_id = models.BigIntegerField(default=0)
+    state = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['whiteboard', 'last_operation_id'], name='boardsnapshot_board_seq_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Snapshot of {self.whiteboard_id} at op {self.last_operation_id}"
+
+
+class BackgroundTask(models.Model):
+    """A queued call of a registered background task, run by ``manage.py run_worker``"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    # Higher runs first
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Identifies identical calls; at most one of them can be pending
+    dedup_key = models.CharField(max_length=64)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='task_queue_idx'),
+            models.Index(fields=['status', 'finished_at'], name='task_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='task_pending_dedup',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} ({self.status})"
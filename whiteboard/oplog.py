@@ -0,0 +1,215 @@
+"""
+Append-only operation log and periodic snapshots of whiteboard state.
+
+Every change made through the REST API is appended to ``BoardOperation``
+with the new state of what it touched and the previous values it replaced,
+in the same transaction as the change. Every
+``settings.OPLOG_SNAPSHOT_EVERY`` operations a background job stores a
+``BoardSnapshot`` of the whole board, so a board is loaded as "latest
+snapshot + the operations after it" and history is just a range scan over
+the log. Old operations and snapshots are pruned after
+``settings.OPLOG_RETENTION_DAYS``.
+"""
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .background import Debouncer
+from .models import Whiteboard, BoardOperation, BoardSnapshot
+
+# Which collection of the board state each op type upserts into or deletes from
+_COLLECTIONS = {
+    'note': 'sticky_notes',
+    'drawing': 'drawings',
+    'group': 'note_groups',
+}
+
+
+def record_operation(whiteboard_id, op_type, payload, target_id=None, user=None, previous=None):
+    """Append an operation to a board's log"""
+    op = BoardOperation.objects.create(
+        whiteboard_id=whiteboard_id,
+        op_type=op_type,
+        target_id=target_id,
+        payload=payload,
+        previous=previous,
+        user=user if user is not None and user.is_authenticated else None,
+    )
+    _maybe_schedule_snapshot(whiteboard_id, op.id)
+    return op
+
+
+def changed_fields(instance, validated_data):
+    """Previous values of the fields an update is about to change"""
+    previous = {}
+    for field, value in validated_data.items():
+        old = getattr(instance, field, None)
+        if hasattr(old, 'pk'):
+            old = old.pk
+        if hasattr(value, 'pk'):
+            value = value.pk
+        if old != value:
+            previous[field] = old
+    return previous
+
+
+def note_data(note):
+    """Serialize a note for the log; without a request media stays a relative URL"""
+    from .serializers import StickyNoteSerializer
+
+    return StickyNoteSerializer(note).data
+
+
+# Board state
+
+def build_state(whiteboard):
+    """Serialize the current board contents from the database"""
+    from .compaction import compacted_strokes_data
+    from .serializers import StickyNoteSerializer, DrawingSerializer, NoteGroupSerializer
+
+    notes = whiteboard.sticky_notes.select_related('created_by').prefetch_related('images')
+    return {
+        'whiteboard': {
+            'id': whiteboard.id,
+            'name': whiteboard.name,
+            'background_color': whiteboard.background_color,
+        },
+        'sticky_notes': _by_id(StickyNoteSerializer(notes, many=True).data),
+        'drawings': _by_id(
+            compacted_strokes_data(whiteboard)
+            + list(DrawingSerializer(whiteboard.drawings.select_related('created_by'), many=True).data)
+        ),
+        'note_groups': _by_id(NoteGroupSerializer(whiteboard.note_groups.all(), many=True).data),
+    }
+
+
+def _by_id(items):
+    return {str(item['id']): item for item in items}
+
+
+def apply_operation(state, op_type, payload):
+    """Apply one logged operation to a board state in place"""
+    if op_type == 'board_updated':
+        state['whiteboard'].update(payload.get('whiteboard', {}))
+        return state
+    if op_type == 'notes_reordered':
+        # A rebalance re-keys many notes in one op
+        for note_id, key in payload['order_keys'].items():
+            note = state['sticky_notes'].get(note_id)
+            if note is not None:
+                note['order_key'] = key
+        return state
+
+    kind, _, action = op_type.partition('_')
+    items = state[_COLLECTIONS[kind]]
+    item = payload.get(kind)
+    if action == 'deleted':
+        items.pop(str(payload['id']), None)
+    elif item is not None:
+        items[str(item['id'])] = item
+
+    # Group ops also carry the member notes whose coordinates they converted
+    for note in payload.get('notes', []):
+        state['sticky_notes'][str(note['id'])] = note
+    return state
+
+
+def load_state(whiteboard):
+    """Return ``(state, seq)``: latest snapshot plus the operations after it"""
+    snapshot = whiteboard.snapshots.order_by('-last_operation_id').first()
+    if snapshot is None:
+        seq = whiteboard.operations.aggregate(seq=Max('id'))['seq'] or 0
+        return build_state(whiteboard), seq
+
+    state = snapshot.state
+    seq = snapshot.last_operation_id
+    tail = whiteboard.operations.filter(id__gt=seq).order_by('id').values_list('id', 'op_type', 'payload')
+    for op_id, op_type, payload in tail.iterator(chunk_size=500):
+        apply_operation(state, op_type, payload)
+        seq = op_id
+    return state, seq
+
+
+def state_as_lists(state):
+    """Board state in the same shape as the whiteboard retrieve endpoint"""
+    return {
+        **state['whiteboard'],
+        'sticky_notes': list(state['sticky_notes'].values()),
+        'drawings': list(state['drawings'].values()),
+        'note_groups': list(state['note_groups'].values()),
+    }
+
+
+# Snapshots and retention
+
+def take_snapshot(whiteboard_id):
+    """Store a snapshot of a board's current state"""
+    whiteboard = Whiteboard.objects.filter(id=whiteboard_id).first()
+    if whiteboard is None:
+        return None
+    with transaction.atomic():
+        # Read the log position first: ops that land while we serialize are
+        # replayed on top, which is harmless because every op carries full state
+        seq = whiteboard.operations.aggregate(seq=Max('id'))['seq'] or 0
+        snapshot = BoardSnapshot.objects.create(
+            whiteboard=whiteboard,
+            last_operation_id=seq,
+            state=build_state(whiteboard),
+        )
+    return snapshot
+
+
+def prune_board(whiteboard_id, now=None):
+    """Drop expired operations and snapshots, never what the latest snapshot needs"""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.OPLOG_RETENTION_DAYS)
+    snapshots = BoardSnapshot.objects.filter(whiteboard_id=whiteboard_id).order_by('-last_operation_id')
+    keep = list(snapshots.values_list('id', flat=True)[:settings.OPLOG_KEEP_SNAPSHOTS])
+    if not keep:
+        return 0
+    latest_seq = snapshots.values_list('last_operation_id', flat=True).first()
+
+    BoardSnapshot.objects.filter(whiteboard_id=whiteboard_id, created_at__lt=cutoff).exclude(id__in=keep).delete()
+    deleted, _ = BoardOperation.objects.filter(
+        whiteboard_id=whiteboard_id,
+        id__lte=latest_seq,
+        created_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+def snapshot_and_prune(whiteboard_id):
+    if take_snapshot(whiteboard_id) is not None:
+        prune_board(whiteboard_id)
+
+
+_debouncer = Debouncer(snapshot_and_prune, 0, name='Board snapshot')
+# Operations this process appended per board since it last checked the log,
+# for the most recently written boards; a board that falls out only gets
+# checked a little later
+APPENDED_BOARDS_KEPT = 1024
+_appended = OrderedDict()
+
+
+def _maybe_schedule_snapshot(whiteboard_id, op_id):
+    # Only look at the log every tenth of a snapshot interval per process,
+    # rather than counting it on every write
+    appended = _appended.pop(whiteboard_id, 0) + 1
+    if appended < max(settings.OPLOG_SNAPSHOT_EVERY // 10, 1):
+        _appended[whiteboard_id] = appended
+        if len(_appended) > APPENDED_BOARDS_KEPT:
+            _appended.popitem(last=False)
+        return
+    last = (
+        BoardSnapshot.objects.filter(whiteboard_id=whiteboard_id)
+        .order_by('-last_operation_id')
+        .values_list('last_operation_id', flat=True)
+        .first()
+    )
+    pending = BoardOperation.objects.filter(whiteboard_id=whiteboard_id, id__gt=last or 0)
+    # Only count once the log could plausibly be long enough
+    if op_id - (last or 0) >= settings.OPLOG_SNAPSHOT_EVERY and pending.count() >= settings.OPLOG_SNAPSHOT_EVERY:
+        _debouncer.schedule(whiteboard_id)
@@ -0,0 +1,167 @@
+"""
+Fractional order keys for stacking sticky notes.
+
+Each note carries an ``order_key`` string; notes are stacked bottom to top
+in lexicographic key order. A key strictly between any two keys can always
+be generated, so moving a note to the front, the back or between two
+neighbours rewrites exactly that one row. Moves to the front or back step
+the top or bottom key by one digit, so a key only grows by a character
+every few dozen such moves; inserting between the same two neighbours over
+and over grows it faster. Once a key gets longer than
+``settings.ORDER_KEY_REBALANCE_LENGTH`` the board is re-keyed with short,
+evenly spaced keys in the background and the new keys are sent to the
+board's sockets.
+
+Keys only use digits and lower case letters: databases compare them with
+the column's collation, and locale collations order mixed case
+differently from Python and the browser.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .background import Debouncer
+
+# Base-36 digits in ASCII order so string comparison matches numeric order
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def _midpoint(a, b):
+    """Digits strictly between fractions ``0.a`` and ``0.b`` (``b=None`` means 1)"""
+    if b is not None:
+        # Skip the common prefix, treating a missing digit in ``a`` as zero
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b) // 2]
+    # Adjacent digits: keep the first one and recurse on the remainder
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _increment(key):
+    """The shortest key after ``key`` that keeps its prefix of top digits"""
+    for n, digit in enumerate(key):
+        if digit != DIGITS[-1]:
+            return key[:n] + DIGITS[DIGITS.index(digit) + 1]
+    return key + DIGITS[1]
+
+
+def _decrement(key):
+    """The shortest key before ``key`` that keeps its prefix of zero digits"""
+    n = len(key) - len(key.lstrip(DIGITS[0]))
+    digit = DIGITS.index(key[n])
+    if digit > 1:
+        return key[:n] + DIGITS[digit - 1]
+    # Nothing shorter fits below a 1: the key must not end in a zero
+    return key[:n] + DIGITS[0] + DIGITS[-1]
+
+
+def is_valid_key(key):
+    """Whether ``key`` is a non-empty key made by this module
+
+    A trailing zero would make a key equal to its own prefix as a fraction,
+    leaving no key between the two.
+    """
+    return bool(key) and key[-1] != DIGITS[0] and all(digit in DIGITS for digit in key)
+
+
+def key_between(before=None, after=None):
+    """Return an order key that sorts after ``before`` and before ``after``
+
+    Either bound may be None (or empty) to mean "no neighbour on that side".
+    Raises ValueError for bounds that are out of order or not valid keys.
+    """
+    before, after = before or '', after or ''
+    for key in (before, after):
+        if key and not is_valid_key(key):
+            raise ValueError(f'{key!r} is not a valid order key')
+    if after and before >= after:
+        raise ValueError(f'{before!r} is not less than {after!r}')
+    if before and not after:
+        return _increment(before)
+    if after and not before:
+        return _decrement(after)
+    return _midpoint(before, after or None)
+
+
+def evenly_spaced_keys(count):
+    """Return ``count`` short, increasing keys spread evenly over the key space"""
+    if count <= 0:
+        return []
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    keys = []
+    for i in range(1, count + 1):
+        value = i * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append(''.join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
+
+
+def needs_rebalance(key):
+    return len(key) > settings.ORDER_KEY_REBALANCE_LENGTH
+
+
+def rebalance_board(whiteboard_id):
+    """Re-key all notes of a board with short keys, preserving their order
+
+    The new keys are logged as one ``notes_reordered`` operation, the
+    board's version is bumped and its sockets get the keys as a
+    ``notes_reordered`` message once they are committed.
+    """
+    from .models import StickyNote
+    from .oplog import record_operation
+    from .signals import bump_whiteboard_version
+
+    with transaction.atomic():
+        notes = list(
+            StickyNote.objects.select_for_update()
+            .filter(whiteboard_id=whiteboard_id)
+            .order_by('order_key', 'id')
+            .only('id', 'order_key')
+        )
+        previous = {str(note.id): note.order_key for note in notes}
+        for note, key in zip(notes, evenly_spaced_keys(len(notes))):
+            note.order_key = key
+        StickyNote.objects.bulk_update(notes, ['order_key'], batch_size=500)
+        if notes:
+            record_operation(
+                whiteboard_id, 'notes_reordered',
+                {'order_keys': {str(note.id): note.order_key for note in notes}},
+                previous=previous,
+            )
+        bump_whiteboard_version(whiteboard_id)
+    if notes:
+        broadcast_order_keys(whiteboard_id, {note.id: note.order_key for note in notes})
+    return len(notes)
+
+
+def broadcast_order_keys(whiteboard_id, order_keys):
+    """Send rewritten order keys to the sockets of a board"""
+    async_to_sync(get_channel_layer().group_send)(f'whiteboard_{whiteboard_id}', {
+        'type': 'notes_reordered',
+        'order_keys': {str(note_id): key for note_id, key in order_keys.items()},
+    })
+
+
+_debouncer = Debouncer(rebalance_board, 0, name='Order key rebalance')
+
+
+def schedule_rebalance(whiteboard_id):
+    """Re-key a board in a background thread once the current transaction commits"""
+    _debouncer.schedule(whiteboard_id)
@@ -0,0 +1,161 @@
+"""
+Server-side preview thumbnails for whiteboards.
+
+A preview is a small raster image of a board's background, drawings and
+sticky notes. Previews are rendered off the request path whenever the
+board's ``version`` changes and cached on disk under ``MEDIA_ROOT`` so the
+boards overview only has to fetch static files.
+"""
+import io
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .background import Debouncer
+from .models import Whiteboard, CustomColor, StickyNote
+
+# Same palette the frontend uses in WhiteboardCanvas.getNoteColor()
+NOTE_COLORS = {
+    'yellow': '#feff7c',
+    'pink': '#ffb3e6',
+    'blue': '#7dd3fc',
+    'green': '#bbf7d0',
+    'orange': '#fed7aa',
+    'purple': '#ddd6fe',
+}
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+
+def parse_path_data(path_data):
+    """Parse the ``M x,y L x,y ...`` paths produced by the canvas into points"""
+    numbers = [float(n) for n in _NUMBER_RE.findall(path_data or '')]
+    return list(zip(numbers[0::2], numbers[1::2]))
+
+
+def preview_name(whiteboard_id):
+    """Storage-relative path of the cached preview for a whiteboard"""
+    return f"{settings.PREVIEW_DIR}/board_{whiteboard_id}.{settings.PREVIEW_FORMAT.lower()}"
+
+
+def preview_url(whiteboard):
+    """Public URL of a whiteboard's cached preview, or None if not rendered yet"""
+    if whiteboard.preview_version is None:
+        return None
+    return f"{settings.MEDIA_URL}{preview_name(whiteboard.id)}?v={whiteboard.preview_version}"
+
+
+def _note_color(note, custom_colors):
+    color = note.color or 'yellow'
+    if color.startswith('#'):
+        return color
+    return custom_colors.get((note.created_by_id, color)) or NOTE_COLORS.get(color, NOTE_COLORS['yellow'])
+
+
+def render_preview(whiteboard):
+    """Rasterize a whiteboard to image bytes in ``settings.PREVIEW_FORMAT``"""
+    from PIL import Image, ImageDraw
+
+    width, height = settings.PREVIEW_SIZE
+    padding = settings.PREVIEW_PADDING
+
+    groups = {group.id: group for group in whiteboard.note_groups.all()}
+    notes = []
+    for note in (
+        whiteboard.sticky_notes.only(*StickyNote.PREVIEW_FIELDS)
+        .order_by('order_key', 'id')
+    ):
+        if note.note_group_id in groups:
+            note.x, note.y, note.width, note.height = groups[note.note_group_id].to_absolute(
+                note.x, note.y, note.width, note.height
+            )
+        notes.append(note)
+    from .compaction import iter_strokes
+
+    strokes = [
+        (parse_path_data(stroke['path_data']), stroke['color'], stroke['stroke_width'])
+        for stroke in iter_strokes(whiteboard)
+    ]
+    custom_colors = {
+        (c.user_id, c.name): c.hex_color
+        for c in CustomColor.objects.filter(user_id__in={n.created_by_id for n in notes})
+    }
+
+    # Fit the bounding box of all content into the thumbnail
+    xs, ys = [], []
+    for note in notes:
+        xs += [note.x, note.x + note.width]
+        ys += [note.y, note.y + note.height]
+    for points, _color, _stroke_width in strokes:
+        xs += [p[0] for p in points]
+        ys += [p[1] for p in points]
+
+    if xs:
+        min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+    else:
+        min_x, max_x, min_y, max_y = 0, width, 0, height
+    scale = min(
+        (width - 2 * padding) / max(max_x - min_x, 1),
+        (height - 2 * padding) / max(max_y - min_y, 1),
+    )
+    offset_x = (width - (max_x - min_x) * scale) / 2 - min_x * scale
+    offset_y = (height - (max_y - min_y) * scale) / 2 - min_y * scale
+
+    def project(x, y):
+        return (x * scale + offset_x, y * scale + offset_y)
+
+    try:
+        image = Image.new('RGB', (width, height), whiteboard.background_color or '#ffffff')
+    except ValueError:
+        image = Image.new('RGB', (width, height), '#ffffff')
+    draw = ImageDraw.Draw(image)
+
+    for points, color, stroke_width in strokes:
+        if len(points) < 2:
+            continue
+        try:
+            draw.line([project(x, y) for x, y in points], fill=color, width=max(1, round(stroke_width * scale)))
+        except ValueError:
+            draw.line([project(x, y) for x, y in points], fill='black', width=1)
+
+    for note in notes:
+        x0, y0 = project(note.x, note.y)
+        x1, y1 = project(note.x + note.width, note.y + note.height)
+        draw.rectangle([x0, y0, max(x0, x1 - 1), max(y0, y1 - 1)], fill=_note_color(note, custom_colors), outline='#999999')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=settings.PREVIEW_FORMAT)
+    return buffer.getvalue()
+
+
+def update_preview(whiteboard_id):
+    """Render and store the preview for a whiteboard if it is out of date"""
+    whiteboard = Whiteboard.objects.filter(id=whiteboard_id).first()
+    if whiteboard is None or whiteboard.preview_version == whiteboard.version:
+        return None
+
+    version = whiteboard.version
+    data = render_preview(whiteboard)
+    name = preview_name(whiteboard_id)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a partial image
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    Whiteboard.objects.filter(id=whiteboard_id).update(preview_version=version)
+    return name
+
+
+_debouncer = Debouncer(update_preview, lambda: settings.PREVIEW_DEBOUNCE_SECONDS, name='Preview rendering')
+
+
+def schedule_preview(whiteboard_id):
+    """Queue a debounced preview render once the current transaction commits"""
+    if not settings.PREVIEW_ENABLED:
+        return
+    _debouncer.schedule(whiteboard_id)
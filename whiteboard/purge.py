@@ -0,0 +1,121 @@
+"""
+Soft deletion of whiteboards and the background purge of their contents.
+
+Deleting a board through the API only stamps ``deleted_at``, which hides it
+everywhere at once (``Whiteboard.objects`` excludes deleted boards). A
+background job then removes its rows child table first, in batches of
+``settings.BOARD_PURGE_BATCH_SIZE`` with one short transaction each, so a
+huge board never holds a long lock or loads every row into Django's delete
+collector. Media files that no other board references are removed as well.
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .background import Debouncer
+from .models import (
+    Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, DrawingLayer, DrawingTile,
+    WhiteboardViewSettings, BoardOperation, BoardSnapshot,
+)
+from .previews import preview_name
+from .tiles import delete_tiles
+
+
+def soft_delete(whiteboard):
+    """Hide a whiteboard immediately and purge it in the background"""
+    Whiteboard.objects.filter(id=whiteboard.id).update(deleted_at=timezone.now())
+    schedule_purge(whiteboard.id)
+
+
+def _unreferenced(names, whiteboard_id):
+    """Those of ``names`` that no note outside the board still uses"""
+    names = {name for name in names if name}
+    if not names:
+        return set()
+    shared = set(
+        StickyNoteImage.objects.filter(image__in=names)
+        .exclude(sticky_note__whiteboard_id=whiteboard_id)
+        .values_list('image', flat=True)
+    )
+    shared.update(
+        StickyNote.objects.filter(image__in=names)
+        .exclude(whiteboard_id=whiteboard_id)
+        .values_list('image', flat=True)
+    )
+    return names - shared
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            pass
+
+
+def _purge_table(whiteboard_id, queryset, batch_size, report, label, files_field=None):
+    """Delete the rows of ``queryset`` in batches; returns the number deleted"""
+    model = queryset.model
+    total = 0
+    while True:
+        fields = ['id', files_field] if files_field else ['id']
+        rows = list(queryset.order_by('id').values_list(*fields)[:batch_size])
+        if not rows:
+            return total
+        ids = [row[0] for row in rows]
+        with transaction.atomic():
+            # Children are already gone, so skip the collector and per-row signals
+            model.objects.filter(id__in=ids)._raw_delete(model.objects.db)
+        if files_field:
+            _delete_files(_unreferenced([row[1] for row in rows], whiteboard_id))
+        total += len(ids)
+        report(label, total)
+
+
+def purge_board(whiteboard_id, batch_size=None, report=None):
+    """Delete a soft-deleted board and everything on it; returns counts per table"""
+    batch_size = batch_size or settings.BOARD_PURGE_BATCH_SIZE
+    report = report or (lambda label, count: None)
+    if not Whiteboard.all_objects.filter(id=whiteboard_id, deleted_at__isnull=False).exists():
+        return {}
+
+    tables = [
+        ('images', StickyNoteImage.objects.filter(sticky_note__whiteboard_id=whiteboard_id), 'image'),
+        ('operations', BoardOperation.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('snapshots', BoardSnapshot.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('drawing layers', DrawingLayer.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('drawing tiles', DrawingTile.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('drawings', Drawing.objects.filter(whiteboard_id=whiteboard_id), None),
+        # Notes before groups: note_group is RESTRICT
+        ('notes', StickyNote.objects.filter(whiteboard_id=whiteboard_id), 'image'),
+        ('groups', NoteGroup.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('access rights', WhiteboardAccess.objects.filter(whiteboard_id=whiteboard_id), None),
+        ('view settings', WhiteboardViewSettings.objects.filter(whiteboard_id=whiteboard_id), None),
+    ]
+    counts = {}
+    for label, queryset, files_field in tables:
+        counts[label] = _purge_table(whiteboard_id, queryset, batch_size, report, label, files_field)
+
+    _delete_files([preview_name(whiteboard_id)])
+    delete_tiles(whiteboard_id)
+    # Anything left is small; let the collector handle tables added later
+    Whiteboard.all_objects.filter(id=whiteboard_id).delete()
+    report('whiteboard', 1)
+    return counts
+
+
+def purge_deleted_boards(batch_size=None, report=None):
+    """Purge every soft-deleted board, e.g. after a restart interrupted a purge"""
+    purged = []
+    for whiteboard_id in Whiteboard.all_objects.filter(deleted_at__isnull=False).values_list('id', flat=True):
+        purge_board(whiteboard_id, batch_size=batch_size, report=report)
+        purged.append(whiteboard_id)
+    return purged
+
+
+_debouncer = Debouncer(purge_board, 0, name='Board purge', priority=-10)
+
+
+def schedule_purge(whiteboard_id):
+    _debouncer.schedule(whiteboard_id)
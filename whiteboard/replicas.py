@@ -0,0 +1,124 @@
+"""
+Read-replica routing.
+
+When ``settings.DATABASE_REPLICAS`` lists replica aliases, reads made while
+serving a safe-method request (GET/HEAD/OPTIONS) go to a replica, and
+everything else — writes, reads inside a transaction, background jobs,
+management commands — stays on the primary.
+
+Replicas lag behind the primary, so a client that just wrote is pinned to
+the primary for ``settings.REPLICA_PIN_SECONDS`` with a short-lived cookie
+and reads its own writes.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _RequestRouting:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+
+# Routing state of the request being served; None outside requests
+_routing = ContextVar('replica_routing', default=None)
+
+
+def _in_transaction():
+    # The test runner's own wrapping transaction does not count
+    return any(not block._from_testcase for block in connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+class ReplicaRouter:
+    """Send reads of safe-method requests to a replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or not routing.use_replica or _in_transaction():
+            return DEFAULT_DB_ALIAS
+        if routing.replica is None:
+            # Stick to one replica per request so its reads are consistent
+            routing.replica = random.choice(settings.DATABASE_REPLICAS)
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+            routing.use_replica = False
+        # Explicit, so objects read from a replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Enable replica reads for safe requests and pin clients to the primary after writes"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        routing = self._routing_for(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin(routing, request, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        routing = self._routing_for(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin(routing, request, response)
+
+    def _routing_for(self, request):
+        return _RequestRouting(
+            use_replica=request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        )
+
+    def _pin(self, routing, request, response):
+        if routing.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                # Sent back on the frontend's cross-site requests like the session
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
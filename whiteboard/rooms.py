@@ -0,0 +1,714 @@
+"""
+Authoritative in-memory state of the boards open over WebSockets.
+
+With ``settings.ROOM_STATE`` on, a consumer process keeps every board that
+has clients connected in a Room: its notes, note groups and strokes as
+slotted objects, read from the database once when the first client joins.
+Joining clients get a ``room_snapshot`` served from memory.
+
+Clients still create and delete through the REST API and announce the
+result over the socket; those announcements are checked against the
+database before they are applied. Images, the stacking order and grouping
+are also only changed through the REST API: a ``note_updated`` op whose
+values for them differ from the room's makes the room re-read them from
+the database, and a ``group_updated`` op for a group it does not know yet
+loads that group. Order keys rewritten by a background rebalance arrive
+as a ``notes_reordered`` event from the server. Moves, edits and restyles announced
+over the socket are validated, applied to the room and fanned out in
+their normalized form, and the changed fields are written back every
+``settings.ROOM_FLUSH_SECONDS``: one UPDATE and one logged operation per
+note or group, however many moves happened in between. A room without
+clients is flushed and dropped right away, as it no longer hears about
+changes made elsewhere; if the write fails, it is kept and retried every
+``settings.ROOM_IDLE_SECONDS``.
+
+Typing is sent as ``note_text`` deltas rather than whole notes (see
+textops.py): the room numbers each note's text versions and transforms
+deltas made against an older version before applying them.
+
+Every process keeps its own rooms. Ops received by other processes reach
+the local room through the channel layer and are applied to it as well,
+but only the process that received an op writes it back. The settings
+therefore refuse ``ROOM_STATE`` without a shared (Redis) channel layer.
+"""
+import asyncio
+import json
+import math
+from collections import OrderedDict, defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.fields import DateTimeField
+
+from . import textops
+from .background import run_write
+from .compaction import STROKE_FIELDS, find_compacted_stroke, iter_strokes, serialize_stroke
+from .metrics import ROOMS_ACTIVE, ROOM_ROWS_FLUSHED
+from .models import Whiteboard, NoteGroup, StickyNote, StickyNoteImage, Drawing, DrawingLayer
+from .oplog import record_operation
+from .signals import bump_whiteboard_version
+
+WRITE_ROLES = ['owner', 'edit', 'admin']
+# Op ids remembered per room, so ops fanned out to several local consumers
+# are applied once
+APPLIED_OPS_KEPT = 1024
+# Text deltas remembered per note; clients further behind are resynced
+TEXT_HISTORY_KEPT = 200
+# Message types that change the board; everything else is relayed untouched
+OP_TYPES = {
+    'note_added', 'note_updated', 'note_text', 'note_deleted', 'group_updated', 'group_deleted', 'drawing_added', 'drawing_deleted',
+}
+
+NOTE_COLUMNS = [
+    'id', 'content', 'image', 'link', 'color', 'x', 'y', 'width', 'height', 'group_id', 'note_group_id',
+    'z_index', 'order_key', 'created_by_id', 'created_at', 'updated_at',
+]
+USER_COLUMNS = ['id', 'username', 'email', 'is_staff', 'is_active', 'date_joined']
+GROUP_COLUMNS = ['id', 'offset_x', 'offset_y', 'scale', 'created_by_id', 'created_at', 'updated_at']
+COLORS = {color for color, _ in StickyNote.COLOR_CHOICES}
+# Note fields set through the REST API only, re-read when an op disagrees
+REST_NOTE_FIELDS = ['image', 'images', 'order_key', 'note_group']
+GEOMETRY_FIELDS = ['x', 'y', 'width', 'height']
+
+_datetime = DateTimeField()
+_url_validator = URLValidator()
+
+
+class OpRejected(Exception):
+    """An op a client sent cannot be applied
+
+    ``resync`` is a message bringing the client back in step, if it needs one.
+    """
+
+    def __init__(self, detail, resync=None):
+        super().__init__(detail)
+        self.resync = resync
+
+
+class NoteState:
+    """One sticky note, holding what StickyNoteSerializer renders plus the text version"""
+    __slots__ = (
+        'id', 'content', 'image', 'images', 'link', 'color', 'x', 'y', 'width', 'height',
+        'group_id', 'note_group', 'z_index', 'order_key', 'created_by', 'created_at', 'updated_at',
+        'text_version',
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def as_dict(self, whiteboard_id):
+        return {
+            'id': self.id, 'whiteboard': whiteboard_id, 'content': self.content, 'image': self.image,
+            'images': list(self.images), 'link': self.link, 'color': self.color,
+            'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height,
+            'group_id': self.group_id, 'note_group': self.note_group, 'z_index': self.z_index,
+            'order_key': self.order_key, 'created_by': self.created_by,
+            'created_at': self.created_at, 'updated_at': self.updated_at, 'text_version': self.text_version,
+        }
+
+
+class GroupState:
+    """One note group, as NoteGroupSerializer renders it"""
+    __slots__ = ('id', 'offset_x', 'offset_y', 'scale', 'created_by', 'created_at', 'updated_at')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def as_dict(self, whiteboard_id):
+        return {
+            'id': self.id, 'whiteboard': whiteboard_id, 'offset_x': self.offset_x, 'offset_y': self.offset_y,
+            'scale': self.scale, 'created_by': self.created_by,
+            'created_at': self.created_at, 'updated_at': self.updated_at,
+        }
+
+
+class StrokeState:
+    """One drawing stroke, in the compacted stroke format (see compaction.py)"""
+    __slots__ = ('id', 'path_data', 'color', 'stroke_width', 'created_by', 'created_by_username', 'created_at')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    @classmethod
+    def from_dict(cls, data):
+        """From a stroke as serialize_stroke() renders it"""
+        return cls(
+            id=data['id'], path_data=data['path_data'], color=data['color'], stroke_width=data['stroke_width'],
+            created_by=data['created_by']['id'], created_by_username=data['created_by']['username'],
+            created_at=data['created_at'],
+        )
+
+    def as_dict(self, whiteboard_id):
+        return serialize_stroke({name: getattr(self, name) for name in self.__slots__}, whiteboard_id)
+
+
+# Loading from the database
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def load_notes(whiteboard_id, ids=None):
+    """The board's notes (or the given ones) as ``{id: NoteState}``"""
+    rows = StickyNote.objects.filter(whiteboard_id=whiteboard_id).order_by('id')
+    images = StickyNoteImage.objects.filter(sticky_note__whiteboard_id=whiteboard_id)
+    if ids is not None:
+        rows = rows.filter(id__in=ids)
+        images = images.filter(sticky_note_id__in=ids)
+    rows = list(rows.values(*NOTE_COLUMNS))
+
+    images_by_note = defaultdict(list)
+    for image in images.values('id', 'sticky_note_id', 'image', 'order', 'created_at'):
+        images_by_note[image['sticky_note_id']].append({
+            'id': image['id'],
+            'image': _media_url(image['image']),
+            'order': image['order'],
+            'created_at': _datetime.to_representation(image['created_at']),
+        })
+    # One dict per author, shared by all their notes
+    users = {
+        user['id']: {**user, 'date_joined': _datetime.to_representation(user['date_joined'])}
+        for user in User.objects.filter(id__in={row['created_by_id'] for row in rows}).values(*USER_COLUMNS)
+    }
+    return {
+        row['id']: NoteState(
+            id=row['id'], content=row['content'], image=_media_url(row['image']),
+            images=tuple(images_by_note.get(row['id'], ())), link=row['link'], color=row['color'],
+            x=row['x'], y=row['y'], width=row['width'], height=row['height'], group_id=row['group_id'],
+            note_group=row['note_group_id'], z_index=row['z_index'], order_key=row['order_key'],
+            created_by=users[row['created_by_id']],
+            created_at=_datetime.to_representation(row['created_at']),
+            updated_at=_datetime.to_representation(row['updated_at']),
+            text_version=0,
+        )
+        for row in rows
+    }
+
+
+def load_groups(whiteboard_id, ids=None):
+    rows = NoteGroup.objects.filter(whiteboard_id=whiteboard_id).order_by('id')
+    if ids is not None:
+        rows = rows.filter(id__in=ids)
+    rows = rows.values(*GROUP_COLUMNS)
+    return {
+        row['id']: GroupState(
+            id=row['id'], offset_x=row['offset_x'], offset_y=row['offset_y'], scale=row['scale'],
+            created_by=row['created_by_id'],
+            created_at=_datetime.to_representation(row['created_at']),
+            updated_at=_datetime.to_representation(row['updated_at']),
+        )
+        for row in rows
+    }
+
+
+def load_strokes(whiteboard_id, ids=None):
+    """The board's strokes as ``{id: StrokeState}``; given ids are looked up among the uncompacted ones"""
+    if ids is None:
+        return {stroke['id']: StrokeState(**stroke) for stroke in iter_strokes(whiteboard_id)}
+    rows = Drawing.objects.filter(whiteboard_id=whiteboard_id, id__in=ids).values(*STROKE_FIELDS)
+    return {
+        values['id']: StrokeState(
+            id=values['id'], path_data=values['path_data'], color=values['color'],
+            stroke_width=values['stroke_width'], created_by=values['created_by'],
+            created_by_username=values['created_by__username'], created_at=values['created_at'].isoformat(),
+        )
+        for values in rows
+    }
+
+
+def load_room(whiteboard_id):
+    """Read a whole board into a Room, or None if it does not exist"""
+    if not Whiteboard.objects.filter(id=whiteboard_id).exists():
+        return None
+    return Room(whiteboard_id, load_notes(whiteboard_id), load_groups(whiteboard_id), load_strokes(whiteboard_id))
+
+
+def write_changes(whiteboard_id, notes, groups, now):
+    """Write a room's changed fields back and log them as operations
+
+    ``notes`` and ``groups`` are lists of ``(id, fields, previous, data, user)``.
+    """
+    written = 0
+    with transaction.atomic():
+        for model, op_type, key, rows in [(StickyNote, 'note_updated', 'note', notes), (NoteGroup, 'group_updated', 'group', groups)]:
+            for item_id, fields, previous, data, user in rows:
+                # Rows deleted meanwhile through the REST API are skipped
+                if model.objects.filter(id=item_id, whiteboard_id=whiteboard_id).update(**fields, updated_at=now):
+                    record_operation(whiteboard_id, op_type, {key: data}, target_id=item_id, user=user, previous=previous)
+                    written += 1
+        if written:
+            bump_whiteboard_version(whiteboard_id)
+    return written
+
+
+# Op validation
+
+def _number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise OpRejected(f'{field} must be a number')
+    return float(value)
+
+
+def _clean_note(data):
+    """The editable fields of a note op, validated like the REST API does"""
+    cleaned = {}
+    for field in ('x', 'y', 'width', 'height'):
+        if field in data:
+            cleaned[field] = _number(data[field], field)
+    if 'z_index' in data:
+        if isinstance(data['z_index'], bool) or not isinstance(data['z_index'], int) or abs(data['z_index']) >= 2 ** 31:
+            raise OpRejected('z_index must be an integer')
+        cleaned['z_index'] = data['z_index']
+    if 'content' in data:
+        if not isinstance(data['content'], str):
+            raise OpRejected('content must be a string')
+        cleaned['content'] = data['content']
+    if 'color' in data:
+        if data['color'] not in COLORS:
+            raise OpRejected(f"\"{data['color']}\" is not a valid color")
+        cleaned['color'] = data['color']
+    if 'link' in data:
+        link = data['link']
+        if link not in (None, ''):
+            try:
+                if not isinstance(link, str) or len(link) > 200:
+                    raise ValidationError('')
+                _url_validator(link)
+            except ValidationError:
+                raise OpRejected('link must be a URL')
+        cleaned['link'] = link
+    if 'group_id' in data:
+        if data['group_id'] is not None and (not isinstance(data['group_id'], str) or len(data['group_id']) > 100):
+            raise OpRejected('group_id must be a string of up to 100 characters')
+        cleaned['group_id'] = data['group_id']
+    return cleaned
+
+
+def _clean_group(data):
+    cleaned = {field: _number(data[field], field) for field in ('offset_x', 'offset_y', 'scale') if field in data}
+    if cleaned.get('scale', 1) <= 0:
+        raise OpRejected('Scale must be positive')
+    return cleaned
+
+
+def _rest_fields_differ(note, data):
+    """Whether an op carries images, stacking or grouping other than the room's"""
+    if 'images' in data:
+        images = data['images'] if isinstance(data['images'], list) else []
+        if [image.get('id') if isinstance(image, dict) else None for image in images] != [image['id'] for image in note.images]:
+            return True
+    return any(field in data and data[field] != getattr(note, field) for field in ('image', 'order_key', 'note_group'))
+
+
+def _item_id(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise OpRejected('A numeric id is required')
+    return value
+
+
+def _count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+class Room:
+    """The live state of one whiteboard in this process"""
+
+    def __init__(self, whiteboard_id, notes, groups, strokes):
+        self.whiteboard_id = whiteboard_id
+        self.notes = notes
+        self.groups = groups
+        self.strokes = strokes
+        # note id -> deltas that produced its latest text versions
+        self.text_history = {}
+        self.clients = 0
+        # id -> {field: value before the first unflushed change}
+        self.dirty_notes = {}
+        self.dirty_groups = {}
+        # (kind, id) -> user of the latest unflushed change
+        self._editors = {}
+        self._applied = OrderedDict()
+        self._snapshot = None
+        self._flush_handle = None
+        self._evict_handle = None
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+
+    # Snapshots
+
+    def snapshot(self):
+        """The ``room_snapshot`` message for joining clients, as JSON"""
+        if self._snapshot is None:
+            self._snapshot = json.dumps({
+                'type': 'room_snapshot',
+                'whiteboard': self.whiteboard_id,
+                'sticky_notes': [note.as_dict(self.whiteboard_id) for note in self.notes.values()],
+                'note_groups': [group.as_dict(self.whiteboard_id) for group in self.groups.values()],
+                'drawings': [stroke.as_dict(self.whiteboard_id) for stroke in self.strokes.values()],
+            })
+        return self._snapshot
+
+    # Applying ops
+
+    def _remember(self, op_id):
+        self._applied[op_id] = None
+        if len(self._applied) > APPLIED_OPS_KEPT:
+            self._applied.popitem(last=False)
+
+    async def apply(self, message, user, role, op_id):
+        """Validate and apply an op a client of this process sent
+
+        Returns the message to fan out (the normalized op, or the message
+        unchanged if it is not a board op); raises OpRejected.
+        """
+        if not isinstance(message, dict) or message.get('type') not in OP_TYPES:
+            return message
+        if role not in WRITE_ROLES:
+            raise OpRejected('You do not have permission to change this whiteboard.')
+        normalized = await getattr(self, f"_apply_{message['type']}")(message, user)
+        self._remember(op_id)
+        self._snapshot = None
+        return normalized
+
+    async def apply_remote(self, message, op_id):
+        """Apply an op another process (or consumer) already validated"""
+        if op_id in self._applied or not isinstance(message, dict) or message.get('type') not in OP_TYPES:
+            return
+        self._remember(op_id)
+        kind = message['type']
+        if kind == 'note_added' or kind == 'note_updated':
+            note = message['note']
+            current = self.notes.get(note['id'])
+            if current is None or current.text_version != note['text_version']:
+                self.text_history.pop(note['id'], None)
+            self.notes[note['id']] = NoteState(**{
+                name: tuple(note['images']) if name == 'images' else note[name] for name in NoteState.__slots__
+            })
+        elif kind == 'note_text':
+            note = self.notes.get(message['noteId'])
+            if note is not None:
+                try:
+                    note.content = textops.apply(note.content, message['ops'])
+                except ValueError:
+                    # Out of step with the process that applied it; its flush wins
+                    print(f"Text delta for note {note.id} does not apply here: {message['ops']}")
+                note.text_version = message['version']
+                self._text_history(note.id).append(message['ops'])
+        elif kind == 'note_deleted':
+            self.notes.pop(message['noteId'], None)
+            self.dirty_notes.pop(message['noteId'], None)
+            self.text_history.pop(message['noteId'], None)
+        elif kind == 'group_updated':
+            group = message['group']
+            self.groups[group['id']] = GroupState(**{name: group[name] for name in GroupState.__slots__})
+        elif kind == 'group_deleted':
+            # Changes made here must not be replaced by the reloaded rows
+            await self.flush()
+            await self._reload_notes_and_groups()
+        elif kind == 'drawing_added':
+            stroke = StrokeState.from_dict(message['drawing'])
+            self.strokes[stroke.id] = stroke
+        elif kind == 'drawing_deleted':
+            self.strokes.pop(message['drawingId'], None)
+        self._snapshot = None
+
+    def set_order_keys(self, order_keys):
+        """Take the keys a rebalance wrote, given as ``{note id (str): key}``"""
+        for note_id, key in order_keys.items():
+            note = self.notes.get(int(note_id))
+            if note is not None:
+                note.order_key = key
+        self._snapshot = None
+
+    async def _apply_note_updated(self, message, user):
+        data = message.get('note')
+        if not isinstance(data, dict):
+            raise OpRejected('note is required')
+        note = self.notes.get(_item_id(data.get('id')))
+        if note is None:
+            raise OpRejected('Not found.')
+        changes = _clean_note(data)
+        if _rest_fields_differ(note, data):
+            await self._reload_rest_fields(note)
+        if changes.get('content', note.content) != note.content:
+            # Replaced wholesale: deltas against the old text no longer apply
+            note.text_version += 1
+            self.text_history.pop(note.id, None)
+        previous = self.dirty_notes.get(note.id, {})
+        for field, value in changes.items():
+            old = getattr(note, field)
+            if old != value:
+                previous.setdefault(field, old)
+                setattr(note, field, value)
+        if previous:
+            self.dirty_notes[note.id] = previous
+            self._editors['note', note.id] = user
+            self._schedule_flush()
+        return {'type': 'note_updated', 'note': note.as_dict(self.whiteboard_id)}
+
+    async def _apply_note_text(self, message, user):
+        note = self.notes.get(_item_id(message.get('noteId')))
+        if note is None:
+            raise OpRejected('Not found.')
+        resync = {'type': 'note_updated', 'note': note.as_dict(self.whiteboard_id)}
+        try:
+            ops = textops.clean(message.get('ops'))
+        except ValueError as exc:
+            raise OpRejected(str(exc), resync)
+        version = message.get('version')
+        history = self._text_history(note.id)
+        if not _count(version) or version > note.text_version or note.text_version - version > len(history):
+            raise OpRejected('The text changed too much meanwhile.', resync)
+        # Rebase onto the deltas applied since the client's version
+        for applied in list(history)[len(history) - (note.text_version - version):]:
+            ops, _ = textops.transform(ops, applied)
+        try:
+            content = textops.apply(note.content, ops)
+        except ValueError as exc:
+            raise OpRejected(str(exc), resync)
+
+        note.text_version += 1
+        history.append(ops)
+        if content != note.content:
+            self.dirty_notes.setdefault(note.id, {}).setdefault('content', note.content)
+            note.content = content
+            self._editors['note', note.id] = user
+            self._schedule_flush()
+        return {
+            'type': 'note_text', 'noteId': note.id, 'version': note.text_version, 'ops': ops,
+            # Lets the sender recognise its own delta
+            'client': message.get('client'),
+        }
+
+    async def _reload_rest_fields(self, note):
+        """Take a note's images, stacking and grouping from the database"""
+        fresh = (await sync_to_async(load_notes)(self.whiteboard_id, ids=[note.id])).get(note.id)
+        if fresh is None:
+            raise OpRejected('Not found.')
+        if fresh.note_group != note.note_group:
+            # Grouped or ungrouped: the API converted its geometry to the new frame
+            dirty = self.dirty_notes.get(note.id, {})
+            for field in GEOMETRY_FIELDS:
+                setattr(note, field, getattr(fresh, field))
+                dirty.pop(field, None)
+            if not dirty:
+                self.dirty_notes.pop(note.id, None)
+            if fresh.note_group is not None and fresh.note_group not in self.groups:
+                self.groups.update(await sync_to_async(load_groups)(self.whiteboard_id, ids=[fresh.note_group]))
+        for field in REST_NOTE_FIELDS:
+            setattr(note, field, getattr(fresh, field))
+        self._snapshot = None
+
+    def _text_history(self, note_id):
+        history = self.text_history.get(note_id)
+        if history is None:
+            history = self.text_history[note_id] = deque(maxlen=TEXT_HISTORY_KEPT)
+        return history
+
+    async def _apply_group_updated(self, message, user):
+        data = message.get('group')
+        if not isinstance(data, dict):
+            raise OpRejected('group is required')
+        group_id = _item_id(data.get('id'))
+        group = self.groups.get(group_id)
+        if group is None:
+            # Created through the REST API after the room was loaded
+            groups = await sync_to_async(load_groups)(self.whiteboard_id, ids=[group_id])
+            if not groups:
+                raise OpRejected('Not found.')
+            group = self.groups[group_id] = groups[group_id]
+        previous = self.dirty_groups.get(group.id, {})
+        for field, value in _clean_group(data).items():
+            old = getattr(group, field)
+            if old != value:
+                previous.setdefault(field, old)
+                setattr(group, field, value)
+        if previous:
+            self.dirty_groups[group.id] = previous
+            self._editors['group', group.id] = user
+            self._schedule_flush()
+        return {'type': 'group_updated', 'group': group.as_dict(self.whiteboard_id)}
+
+    async def _apply_note_added(self, message, user):
+        note_id = _item_id((message.get('note') or {}).get('id'))
+        # Created through the REST API; the database has the real thing
+        notes = await sync_to_async(load_notes)(self.whiteboard_id, ids=[note_id])
+        if not notes:
+            raise OpRejected('Not found.')
+        self.notes[note_id] = notes[note_id]
+        return {'type': 'note_added', 'note': notes[note_id].as_dict(self.whiteboard_id)}
+
+    async def _apply_note_deleted(self, message, user):
+        note_id = _item_id(message.get('noteId'))
+        if await StickyNote.objects.filter(id=note_id, whiteboard_id=self.whiteboard_id).aexists():
+            raise OpRejected('Delete the note through the API first.')
+        self.notes.pop(note_id, None)
+        self.dirty_notes.pop(note_id, None)
+        self.text_history.pop(note_id, None)
+        return {'type': 'note_deleted', 'noteId': note_id}
+
+    async def _apply_group_deleted(self, message, user):
+        group_id = _item_id(message.get('groupId'))
+        if await NoteGroup.objects.filter(id=group_id, whiteboard_id=self.whiteboard_id).aexists():
+            raise OpRejected('Delete the group through the API first.')
+        # Its members were converted back to board coordinates
+        await self.flush()
+        await self._reload_notes_and_groups()
+        return {'type': 'group_deleted', 'groupId': group_id}
+
+    async def _apply_drawing_added(self, message, user):
+        stroke_id = _item_id((message.get('drawing') or {}).get('id'))
+        strokes = await sync_to_async(load_strokes)(self.whiteboard_id, ids={stroke_id})
+        if not strokes:
+            raise OpRejected('Not found.')
+        self.strokes[stroke_id] = strokes[stroke_id]
+        return {'type': 'drawing_added', 'drawing': strokes[stroke_id].as_dict(self.whiteboard_id)}
+
+    async def _apply_drawing_deleted(self, message, user):
+        stroke_id = _item_id(message.get('drawingId'))
+        if await sync_to_async(_stroke_exists)(self.whiteboard_id, stroke_id):
+            raise OpRejected('Delete the drawing through the API first.')
+        self.strokes.pop(stroke_id, None)
+        return {'type': 'drawing_deleted', 'drawingId': stroke_id}
+
+    async def _reload_notes_and_groups(self):
+        notes = await sync_to_async(load_notes)(self.whiteboard_id)
+        self.groups = await sync_to_async(load_groups)(self.whiteboard_id)
+        # The texts were flushed, so the clients' text versions still hold
+        for note_id, note in notes.items():
+            if note_id in self.notes:
+                note.text_version = self.notes[note_id].text_version
+        self.notes = notes
+        self._snapshot = None
+
+    # Write-behind
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                settings.ROOM_FLUSH_SECONDS, lambda: self._spawn(self.flush())
+            )
+
+    async def flush(self):
+        """Write the changed notes and groups back; returns the rows written"""
+        async with self._lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            notes, groups, editors = self.dirty_notes, self.dirty_groups, self._editors
+            if not notes and not groups:
+                return 0
+            self.dirty_notes, self.dirty_groups, self._editors = {}, {}, {}
+
+            now = timezone.now()
+            note_rows = [
+                (note_id, {field: getattr(self.notes[note_id], field) for field in previous}, previous,
+                 self.notes[note_id].as_dict(self.whiteboard_id), editors.get(('note', note_id)))
+                for note_id, previous in notes.items() if note_id in self.notes
+            ]
+            group_rows = [
+                (group_id, {field: getattr(self.groups[group_id], field) for field in previous}, previous,
+                 self.groups[group_id].as_dict(self.whiteboard_id), editors.get(('group', group_id)))
+                for group_id, previous in groups.items() if group_id in self.groups
+            ]
+            try:
+                written = await sync_to_async(run_write)(write_changes, self.whiteboard_id, note_rows, group_rows, now)
+            except Exception as exc:
+                print(f'Flushing whiteboard {self.whiteboard_id} failed, retrying: {exc}')
+                # Keep the older previous values; changes made meanwhile are newer
+                for dirty, failed in [(self.dirty_notes, notes), (self.dirty_groups, groups)]:
+                    for item_id, previous in failed.items():
+                        dirty[item_id] = {**dirty.get(item_id, {}), **previous}
+                self._editors = {**editors, **self._editors}
+                self._schedule_flush()
+                return 0
+
+            updated_at = _datetime.to_representation(now)
+            for items, rows in [(self.notes, note_rows), (self.groups, group_rows)]:
+                for item_id, *_ in rows:
+                    if item_id in items:
+                        items[item_id].updated_at = updated_at
+            self._snapshot = None
+            ROOM_ROWS_FLUSHED.inc(written)
+            return written
+
+
+def _stroke_exists(whiteboard_id, stroke_id):
+    if Drawing.objects.filter(id=stroke_id, whiteboard_id=whiteboard_id).exists():
+        return True
+    layer, _ = find_compacted_stroke(DrawingLayer.objects.filter(whiteboard_id=whiteboard_id), stroke_id)
+    return layer is not None
+
+
+class RoomRegistry:
+    """The rooms of this process, by whiteboard id"""
+
+    def __init__(self):
+        self.rooms = {}
+        self._loading = {}
+
+    async def join(self, whiteboard_id):
+        """The board's room, loading it for the first client; None if the board does not exist"""
+        room = self.rooms.get(whiteboard_id)
+        if room is None:
+            # Clients joining while the board loads wait for the same load
+            loading = self._loading.get(whiteboard_id)
+            if loading is None:
+                loading = self._loading[whiteboard_id] = asyncio.ensure_future(sync_to_async(load_room)(whiteboard_id))
+                loading.add_done_callback(lambda _: self._loading.pop(whiteboard_id, None))
+            room = await asyncio.shield(loading)
+            if room is None:
+                return None
+            if whiteboard_id not in self.rooms:
+                self.rooms[whiteboard_id] = room
+                ROOMS_ACTIVE.inc()
+            room = self.rooms[whiteboard_id]
+        room.clients += 1
+        if room._evict_handle is not None:
+            room._evict_handle.cancel()
+            room._evict_handle = None
+        return room
+
+    async def leave(self, room):
+        """Flush and drop the room when the last client left
+
+        Without clients this process is out of the board's channel group and
+        misses other processes' ops and REST changes, so the next client gets
+        the board read afresh rather than a room that may be stale.
+        """
+        room.clients -= 1
+        if room.clients == 0:
+            await self.evict(room)
+
+    async def evict(self, room):
+        room._evict_handle = None
+        await room.flush()
+        if room.clients > 0:
+            return
+        if room.dirty_notes or room.dirty_groups:
+            # Writing back failed; keep the changes and try again later
+            if room._evict_handle is None:
+                room._evict_handle = asyncio.get_running_loop().call_later(
+                    settings.ROOM_IDLE_SECONDS, lambda: room._spawn(self.evict(room))
+                )
+            return
+        if self.rooms.get(room.whiteboard_id) is room:
+            del self.rooms[room.whiteboard_id]
+            ROOMS_ACTIVE.dec()
+
+
+rooms = RoomRegistry()
@@ -0,0 +1,210 @@
+"""
+Full-text search over sticky note content and links.
+
+The index lives next to the ``whiteboard_stickynote`` table and is kept up
+to date by the database itself, so every write path (ORM saves, bulk
+operations, imports) is indexed incrementally:
+
+* SQLite: an external-content FTS5 table maintained by triggers, ranked
+  with ``bm25()``.
+* PostgreSQL: a generated ``tsvector`` column with a GIN index, ranked with
+  ``ts_rank()``.
+
+Which one is used follows the database configured through
+``dj_database_url`` in settings. Other databases fall back to an
+unindexed ``icontains`` scan.
+
+The sharing dialog's user search uses the same approach: a trigram FTS5
+table on SQLite and ``pg_trgm`` indexes on PostgreSQL, with results ranked
+by recent collaboration and cached briefly per query.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q, Max
+
+from .models import StickyNote
+
+# Created by migrations 0009 (notes) and 0010 (users)
+FTS_TABLE = 'whiteboard_stickynote_fts'
+SEARCH_VECTOR_COLUMN = 'search_vector'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Querying
+
+def search_terms(query):
+    """Split a user query into plain word tokens (no search operators)"""
+    return _WORD_RE.findall(query)[:settings.SEARCH_MAX_TERMS]
+
+
+def _accessible_whiteboards_sql():
+    return (
+        "SELECT id FROM whiteboard_whiteboard WHERE owner_id = %s AND deleted_at IS NULL "
+        "UNION SELECT a.whiteboard_id FROM whiteboard_whiteboardaccess a "
+        "JOIN whiteboard_whiteboard w ON w.id = a.whiteboard_id WHERE a.user_id = %s AND w.deleted_at IS NULL"
+    )
+
+
+def _has_fts_table():
+    if not hasattr(connection, '_stickytux_has_fts'):
+        connection._stickytux_has_fts = FTS_TABLE in connection.introspection.table_names()
+    return connection._stickytux_has_fts
+
+
+def _ranked_ids_sqlite(terms, user, limit, offset):
+    # Every term must match, the last one as a prefix so results update while typing
+    match = ' '.join(f'"{term}"' for term in terms[:-1])
+    match = f'{match} "{terms[-1]}"*'.strip()
+    sql = (
+        f"SELECT n.id, bm25({FTS_TABLE}) AS rank "
+        f"FROM {FTS_TABLE} JOIN whiteboard_stickynote n ON n.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND n.whiteboard_id IN ({_accessible_whiteboards_sql()}) "
+        f"ORDER BY rank, n.id LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, user.id, user.id, limit, offset])
+        # bm25() is lower-is-better; flip it so higher rank means more relevant
+        return [(note_id, -rank) for note_id, rank in cursor.fetchall()]
+
+
+def _ranked_ids_postgresql(terms, user, limit, offset):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    sql = (
+        f"SELECT n.id, ts_rank(n.{SEARCH_VECTOR_COLUMN}, q) AS rank "
+        f"FROM whiteboard_stickynote n, to_tsquery(%s::regconfig, %s) q "
+        f"WHERE n.{SEARCH_VECTOR_COLUMN} @@ q AND n.whiteboard_id IN ({_accessible_whiteboards_sql()}) "
+        f"ORDER BY rank DESC, n.id LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [settings.SEARCH_CONFIG, tsquery, user.id, user.id, limit, offset])
+        return list(cursor.fetchall())
+
+
+def _ranked_ids_fallback(terms, user, limit, offset):
+    condition = Q()
+    for term in terms:
+        condition &= Q(content__icontains=term) | Q(link__icontains=term)
+    notes = StickyNote.objects.filter(
+        condition,
+        Q(whiteboard__owner=user) | Q(whiteboard__access_rights__user=user),
+        whiteboard__deleted_at__isnull=True,
+    ).distinct().order_by('-updated_at', 'id')
+    return [(note_id, 0.0) for note_id in notes.values_list('id', flat=True)[offset:offset + limit]]
+
+
+def search_notes(user, query, limit, offset=0):
+    """Return ``[(note, rank), ...]`` for notes the user can access, best match first"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'sqlite' and _has_fts_table():
+        ranked = _ranked_ids_sqlite(terms, user, limit, offset)
+    elif connection.vendor == 'postgresql':
+        ranked = _ranked_ids_postgresql(terms, user, limit, offset)
+    else:
+        ranked = _ranked_ids_fallback(terms, user, limit, offset)
+
+    notes = StickyNote.objects.select_related('whiteboard').in_bulk([note_id for note_id, _rank in ranked])
+    return [(notes[note_id], rank) for note_id, rank in ranked if note_id in notes]
+
+
+# User search (sharing dialog)
+
+USER_FTS_TABLE = 'whiteboard_user_fts'
+
+
+def _has_user_fts_table():
+    if not hasattr(connection, '_stickytux_has_user_fts'):
+        connection._stickytux_has_user_fts = USER_FTS_TABLE in connection.introspection.table_names()
+    return connection._stickytux_has_user_fts
+
+
+def _user_candidate_ids(query, exclude_id, limit):
+    """Ids of users whose username or email contains ``query``, via the search index"""
+    if connection.vendor == 'sqlite' and len(query) >= 3 and _has_user_fts_table():
+        phrase = '"' + query.replace('"', '""') + '"'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {USER_FTS_TABLE} WHERE {USER_FTS_TABLE} MATCH %s AND rowid != %s LIMIT %s",
+                [phrase, exclude_id, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    # Too short for trigrams (or no index): a plain scan, as before the index
+    users = User.objects.filter(Q(username__icontains=query) | Q(email__icontains=query))
+    return list(users.exclude(id=exclude_id).values_list('id', flat=True)[:limit])
+
+
+def _matching_collaborators(user, query):
+    """Map id -> when they last started sharing a board with ``user``, for collaborators matching ``query``
+
+    A requester only has a handful of collaborators, so they are matched
+    directly rather than picked out of the capped index candidates.
+    """
+    from .models import Whiteboard, WhiteboardAccess
+
+    def matches(prefix):
+        return Q(**{f'{prefix}username__icontains': query}) | Q(**{f'{prefix}email__icontains': query})
+
+    shared_boards = Whiteboard.objects.filter(Q(owner=user) | Q(access_rights__user=user)).values('id')
+    recency = {}
+    rows = (
+        WhiteboardAccess.objects.filter(matches('user__'), whiteboard__in=shared_boards)
+        .exclude(user=user)
+        .values('user_id').annotate(last=Max('created_at'))
+        .values_list('user_id', 'last')
+    )
+    owners = (
+        WhiteboardAccess.objects.filter(matches('whiteboard__owner__'), user=user)
+        .exclude(whiteboard__owner=user)
+        .values('whiteboard__owner_id').annotate(last=Max('created_at'))
+        .values_list('whiteboard__owner_id', 'last')
+    )
+    for user_id, last in list(rows) + list(owners):
+        if user_id not in recency or last > recency[user_id]:
+            recency[user_id] = last
+    return recency
+
+
+def search_users(user, query, limit=None):
+    """Users matching ``query``, recent collaborators of ``user`` first
+
+    Results are cached per requester and query for ``USER_SEARCH_CACHE_SECONDS``.
+    """
+    limit = limit or settings.USER_SEARCH_LIMIT
+    normalized = ' '.join(query.lower().split())
+    key = 'user_search:{}:{}:{}'.format(user.id, limit, hashlib.md5(normalized.encode()).hexdigest())
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    recency = _matching_collaborators(user, normalized)
+    candidate_ids = set(recency)
+    candidate_ids.update(_user_candidate_ids(normalized, user.id, settings.USER_SEARCH_CANDIDATES))
+    users = User.objects.filter(id__in=candidate_ids).only('id', 'username', 'email')
+
+    def sort_key(candidate):
+        last = recency.get(candidate.id)
+        return (
+            last is None,                                   # collaborators first,
+            -last.timestamp() if last else 0,               # most recent first,
+            not candidate.username.lower().startswith(normalized),  # then prefix matches
+            candidate.username.lower(),
+        )
+
+    results = [
+        {
+            'id': candidate.id,
+            'username': candidate.username,
+            'email': candidate.email,
+        }
+        for candidate in sorted(users, key=sort_key)[:limit]
+    ]
+    cache.set(key, results, settings.USER_SEARCH_CACHE_SECONDS)
+    return results
@@ -1,16 +1,47 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Whiteboard, WhiteboardAccess, StickyNote, StickyNoteImage, Drawing, CustomColor, WhiteboardViewSettings
+from .models import Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, CustomColor, WhiteboardViewSettings
+from .previews import preview_url
+from .compaction import compacted_strokes_data
+from .metrics import SerializerTimer
 
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer recording the time spent producing ``.data``"""
+    
+    @property
+    def data(self):
+        with SerializerTimer(f'{type(self.child).__name__}[]'):
+            return super().data
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer recording the time spent producing ``.data``
+    
+    Only top-level serializers are timed; nested ones are part of their
+    parent's time.
+    """
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.__dict__.get('Meta')
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+    
+    @property
+    def data(self):
+        with SerializerTimer(type(self).__name__):
+            return super().data
+
+
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'is_staff', 'is_active', 'date_joined']
         read_only_fields = ['date_joined']
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(TimedModelSerializer):
     """Serializer for creating/updating users with password handling"""
     password = serializers.CharField(write_only=True, required=False)
     
@@ -42,7 +73,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class WhiteboardAccessSerializer(serializers.ModelSerializer):
+class WhiteboardAccessSerializer(TimedModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -50,14 +81,14 @@ class WhiteboardAccessSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'role', 'created_at']
 
 
-class StickyNoteImageSerializer(serializers.ModelSerializer):
+class StickyNoteImageSerializer(TimedModelSerializer):
     class Meta:
         model = StickyNoteImage
         fields = ['id', 'image', 'order', 'created_at']
         read_only_fields = ['created_at']
 
 
-class StickyNoteSerializer(serializers.ModelSerializer):
+class StickyNoteSerializer(TimedModelSerializer):
     created_by = UserSerializer(read_only=True)
     images = StickyNoteImageSerializer(many=True, read_only=True)
     
@@ -65,13 +96,38 @@ class StickyNoteSerializer(serializers.ModelSerializer):
         model = StickyNote
         fields = [
             'id', 'whiteboard', 'content', 'image', 'images', 'link', 'color',
-            'x', 'y', 'width', 'height', 'group_id', 'z_index',
+            'x', 'y', 'width', 'height', 'group_id', 'note_group', 'z_index', 'order_key',
             'created_by', 'created_at', 'updated_at'
         ]
+        # order_key is changed through the reorder action, note_group through
+        # the note-groups endpoints (which convert coordinates)
+        read_only_fields = ['note_group', 'order_key', 'created_by', 'created_at', 'updated_at']
+
+
+class NoteGroupSerializer(TimedModelSerializer):
+    note_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+    
+    class Meta:
+        model = NoteGroup
+        fields = ['id', 'whiteboard', 'offset_x', 'offset_y', 'scale', 'note_ids', 'created_by', 'created_at', 'updated_at']
         read_only_fields = ['created_by', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'offset_x': {'required': False},
+            'offset_y': {'required': False},
+        }
+    
+    def validate_whiteboard(self, value):
+        if self.instance is not None and self.instance.whiteboard_id != value.id:
+            raise serializers.ValidationError('A group cannot be moved to another whiteboard')
+        return value
+    
+    def validate_scale(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Scale must be positive')
+        return value
 
 
-class DrawingSerializer(serializers.ModelSerializer):
+class DrawingSerializer(TimedModelSerializer):
     created_by = UserSerializer(read_only=True)
     
     class Meta:
@@ -80,26 +136,49 @@ class DrawingSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_by', 'created_at']
 
 
-class WhiteboardSerializer(serializers.ModelSerializer):
+class WhiteboardSerializer(TimedModelSerializer):
     owner = UserSerializer(read_only=True)
     sticky_notes = StickyNoteSerializer(many=True, read_only=True)
-    drawings = DrawingSerializer(many=True, read_only=True)
+    drawings = serializers.SerializerMethodField()
+    note_groups = NoteGroupSerializer(many=True, read_only=True)
     access_rights = WhiteboardAccessSerializer(many=True, read_only=True)
+    preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Whiteboard
-        fields = ['id', 'name', 'owner', 'sticky_notes', 'drawings', 'access_rights', 'background_color', 'created_at', 'updated_at']
-        read_only_fields = ['owner', 'created_at', 'updated_at']
+        fields = [
+            'id', 'name', 'owner', 'sticky_notes', 'drawings', 'note_groups', 'access_rights', 'background_color',
+            'is_template', 'version', 'preview_url', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['owner', 'version', 'created_at', 'updated_at']
+    
+    def get_drawings(self, obj):
+        # Old strokes are compacted into a few layer rows, recent ones are still Drawing rows
+        live = DrawingSerializer(obj.drawings.all(), many=True, context=self.context).data
+        return compacted_strokes_data(obj) + list(live)
+    
+    def get_preview_url(self, obj):
+        return preview_url(obj)
+
+
+class WhiteboardSummarySerializer(WhiteboardSerializer):
+    """A whiteboard without its notes, drawings, groups and access rights"""
+    
+    class Meta(WhiteboardSerializer.Meta):
+        fields = [
+            f for f in WhiteboardSerializer.Meta.fields
+            if f not in ('sticky_notes', 'drawings', 'note_groups', 'access_rights')
+        ]
 
 
-class CustomColorSerializer(serializers.ModelSerializer):
+class CustomColorSerializer(TimedModelSerializer):
     class Meta:
         model = CustomColor
         fields = ['id', 'name', 'nickname', 'hex_color', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
 
-class WhiteboardViewSettingsSerializer(serializers.ModelSerializer):
+class WhiteboardViewSettingsSerializer(TimedModelSerializer):
     class Meta:
         model = WhiteboardViewSettings
         fields = ['id', 'whiteboard', 'zoom', 'pan_x', 'pan_y', 'updated_at']
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Whiteboard, NoteGroup, StickyNote, Drawing
+from .previews import schedule_preview
+from .compaction import schedule_compaction
+from .tiles import invalidate_strokes
+from .auth_cache import forget_user
+
+
+def bump_whiteboard_version(whiteboard_id):
+    """Mark a whiteboard as changed so derived data (previews) gets refreshed"""
+    # queryset.update() does not send signals, so this cannot recurse
+    Whiteboard.objects.filter(id=whiteboard_id).update(version=F('version') + 1)
+    schedule_preview(whiteboard_id)
+
+
+@receiver(post_save, sender=Whiteboard)
+def whiteboard_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_whiteboard_version(instance.id)
+
+
+@receiver([post_save, post_delete], sender=StickyNote)
+@receiver([post_save, post_delete], sender=NoteGroup)
+@receiver([post_save, post_delete], sender=Drawing)
+def board_item_changed(sender, instance, raw=False, created=None, **kwargs):
+    if raw:
+        return
+    if sender is StickyNote and created is False and not instance.preview_changed():
+        # Text, link and image edits don't show in the preview
+        return
+    bump_whiteboard_version(instance.whiteboard_id)
+
+
+@receiver([post_save, post_delete], sender=Drawing)
+def drawing_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_strokes(instance.whiteboard_id, [(instance.path_data, instance.stroke_width)])
+
+
+@receiver(post_save, sender=Drawing)
+def drawing_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        schedule_compaction(instance.whiteboard_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers UserViewSet edits, password changes and the admin
+    forget_user(instance.id)
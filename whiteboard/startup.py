@@ -0,0 +1,203 @@
+"""
+Startup instrumentation and warm-up of the web workers.
+
+The autoscaler adds pods under load, so the time from process start to
+serving decides whether a spike is ridden out. backend/asgi.py times its
+phases (settings, app loading, the HTTP handler, ...) with ``phase()`` and
+finishes with ``warm_up()``, which connects to the databases and loads the
+URLconf, views, serializers and translations the first request would
+otherwise wait for. The readiness probe (/api/ready/) passes once the
+warm-up succeeded.
+
+The garbage collector is paused while loading: the thousands of classes
+and functions created by the imports trigger full collections that find
+nothing to free. The survivors are then frozen, so later collections skip
+them (and, with gunicorn's preload_app, forked workers don't touch, and
+thereby copy, the pages they live on).
+
+With ``STARTUP_PROFILE=True`` every module import is timed as well and the
+slowest modules and packages are printed when the process is ready; like
+``python -X importtime``, but grouped and available in a running pod.
+
+Only the standard library is imported at module level: this is loaded
+before Django is set up.
+"""
+import gc
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Modules listed in the STARTUP_PROFILE report
+REPORT_MODULES = 15
+
+_started = time.perf_counter()
+_phases = []
+_import_timer = None
+_ready = False
+_error = None
+
+
+class ImportTimer:
+    """Meta path finder recording how long every module takes to execute
+
+    It lets the other finders locate the module and wraps the ``exec_module``
+    of the loader they return; time spent importing submodules is kept
+    apart so that each module's own (self) time can be reported.
+    """
+
+    def __init__(self):
+        self.modules = {}  # name -> (total seconds, self seconds)
+        self._children = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        # Built-in and frozen modules share one loader class; only per-module
+        # loader instances can be wrapped without affecting other modules
+        loader = spec.loader
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+            loader.exec_module = self._timed(name, loader.exec_module)
+        return spec
+
+    def _timed(self, name, exec_module):
+        def exec_timed(module):
+            self._children.append(0.0)
+            started = time.perf_counter()
+            try:
+                return exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                children = self._children.pop()
+                if self._children:
+                    self._children[-1] += elapsed
+                self.modules[name] = (elapsed, elapsed - children)
+        return exec_timed
+
+    def packages(self):
+        """Self time summed per top-level package"""
+        totals = defaultdict(float)
+        for name, (_, own) in self.modules.items():
+            totals[name.partition('.')[0]] += own
+        return totals
+
+
+def begin():
+    """Start timing; called first thing by the ASGI/WSGI module"""
+    global _import_timer
+    gc.disable()
+    if os.environ.get('STARTUP_PROFILE', 'False') == 'True' and _import_timer is None:
+        _import_timer = ImportTimer()
+        sys.meta_path.insert(0, _import_timer)
+
+
+@contextmanager
+def phase(name):
+    """Record the duration of one startup phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - started))
+
+
+def warm_up():
+    """Connect to the databases and load what the first request would need
+
+    Returns True once it succeeded; a failure (e.g. the database is not
+    reachable yet) is kept for the readiness probe, which retries.
+    """
+    global _ready, _error
+    from django.conf import settings
+    from django.db import connections
+    from django.urls import get_resolver
+    from django.utils import translation
+
+    try:
+        with phase('warm-up: databases'):
+            for connection in connections.all():
+                opened = connection.connection is None
+                # Fails here, rather than in the first request, when the
+                # database is unreachable
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                # Requests run in other threads (or forked workers), which
+                # open their own
+                if opened:
+                    connection.close()
+        with phase('warm-up: urls and views'):
+            # Imports every view, and through them DRF and the serializers
+            get_resolver().url_patterns
+            _load_serializers()
+        with phase('warm-up: translations'):
+            translation.activate(settings.LANGUAGE_CODE)
+            translation.gettext('This field is required.')
+            translation.deactivate()
+    except Exception as exc:
+        _error = f'{exc.__class__.__name__}: {exc}'
+        return False
+    _ready = True
+    _error = None
+    return True
+
+
+def _load_serializers():
+    from django.apps import apps
+    from . import serializers
+
+    # ModelSerializer builds its fields from the model metadata, whose
+    # relation caches are filled on first use
+    for model in apps.get_models():
+        model._meta.get_fields()
+    for serializer_class in serializers.TimedModelSerializer.__subclasses__():
+        serializer_class().fields
+
+
+def is_ready():
+    """Whether the warm-up succeeded, retrying it if it did not"""
+    return _ready or warm_up()
+
+
+def status():
+    """Startup timings for the readiness probe"""
+    return {
+        'ready': _ready,
+        'error': _error,
+        'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in _phases},
+    }
+
+
+def finish():
+    """Resume garbage collection, record the startup time and print the report"""
+    from .metrics import STARTUP_SECONDS
+
+    gc.freeze()
+    gc.enable()
+    total = time.perf_counter() - _started
+    for name, seconds in _phases:
+        STARTUP_SECONDS.labels(name).observe(seconds)
+    STARTUP_SECONDS.labels('total').observe(total)
+
+    lines = [f"Process {os.getpid()} {'ready' if _ready else 'NOT ready'} after {total * 1000:.0f} ms"]
+    lines += [f'  {name:<28}{seconds * 1000:8.1f} ms' for name, seconds in _phases]
+    if _error:
+        lines.append(f'  warm-up failed: {_error}')
+    if _import_timer is not None:
+        sys.meta_path.remove(_import_timer)
+        modules = sorted(_import_timer.modules.items(), key=lambda item: item[1][1], reverse=True)
+        lines.append(f'  {len(modules)} modules imported; slowest by own time (total incl. submodules):')
+        lines += [
+            f'    {name:<48}{own * 1000:8.1f} ms ({total_seconds * 1000:.1f})'
+            for name, (total_seconds, own) in modules[:REPORT_MODULES]
+        ]
+        lines.append('  by package:')
+        packages = sorted(_import_timer.packages().items(), key=lambda item: item[1], reverse=True)
+        lines += [f'    {name:<48}{own * 1000:8.1f} ms' for name, own in packages[:REPORT_MODULES]]
+    print('\n'.join(lines), file=sys.stderr, flush=True)
@@ -0,0 +1,234 @@
+"""
+Database-backed background tasks, run by ``manage.py run_worker``.
+
+A task is a registered function taking JSON-serializable arguments.
+``enqueue()`` stores a call in the ``BackgroundTask`` table as part of the
+current transaction, so it is only visible to workers once the change that
+needed it commits, and is never lost when a web process restarts. Identical
+pending calls are de-duplicated: enqueueing "render the preview of board 42"
+while one is already waiting just raises its priority or moves it earlier.
+
+Workers claim the pending task with the highest priority whose ``run_after``
+has passed; failures are retried with exponential backoff until
+``max_attempts`` is reached. No broker is needed, only the database.
+
+Models are imported inside functions: the registry is used by modules that
+models.py itself imports, and by pool processes before Django is set up.
+"""
+import hashlib
+import importlib
+import json
+import signal
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+_registry = {}
+
+
+class TaskSpec:
+    """A registered task function and its queueing options"""
+
+    def __init__(self, func, name, priority=0, max_attempts=None, retry_delay=None):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def enqueue(self, *args, priority=None, delay=0):
+        return enqueue(self.name, *args, priority=priority, delay=delay)
+
+
+def task_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def register(func, name=None, priority=0, max_attempts=None, retry_delay=None):
+    """Make ``func`` runnable by workers; returns its TaskSpec"""
+    spec = TaskSpec(func, name or task_name(func), priority, max_attempts, retry_delay)
+    _registry[spec.name] = spec
+    return spec
+
+
+def task(func=None, **options):
+    """Decorator registering a task; adds ``func.enqueue(*args, priority=, delay=)``"""
+    def decorator(func):
+        func.enqueue = register(func, **options).enqueue
+        return func
+    return decorator(func) if func is not None else decorator
+
+
+def get_task(name):
+    """The TaskSpec registered under ``name``, importing its module if needed"""
+    if name not in _registry:
+        module = name.rsplit('.', 1)[0]
+        while module and name not in _registry:
+            try:
+                importlib.import_module(module)
+                break
+            except ImportError:
+                module = module.rpartition('.')[0]
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'Unknown task {name!r}') from None
+
+
+def dedup_key(name, args):
+    payload = json.dumps([name, list(args)], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue(task, *args, priority=None, delay=0):
+    """Queue a call of ``task`` (a TaskSpec, registered function or name)
+
+    Returns the pending BackgroundTask, which is an existing one if an
+    identical call was already waiting.
+    """
+    from .models import BackgroundTask
+
+    if isinstance(task, TaskSpec):
+        spec = task
+    else:
+        spec = get_task(task if isinstance(task, str) else task_name(task))
+    priority = spec.priority if priority is None else priority
+    run_after = timezone.now() + timedelta(seconds=delay)
+    key = dedup_key(spec.name, args)
+    pending = BackgroundTask.objects.filter(dedup_key=key, status='pending')
+
+    while True:
+        if pending.exists():
+            pending.filter(priority__lt=priority).update(priority=priority)
+            pending.filter(run_after__gt=run_after).update(run_after=run_after)
+            existing = pending.first()
+            if existing is not None:
+                return existing
+        try:
+            with transaction.atomic():
+                return BackgroundTask.objects.create(
+                    name=spec.name,
+                    args=list(args),
+                    priority=priority,
+                    dedup_key=key,
+                    max_attempts=spec.max_attempts or settings.TASK_MAX_ATTEMPTS,
+                    run_after=run_after,
+                )
+        except IntegrityError:
+            # Someone else queued the same call just now; merge into theirs
+            continue
+
+
+def claim_next(worker):
+    """Mark the next due task as running by ``worker`` and return it, or None"""
+    from .models import BackgroundTask
+
+    now = timezone.now()
+    candidates = BackgroundTask.objects.filter(
+        status='pending', run_after__lte=now
+    ).order_by('-priority', 'run_after', 'id').values_list('id', flat=True)[:10]
+    for task_id in candidates:
+        # Conditional update, so two workers never claim the same task
+        claimed = BackgroundTask.objects.filter(id=task_id, status='pending').update(
+            status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return BackgroundTask.objects.get(id=task_id)
+    return None
+
+
+def execute(name, args):
+    """Run a task in this process; returns None or the formatted error"""
+    close_old_connections()
+    try:
+        get_task(name).func(*args)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def complete(task, error=None):
+    """Record the outcome of a claimed task, scheduling a retry if it failed"""
+    from .models import BackgroundTask
+
+    now = timezone.now()
+    claimed = BackgroundTask.objects.filter(id=task.id, status='running')
+    if error is None:
+        claimed.update(status='done', finished_at=now, last_error='')
+        return 'done'
+
+    try:
+        spec = get_task(task.name)
+    except LookupError:
+        spec = None
+    if spec is not None and task.attempts < task.max_attempts:
+        retry_delay = spec.retry_delay or settings.TASK_RETRY_DELAY_SECONDS
+        try:
+            with transaction.atomic():
+                claimed.update(
+                    status='pending',
+                    run_after=now + timedelta(seconds=retry_delay * 2 ** (task.attempts - 1)),
+                    locked_by='',
+                    locked_at=None,
+                    last_error=error,
+                )
+            return 'retry'
+        except IntegrityError:
+            # An identical call was queued meanwhile and will do the work
+            error = f'{error}\nNot retried: an identical call is already pending'
+    claimed.update(status='failed', finished_at=now, last_error=error)
+    return 'failed'
+
+
+def run_task(task):
+    """Execute a claimed task inline and record the outcome"""
+    return complete(task, execute(task.name, task.args))
+
+
+def run_pending(worker='inline'):
+    """Run due tasks inline until none is left; returns how many ran"""
+    count = 0
+    while (task := claim_next(worker)) is not None:
+        run_task(task)
+        count += 1
+    return count
+
+
+def reclaim_stale(timeout=None):
+    """Fail (and so possibly retry) running tasks whose worker has gone away"""
+    from .models import BackgroundTask
+
+    timeout = timeout or settings.TASK_TIMEOUT_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = list(BackgroundTask.objects.filter(status='running', locked_at__lt=cutoff))
+    for task in stale:
+        complete(task, f'No result from {task.locked_by} after {timeout}s')
+    return len(stale)
+
+
+def delete_finished(days=None):
+    """Delete done and failed tasks older than ``days``"""
+    from .models import BackgroundTask
+
+    days = settings.TASK_KEEP_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = BackgroundTask.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def init_process():
+    """Initializer of the worker pool processes"""
+    import django
+
+    # Ctrl-C reaches the whole process group; let the parent shut down cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
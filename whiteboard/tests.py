@@ -1,8 +1,68 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedSessionStore
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Whiteboard, WhiteboardAccess, StickyNote, Drawing
+from PIL import Image
+from .models import Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, DrawingLayer, DrawingTile, BoardOperation, BoardSnapshot, BackgroundTask, WhiteboardViewSettings
+from .previews import parse_path_data, render_preview
+from .ordering import key_between, evenly_spaced_keys, is_valid_key, rebalance_board
+from .compaction import compact_board, compact_board_fully, find_compacted_stroke, restore_stroke
+from .oplog import load_state, take_snapshot, prune_board, record_operation
+from .replicas import PIN_COOKIE
+from .background import WriteQueue
+from .purge import purge_board
+from .transfer import duplicate_board
+from . import oplog, startup, tasks
+from .metrics import REGISTRY
+from .routing import websocket_urlpatterns
+from .rooms import rooms
+from . import textops
+from .tiles import render_tiles, tile_name
+from .auth_cache import user_cache_key
+from .view_settings import buffer as view_settings_buffer
+from .serializers import StickyNoteSerializer, NoteGroupSerializer
+
+_media_override = None
+
+
+def setUpModule():
+    # Previews and tiles are rendered on every save; keep them out of the real media
+    global _media_override
+    _media_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    _media_override.enable()
+
+
+def tearDownModule():
+    media_root = settings.MEDIA_ROOT
+    _media_override.disable()
+    shutil.rmtree(media_root, ignore_errors=True)
 
 
 class WhiteboardModelTests(TestCase):
@@ -105,3 +165,2131 @@ class WhiteboardAPITests(TestCase):
         response = self.client.get('/api/whiteboards/')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+
+
+
+class WhiteboardPreviewTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Preview', owner=self.user, background_color='#000000')
+        
+    def test_parse_path_data(self):
+        """Test parsing canvas path data into points"""
+        self.assertEqual(parse_path_data('M 1,2 L 3.5,-4 L 5e1,6'), [(1, 2), (3.5, -4), (50, 6)])
+        
+    def test_version_bumped_on_changes(self):
+        """Test that board changes bump the whiteboard version"""
+        version = Whiteboard.objects.get(id=self.whiteboard.id).version
+        note = StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 10,10', created_by=self.user)
+        note.delete()
+        self.assertEqual(Whiteboard.objects.get(id=self.whiteboard.id).version, version + 3)
+        
+    def test_stale_instance_keeps_version(self):
+        """Test that saving a whiteboard loaded before other changes doesn't reset its version"""
+        stale = Whiteboard.objects.get(id=self.whiteboard.id)
+        StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+        Whiteboard.objects.filter(id=self.whiteboard.id).update(preview_version=stale.version + 1)
+        
+        stale.name = 'Renamed'
+        stale.save()
+        stale.save(update_fields=['version', 'preview_version'])
+        whiteboard = Whiteboard.objects.get(id=self.whiteboard.id)
+        self.assertEqual(whiteboard.name, 'Renamed')
+        # One bump for the note, one for the rename
+        self.assertEqual((whiteboard.version, whiteboard.preview_version), (stale.version + 2, stale.version + 1))
+        
+    def test_text_edits_skip_version_bump(self):
+        """Test that note saves only touch the whiteboard row when the preview would change"""
+        note = StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+        version = Whiteboard.objects.get(id=self.whiteboard.id).version
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(f'/api/sticky-notes/{note.id}/', {'content': 'typing'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "whiteboard_whiteboard"')])
+        self.assertEqual(Whiteboard.objects.get(id=self.whiteboard.id).version, version)
+        
+        self.client.patch(f'/api/sticky-notes/{note.id}/', {'content': 'moved', 'x': 50}, format='json')
+        self.assertEqual(Whiteboard.objects.get(id=self.whiteboard.id).version, version + 1)
+        
+    def test_render_preview(self):
+        """Test rasterizing notes, drawings and background"""
+        StickyNote.objects.create(whiteboard=self.whiteboard, color='pink', x=0, y=0, width=100, height=100, created_by=self.user)
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,200 L 400,300', created_by=self.user)
+        
+        with override_settings(PREVIEW_FORMAT='PNG', PREVIEW_SIZE=(64, 48)):
+            image = Image.open(io.BytesIO(render_preview(self.whiteboard)))
+        self.assertEqual(image.format, 'PNG')
+        self.assertEqual(image.size, (64, 48))
+        colors = {color for _count, color in image.convert('RGB').getcolors()}
+        self.assertIn((0, 0, 0), colors)
+        self.assertIn((0xff, 0xb3, 0xe6), colors)
+        
+    def test_preview_endpoint_caches_render(self):
+        """Test the preview action renders once and exposes preview_url"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/preview/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            
+            whiteboard = Whiteboard.objects.get(id=self.whiteboard.id)
+            self.assertEqual(whiteboard.preview_version, whiteboard.version)
+            
+            response = self.client.get('/api/whiteboards/')
+            self.assertTrue(response.data[0]['preview_url'].endswith(f'?v={whiteboard.version}'))
+
+
+
+def read_stream(response):
+    """The body of a streaming response with an async iterator"""
+    async def read():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(read)()
+
+
+def png_bytes(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class WhiteboardTransferTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Source', owner=self.user, background_color='#123456')
+        
+    def test_export_import_roundtrip(self):
+        """Test that a board survives a streamed export and import"""
+        with override_settings(MEDIA_ROOT=self.media_root, BOARD_TRANSFER_CHUNK_SIZE=2):
+            notes = [
+                StickyNote.objects.create(whiteboard=self.whiteboard, content=f'Note {i}', x=i, created_by=self.other)
+                for i in range(5)
+            ]
+            StickyNoteImage.objects.create(sticky_note=notes[1], image=ContentFile(png_bytes(), name='pic.png'))
+            Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 1,1', created_by=self.user)
+            WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=self.other, role='edit')
+            
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/export/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # Streamed as it is produced under ASGI, not read to the end first
+            self.assertTrue(response.is_async)
+            archive = read_stream(response)
+            
+            response = self.client.post(
+                '/api/whiteboards/import/',
+                {'archive': SimpleUploadedFile('board.tar.gz', archive), 'name': 'Copy'},
+                format='multipart'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            
+            copy = Whiteboard.objects.get(id=response.data['id'])
+            self.assertEqual(copy.name, 'Copy')
+            self.assertEqual(copy.background_color, '#123456')
+            self.assertEqual(
+                list(copy.sticky_notes.order_by('x').values_list('content', flat=True)),
+                [f'Note {i}' for i in range(5)]
+            )
+            self.assertEqual(copy.sticky_notes.first().created_by, self.other)
+            self.assertEqual(copy.drawings.count(), 1)
+            self.assertEqual(copy.access_rights.get().user, self.other)
+            
+            image = StickyNoteImage.objects.get(sticky_note__whiteboard=copy)
+            self.assertEqual(image.sticky_note.content, 'Note 1')
+            with image.image.open('rb') as f:
+                self.assertEqual(f.read(), png_bytes())
+            
+    def archive(self, members):
+        """A board archive with the given ``{name: records or bytes}`` after the manifest"""
+        buffer = io.BytesIO()
+        manifest = {'format': 'stickytux-board', 'version': 1, 'whiteboard': {'name': 'Crafted'}}
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for name, content in [('manifest.json', json.dumps(manifest).encode()), *members.items()]:
+                if isinstance(content, list):
+                    content = '\n'.join(json.dumps(record) for record in content).encode()
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return SimpleUploadedFile('board.tar.gz', buffer.getvalue())
+        
+    def test_import_rekeys_old_order_keys(self):
+        """Test that mixed-case order keys from older archives are replaced, keeping the stack"""
+        archive = self.archive({'notes/000000.ndjson': [
+            {'id': 1, 'content': 'top', 'order_key': 'a'},
+            {'id': 2, 'content': 'bottom', 'order_key': 'A'},
+            {'id': 3, 'content': 'middle', 'order_key': 'V'},
+        ]})
+        response = self.client.post('/api/whiteboards/import/', {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        keys = list(StickyNote.objects.filter(whiteboard_id=response.data['id']).values_list('order_key', 'content'))
+        self.assertEqual([content for _, content in sorted(keys)], ['bottom', 'middle', 'top'])
+        self.assertTrue(all(is_valid_key(key) for key, _ in keys))
+        
+    def test_import_only_links_media_from_the_archive(self):
+        """Test that notes cannot be pointed at files already in storage"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            secret = StickyNoteImage.objects.create(
+                sticky_note=StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.other),
+                image=ContentFile(b'private', name='secret.png'),
+            )
+            archive = self.archive({
+                'notes/000000.ndjson': [
+                    {'id': 1, 'content': 'Stolen', 'image': secret.image.name},
+                    {'id': 2, 'content': 'Own', 'image': 'sticky_notes/own.png'},
+                ],
+                'media/sticky_notes/own.png': png_bytes('blue'),
+                'images/000000.ndjson': [
+                    {'id': 1, 'sticky_note_id': 1, 'image': secret.image.name},
+                    {'id': 2, 'sticky_note_id': 2, 'image': 'sticky_notes/own.png'},
+                ],
+            })
+            response = self.client.post('/api/whiteboards/import/', {'archive': archive}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            
+            copy = Whiteboard.objects.get(id=response.data['id'])
+            stolen = copy.sticky_notes.get(content='Stolen')
+            own = copy.sticky_notes.get(content='Own')
+            self.assertFalse(stolen.image)
+            self.assertFalse(stolen.images.exists())
+            self.assertNotEqual(own.image.name, secret.image.name)
+            with own.image.open('rb') as f:
+                self.assertEqual(f.read(), png_bytes('blue'))
+            self.assertEqual(own.images.get().image.name, own.image.name)
+            
+    def test_import_keeps_only_used_images(self):
+        """Test that media files are checked as images, renamed, and dropped unless a record uses them"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            archive = self.archive({
+                'notes/000000.ndjson': [
+                    {'id': 1, 'content': 'Page', 'image': 'sticky_notes/page.html'},
+                    {'id': 2, 'content': 'Fake', 'image': 'sticky_notes/fake.png'},
+                    {'id': 3, 'content': 'Real'},
+                ],
+                'media/sticky_notes/page.html': b'<script>alert(1)</script>',
+                'media/sticky_notes/fake.png': b'<svg onload="alert(1)"/>',
+                'media/sticky_notes/photo.svg': png_bytes(),
+                'media/sticky_notes/unused.png': png_bytes('green'),
+                'images/000000.ndjson': [{'id': 1, 'sticky_note_id': 3, 'image': 'sticky_notes/photo.svg'}],
+            })
+            response = self.client.post('/api/whiteboards/import/', {'archive': archive}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            
+            copy = Whiteboard.objects.get(id=response.data['id'])
+            self.assertFalse(copy.sticky_notes.exclude(image='').exclude(image__isnull=True).exists())
+            stored = copy.sticky_notes.get(content='Real').images.get().image.name
+            self.assertRegex(stored, r'^sticky_notes/[0-9a-f]{32}\.png$')
+            self.assertEqual(os.listdir(os.path.join(self.media_root, 'sticky_notes')), [os.path.basename(stored)])
+            
+    def test_import_rejects_bad_field_values(self):
+        """Test that records with values of the wrong type are a 400, not a 500"""
+        for record in ({'id': 1, 'x': 'left'}, {'id': 1, 'width': None}, 'not a record'):
+            archive = self.archive({'notes/000000.ndjson': [record]})
+            response = self.client.post('/api/whiteboards/import/', {'archive': archive}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, record)
+        self.assertFalse(Whiteboard.objects.filter(name='Crafted').exists())
+        
+    def test_export_writes_shared_media_once(self):
+        """Test that a file used by several notes is in the archive once"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            notes = [StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.user) for _ in range(3)]
+            image = StickyNoteImage.objects.create(sticky_note=notes[0], image=ContentFile(b'bytes', name='shared.png'))
+            for note in notes[1:]:
+                StickyNoteImage.objects.create(sticky_note=note, image=image.image.name)
+            StickyNote.objects.filter(id=notes[0].id).update(image=image.image.name)
+            
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/export/')
+            with tarfile.open(fileobj=io.BytesIO(read_stream(response)), mode='r:gz') as tar:
+                names = [member.name for member in tar.getmembers()]
+            self.assertEqual(names.count(f'media/{image.image.name}'), 1)
+            
+    def test_import_rejects_invalid_archive(self):
+        """Test that garbage uploads are rejected"""
+        response = self.client.post(
+            '/api/whiteboards/import/',
+            {'archive': SimpleUploadedFile('board.tar.gz', b'not an archive')},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class StickyNoteOrderingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        
+    def make_board(self, size):
+        whiteboard = Whiteboard.objects.create(name=f'Board {size}', owner=self.user)
+        keys = evenly_spaced_keys(size)
+        StickyNote.objects.bulk_create([
+            StickyNote(whiteboard=whiteboard, created_by=self.user, order_key=key)
+            for key in keys
+        ])
+        return whiteboard
+        
+    def stack(self, whiteboard):
+        return list(whiteboard.sticky_notes.order_by('order_key', 'id').values_list('id', flat=True))
+        
+    def test_key_between(self):
+        """Test that generated keys always sort strictly between their bounds"""
+        keys = [key_between(None, None)]
+        for _ in range(200):
+            keys.append(key_between(keys[-1], None))
+            keys.insert(0, key_between(None, keys[0]))
+            keys.insert(len(keys) // 2, key_between(keys[len(keys) // 2 - 1], keys[len(keys) // 2]))
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+        
+    def test_new_notes_stack_on_top(self):
+        """Test that notes created through the API go on top"""
+        whiteboard = self.make_board(3)
+        response = self.client.post('/api/sticky-notes/', {'whiteboard': whiteboard.id, 'content': 'new'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stack(whiteboard)[-1], response.data['id'])
+        
+    def test_reorder_positions(self):
+        """Test front, back, above and below moves"""
+        whiteboard = self.make_board(4)
+        a, b, c, d = self.stack(whiteboard)
+        
+        self.client.post(f'/api/sticky-notes/{a}/reorder/', {'position': 'front'})
+        self.assertEqual(self.stack(whiteboard), [b, c, d, a])
+        self.client.post(f'/api/sticky-notes/{a}/reorder/', {'position': 'back'})
+        self.assertEqual(self.stack(whiteboard), [a, b, c, d])
+        self.client.post(f'/api/sticky-notes/{a}/reorder/', {'above': c})
+        self.assertEqual(self.stack(whiteboard), [b, c, a, d])
+        self.client.post(f'/api/sticky-notes/{d}/reorder/', {'below': b})
+        self.assertEqual(self.stack(whiteboard), [d, b, c, a])
+        
+    def test_reorder_cost_is_constant(self):
+        """Test that a reorder runs the same queries and writes one note regardless of board size"""
+        costs = []
+        for size in (10, 500):
+            whiteboard = self.make_board(size)
+            bottom = self.stack(whiteboard)[0]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(f'/api/sticky-notes/{bottom}/reorder/', {'position': 'front'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.stack(whiteboard)[-1], bottom)
+            note_writes = [
+                q['sql'] for q in ctx.captured_queries
+                if q['sql'].startswith('UPDATE "whiteboard_stickynote"')
+            ]
+            self.assertEqual(len(note_writes), 1)
+            costs.append(len(ctx.captured_queries))
+        self.assertEqual(costs[0], costs[1])
+        
+    def test_front_and_back_moves_grow_keys_slowly(self):
+        """Test that repeated moves to the front or back add a character only every few dozen moves"""
+        top = bottom = key_between(None, None)
+        for _ in range(500):
+            top = key_between(top, None)
+            bottom = key_between(None, bottom)
+        self.assertLess(bottom, top)
+        self.assertLessEqual(max(len(top), len(bottom)), 16)
+        
+    def test_invalid_bounds_raise_value_error(self):
+        """Test that keys outside the alphabet or with nothing below them are rejected cleanly"""
+        for before, after in [('', '0'), ('A', None), (None, 'aB'), ('b', 'a')]:
+            with self.assertRaises(ValueError):
+                key_between(before, after)
+        
+    def test_reorder_with_foreign_keys_repairs_the_board(self):
+        """Test that a board with keys from the old alphabet answers 409 and is re-keyed"""
+        whiteboard = Whiteboard.objects.create(name='Legacy', owner=self.user)
+        notes = StickyNote.objects.bulk_create([
+            StickyNote(whiteboard=whiteboard, created_by=self.user, order_key=key) for key in ('A', 'V', 'a')
+        ])
+        with mock.patch('whiteboard.views.schedule_rebalance') as schedule:
+            response = self.client.post(f'/api/sticky-notes/{notes[2].id}/reorder/', {'position': 'back'})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        schedule.assert_called_once_with(whiteboard.id)
+        
+    def test_rebalance_bumps_version_and_broadcasts_keys(self):
+        """Test that re-keying a board refreshes its version and tells its sockets"""
+        whiteboard = self.make_board(3)
+        StickyNote.objects.filter(whiteboard=whiteboard).update(order_key='i' * 40)
+        version = Whiteboard.objects.get(id=whiteboard.id).version
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'whiteboard_{whiteboard.id}', channel)
+        
+        self.assertEqual(rebalance_board(whiteboard.id), 3)
+        
+        self.assertGreater(Whiteboard.objects.get(id=whiteboard.id).version, version)
+        keys = dict(whiteboard.sticky_notes.values_list('id', 'order_key'))
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event, {
+            'type': 'notes_reordered', 'order_keys': {str(note_id): key for note_id, key in keys.items()},
+        })
+        self.assertTrue(all(len(key) == 1 for key in keys.values()))
+
+
+
+class NoteGroupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Groups', owner=self.user)
+        self.notes = [
+            StickyNote.objects.create(whiteboard=self.whiteboard, x=100 + i * 50, y=200, width=40, height=40, created_by=self.user)
+            for i in range(3)
+        ]
+        
+    def test_group_converts_to_relative_coordinates(self):
+        """Test that grouping anchors the group at the members' top-left corner"""
+        response = self.client.post('/api/note-groups/', {
+            'whiteboard': self.whiteboard.id,
+            'note_ids': [n.id for n in self.notes],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['offset_x'], response.data['offset_y']), (100, 200))
+        self.assertEqual(
+            list(StickyNote.objects.order_by('id').values_list('x', 'y', 'note_group')),
+            [(i * 50, 0, response.data['id']) for i in range(3)]
+        )
+        
+        # Deleting the board still cascades through grouped notes
+        self.whiteboard.delete()
+        self.assertFalse(NoteGroup.objects.exists())
+        
+    def test_group_move_is_single_write(self):
+        """Test that moving and scaling a group only writes the group row"""
+        group = NoteGroup.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+        StickyNote.objects.filter(whiteboard=self.whiteboard).update(note_group=group)
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(f'/api/note-groups/{group.id}/', {'offset_x': 500, 'scale': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        note_writes = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "whiteboard_stickynote"')]
+        self.assertEqual(note_writes, [])
+        
+    def test_ungroup_restores_absolute_coordinates(self):
+        """Test that ungrouping applies the group transform to its members"""
+        response = self.client.post('/api/note-groups/', {
+            'whiteboard': self.whiteboard.id,
+            'note_ids': [n.id for n in self.notes],
+        }, format='json')
+        group_id = response.data['id']
+        self.client.patch(f'/api/note-groups/{group_id}/', {'offset_x': 1000, 'scale': 2}, format='json')
+        
+        response = self.client.post(f'/api/note-groups/{group_id}/ungroup/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(NoteGroup.objects.filter(id=group_id).exists())
+        self.assertEqual(
+            list(StickyNote.objects.order_by('id').values_list('x', 'y', 'width', 'note_group')),
+            [(1000 + i * 100, 200, 80, None) for i in range(3)]
+        )
+        
+    def test_grouping_bumps_version_after_converting_members(self):
+        """Test that group and ungroup refresh the board version once the members are rewritten"""
+        with mock.patch('whiteboard.views.bump_whiteboard_version') as bump:
+            response = self.client.post('/api/note-groups/', {
+                'whiteboard': self.whiteboard.id,
+                'note_ids': [n.id for n in self.notes],
+            }, format='json')
+            bump.assert_called_once_with(self.whiteboard.id)
+            self.client.post(f"/api/note-groups/{response.data['id']}/ungroup/")
+            self.assertEqual(bump.call_count, 2)
+        
+    def test_cannot_group_notes_twice(self):
+        """Test that notes already in a group are rejected"""
+        data = {'whiteboard': self.whiteboard.id, 'note_ids': [self.notes[0].id]}
+        self.client.post('/api/note-groups/', data, format='json')
+        response = self.client.post('/api/note-groups/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class NoteSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.mine = Whiteboard.objects.create(name='Mine', owner=self.user)
+        self.shared = Whiteboard.objects.create(name='Shared', owner=self.other)
+        self.private = Whiteboard.objects.create(name='Private', owner=self.other)
+        WhiteboardAccess.objects.create(whiteboard=self.shared, user=self.user, role='view')
+        
+    def note(self, whiteboard, content, link=None):
+        return StickyNote.objects.create(whiteboard=whiteboard, content=content, link=link, created_by=whiteboard.owner)
+        
+    def search(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+        
+    def test_search_only_accessible_boards(self):
+        """Test that results come from owned and shared boards only"""
+        mine = self.note(self.mine, 'Quarterly roadmap review')
+        shared = self.note(self.shared, 'Roadmap dependencies')
+        self.note(self.private, 'Secret roadmap')
+        
+        ids = {r['id'] for r in self.search('roadmap')['results']}
+        self.assertEqual(ids, {mine.id, shared.id})
+        
+    def test_search_prefix_links_and_ranking(self):
+        """Test prefix matching, link matching and relevance ordering"""
+        once = self.note(self.mine, 'a budget note with plenty of other words in it')
+        twice = self.note(self.mine, 'budget budget')
+        link = self.note(self.mine, 'see docs', link='https://example.com/budgeting')
+        
+        results = self.search('budg')['results']
+        self.assertEqual({r['id'] for r in results}, {once.id, twice.id, link.id})
+        self.assertEqual(results[0]['id'], twice.id)
+        
+    def test_index_follows_updates_and_deletes(self):
+        """Test that the index is maintained incrementally on write"""
+        note = self.note(self.mine, 'alpha')
+        note.content = 'beta'
+        note.save()
+        self.assertEqual(self.search('alpha')['results'], [])
+        self.assertEqual([r['id'] for r in self.search('beta')['results']], [note.id])
+        
+        StickyNote.objects.filter(id=note.id).update(content='gamma')
+        self.assertEqual([r['id'] for r in self.search('gamma')['results']], [note.id])
+        note.delete()
+        self.assertEqual(self.search('gamma')['results'], [])
+        
+    def test_search_pagination(self):
+        """Test paging through results"""
+        for i in range(5):
+            self.note(self.mine, f'retro item {i}')
+        first = self.search('retro', page_size=2)
+        last = self.search('retro', page_size=2, page=3)
+        self.assertTrue(first['has_next'])
+        self.assertEqual(len(first['results']), 2)
+        self.assertFalse(last['has_next'])
+        self.assertEqual(len(last['results']), 1)
+        
+    def test_search_ignores_operators(self):
+        """Test that search syntax in the query cannot break the index query"""
+        self.note(self.mine, 'plain text')
+        self.assertEqual(self.search('"plain" (text* -')['results'][0]['content'], 'plain text')
+
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.stranger = User.objects.create_user(username='annabel', email='annabel@example.com', password='pass')
+        self.colleague = User.objects.create_user(username='joanna', email='jo@example.com', password='pass')
+        self.recent = User.objects.create_user(username='hannah', email='h@example.com', password='pass')
+        
+    def search(self, q):
+        response = self.client.get('/api/users/search/', {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [u['username'] for u in response.data]
+        
+    def test_substring_and_prefix_search(self):
+        """Test substring matches on username and email, and short prefix queries"""
+        self.assertEqual(self.search('anna'), ['annabel', 'hannah', 'joanna'])
+        self.assertEqual(self.search('EXAMPLE.com'), ['annabel', 'hannah', 'joanna'])
+        self.assertEqual(self.search('jo'), ['joanna'])
+        self.assertEqual(self.search('test'), [])
+        
+    def test_recent_collaborators_first(self):
+        """Test that users sharing boards with the requester rank first, most recent first"""
+        board = Whiteboard.objects.create(name='Board', owner=self.user)
+        WhiteboardAccess.objects.create(whiteboard=board, user=self.colleague, role='edit')
+        other_board = Whiteboard.objects.create(name='Other', owner=self.recent)
+        WhiteboardAccess.objects.create(whiteboard=other_board, user=self.user, role='view')
+        
+        self.assertEqual(self.search('ann'), ['hannah', 'joanna', 'annabel'])
+        
+    @override_settings(USER_SEARCH_CANDIDATES=1)
+    def test_collaborators_survive_the_candidate_cap(self):
+        """Test that collaborators are found even when the index candidates are cut before them"""
+        board = Whiteboard.objects.create(name='Board', owner=self.user)
+        WhiteboardAccess.objects.create(whiteboard=board, user=self.colleague, role='edit')
+        
+        self.assertEqual(self.search('ann')[0], 'joanna')
+        self.assertEqual(self.search('ex')[0], 'joanna')
+        
+    def test_short_queries_match_substrings_and_email(self):
+        """Test that two-character queries still search inside usernames and emails"""
+        self.assertEqual(self.search('nn'), ['annabel', 'hannah', 'joanna'])
+        self.assertEqual(self.search('h@'), ['hannah'])
+        
+    def test_results_are_cached(self):
+        """Test that repeated queries are served from the cache"""
+        self.search('anna')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('Anna'), ['annabel', 'hannah', 'joanna'])
+
+
+
+@override_settings(DRAWING_COMPACT_AFTER_SECONDS=0, DRAWING_COMPACT_MIN_STROKES=1, DRAWING_LAYER_MAX_STROKES=10)
+class DrawingCompactionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Sketches', owner=self.user)
+        self.drawings = Drawing.objects.bulk_create([
+            Drawing(whiteboard=self.whiteboard, path_data=f'M {i},0 L {i},10', created_by=self.user)
+            for i in range(25)
+        ])
+        
+    def test_compaction_merges_strokes_into_layers(self):
+        """Test that strokes move into a few layers and the snapshot still lists them all"""
+        self.assertEqual(compact_board(self.whiteboard.id), 25)
+        self.assertEqual(Drawing.objects.count(), 0)
+        self.assertEqual(list(DrawingLayer.objects.values_list('stroke_count', flat=True)), [10, 10, 5])
+        
+        # A later run tops up the last layer
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 1,1', created_by=self.user)
+        self.assertEqual(compact_board(self.whiteboard.id), 1)
+        self.assertEqual(DrawingLayer.objects.count(), 3)
+        
+        response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/')
+        ids = [d['id'] for d in response.data['drawings']]
+        self.assertEqual(len(ids), 26)
+        self.assertEqual(ids[:25], [d.id for d in self.drawings])
+        
+    def test_compacted_strokes_stay_addressable(self):
+        """Test retrieving, deleting and editing individual compacted strokes"""
+        compact_board(self.whiteboard.id)
+        first, second = self.drawings[0].id, self.drawings[1].id
+        
+        response = self.client.get(f'/api/drawings/{first}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['path_data'], 'M 0,0 L 0,10')
+        
+        response = self.client.delete(f'/api/drawings/{first}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(f'/api/drawings/{first}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(DrawingLayer.objects.first().stroke_count, 9)
+        
+        response = self.client.patch(f'/api/drawings/{second}/', {'color': 'red'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Drawing.objects.get(id=second).color, 'red')
+        self.assertEqual(DrawingLayer.objects.first().stroke_count, 8)
+        
+    def test_restored_strokes_do_not_stall_compaction(self):
+        """Test that a freshly restored stroke with a low id doesn't hold back older strokes"""
+        compact_board(self.whiteboard.id)
+        self.client.patch(f'/api/drawings/{self.drawings[0].id}/', {'color': 'red'})
+        later = Drawing.objects.bulk_create([
+            Drawing(whiteboard=self.whiteboard, path_data=f'M {i},0 L {i},10', created_by=self.user)
+            for i in range(3)
+        ])
+        Drawing.objects.filter(id__in=[d.id for d in later]).update(created_at=timezone.now() - timedelta(hours=1))
+        
+        with override_settings(DRAWING_COMPACT_AFTER_SECONDS=60):
+            self.assertEqual(compact_board(self.whiteboard.id), 3)
+        self.assertEqual(list(Drawing.objects.values_list('id', flat=True)), [self.drawings[0].id])
+        
+    def test_non_numeric_ids_are_not_found(self):
+        """Test that malformed stroke ids get a 404 rather than a server error"""
+        self.assertEqual(self.client.get('/api/drawings/abc/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete('/api/drawings/abc/').status_code, status.HTTP_404_NOT_FOUND)
+        
+    @override_settings(DRAWING_COMPACT_AFTER_SECONDS=300, DRAWING_COMPACT_MIN_STROKES=5)
+    def test_fresh_strokes_get_a_follow_up_run(self):
+        """Test that strokes too fresh to compact are picked up again once they are old enough"""
+        Drawing.objects.filter(id__in=[d.id for d in self.drawings[:20]]).update(created_at=timezone.now() - timedelta(hours=1))
+        Drawing.objects.filter(id=self.drawings[-1].id).update(created_at=timezone.now() - timedelta(seconds=100))
+        with mock.patch('whiteboard.compaction.schedule_compaction') as schedule:
+            self.assertEqual(compact_board_fully(self.whiteboard.id), 20)
+        (whiteboard_id,), kwargs = schedule.call_args
+        self.assertEqual(whiteboard_id, self.whiteboard.id)
+        # When the newest of the 5 skipped strokes passes the cutoff
+        self.assertAlmostEqual(kwargs['delay'], 301, delta=5)
+        
+        # Too few left to compact: no follow-up
+        Drawing.objects.filter(id__in=[d.id for d in self.drawings[20:22]]).delete()
+        with mock.patch('whiteboard.compaction.schedule_compaction') as schedule:
+            compact_board_fully(self.whiteboard.id)
+        schedule.assert_not_called()
+        
+    def test_concurrent_restores_share_one_row(self):
+        """Test that restoring a stroke another request already restored returns that row"""
+        compact_board(self.whiteboard.id)
+        stroke_id = self.drawings[0].id
+        layer, stroke = find_compacted_stroke(DrawingLayer.objects.all(), stroke_id)
+        first = restore_stroke(layer, stroke)
+        # The second request looked the stroke up before the first restored it
+        second = restore_stroke(layer, stroke)
+        self.assertEqual((first.id, second.id), (stroke_id, stroke_id))
+        self.assertEqual(Drawing.objects.filter(id=stroke_id).count(), 1)
+        
+        # Another request inserted the row between the layer read and the insert
+        layer, stroke = find_compacted_stroke(DrawingLayer.objects.all(), self.drawings[1].id)
+        Drawing.objects.create(id=stroke['id'], whiteboard=self.whiteboard, path_data=stroke['path_data'], created_by=self.user)
+        self.assertEqual(restore_stroke(layer, stroke).id, stroke['id'])
+        
+    def test_snapshot_query_count_independent_of_strokes(self):
+        """Test that loading a compacted board doesn't scale with stroke count"""
+        compact_board(self.whiteboard.id)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(f'/api/whiteboards/{self.whiteboard.id}/')
+        drawing_queries = [q for q in ctx.captured_queries if 'whiteboard_drawing' in q['sql']]
+        self.assertLessEqual(len(drawing_queries), 2)
+
+
+class OperationLogTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Log Board', owner=self.user)
+        
+    def _create_note(self, content):
+        response = self.client.post('/api/sticky-notes/', {'whiteboard': self.whiteboard.id, 'content': content})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+        
+    def test_rest_writes_are_logged(self):
+        """Test that creating, editing and deleting records ops with previous values"""
+        note_id = self._create_note('first')
+        self.client.patch(f'/api/sticky-notes/{note_id}/', {'content': 'second'})
+        self.client.delete(f'/api/sticky-notes/{note_id}/')
+        
+        ops = list(BoardOperation.objects.filter(whiteboard=self.whiteboard).order_by('id'))
+        self.assertEqual([op.op_type for op in ops], ['note_created', 'note_updated', 'note_deleted'])
+        self.assertEqual(ops[1].previous, {'content': 'first'})
+        self.assertEqual(ops[2].previous['content'], 'second')
+        self.assertEqual(ops[0].user, self.user)
+        
+    def test_failed_logging_rolls_back_the_change(self):
+        """Test that a change and its logged operation commit or roll back together"""
+        note_id = self._create_note('kept')
+        with mock.patch('whiteboard.views.record_operation', side_effect=RuntimeError('log unavailable')):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(f'/api/sticky-notes/{note_id}/', {'content': 'lost'})
+        self.assertEqual(StickyNote.objects.get(id=note_id).content, 'kept')
+        
+    @override_settings(OPLOG_SNAPSHOT_EVERY=100)
+    def test_snapshot_check_runs_every_few_writes(self):
+        """Test that the log is only counted every tenth of a snapshot interval"""
+        oplog._appended.clear()
+        for _ in range(9):
+            with CaptureQueriesContext(connection) as ctx:
+                record_operation(self.whiteboard.id, 'board_updated', {})
+            self.assertEqual(len(ctx.captured_queries), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            record_operation(self.whiteboard.id, 'board_updated', {})
+        self.assertTrue(any('whiteboard_boardsnapshot' in q['sql'] for q in ctx.captured_queries))
+        
+    def test_write_counters_are_bounded(self):
+        """Test that only the most recently written boards keep a counter"""
+        oplog._appended.clear()
+        boards = [Whiteboard.objects.create(name=f'Board {i}', owner=self.user) for i in range(3)]
+        with mock.patch.object(oplog, 'APPENDED_BOARDS_KEPT', 2):
+            for board in boards:
+                record_operation(board.id, 'board_updated', {})
+        self.assertEqual(list(oplog._appended), [boards[1].id, boards[2].id])
+        
+    def test_rebalance_shows_in_state(self):
+        """Test that re-keyed order keys are logged, so state loaded from a snapshot has them"""
+        notes = [self._create_note(f'Note {i}') for i in range(3)]
+        StickyNote.objects.filter(id=notes[0]).update(order_key='zzzzzzzzzzzz')
+        take_snapshot(self.whiteboard.id)
+        rebalance_board(self.whiteboard.id)
+        
+        state, _ = load_state(self.whiteboard)
+        keys = dict(StickyNote.objects.filter(whiteboard=self.whiteboard).values_list('id', 'order_key'))
+        self.assertEqual({int(i): note['order_key'] for i, note in state['sticky_notes'].items()}, keys)
+        op = BoardOperation.objects.filter(whiteboard=self.whiteboard).latest('id')
+        self.assertEqual((op.op_type, op.previous[str(notes[0])]), ('notes_reordered', 'zzzzzzzzzzzz'))
+        
+    def test_state_is_snapshot_plus_tail(self):
+        """Test that replaying ops on top of a snapshot matches the live board"""
+        kept = self._create_note('kept')
+        removed = self._create_note('removed')
+        take_snapshot(self.whiteboard.id)
+        
+        self.client.patch(f'/api/sticky-notes/{kept}/', {'content': 'edited'})
+        self.client.delete(f'/api/sticky-notes/{removed}/')
+        self.client.post('/api/drawings/', {'whiteboard': self.whiteboard.id, 'path_data': 'M 0,0 L 5,5'})
+        self.client.patch(f'/api/whiteboards/{self.whiteboard.id}/', {'name': 'Renamed'})
+        
+        state, seq = load_state(self.whiteboard)
+        self.assertEqual(seq, BoardOperation.objects.latest('id').id)
+        self.assertEqual(state['whiteboard']['name'], 'Renamed')
+        self.assertEqual([n['content'] for n in state['sticky_notes'].values()], ['edited'])
+        self.assertEqual(len(state['drawings']), 1)
+        
+        response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/state/')
+        self.assertEqual(response.data['seq'], seq)
+        self.assertEqual([n['id'] for n in response.data['sticky_notes']], [kept])
+        
+    def test_group_ops_carry_member_notes(self):
+        """Test that grouping and ungrouping keep replayed note coordinates right"""
+        note_id = self._create_note('member')
+        StickyNote.objects.filter(id=note_id).update(x=100, y=50)
+        take_snapshot(self.whiteboard.id)
+        
+        response = self.client.post('/api/note-groups/', {'whiteboard': self.whiteboard.id, 'note_ids': [note_id]}, format='json')
+        group_id = response.data['id']
+        state, _ = load_state(self.whiteboard)
+        self.assertEqual(state['sticky_notes'][str(note_id)]['x'], 0)
+        self.assertIn(str(group_id), state['note_groups'])
+        
+        self.client.post(f'/api/note-groups/{group_id}/ungroup/')
+        state, _ = load_state(self.whiteboard)
+        self.assertEqual(state['sticky_notes'][str(note_id)]['x'], 100)
+        self.assertEqual(state['note_groups'], {})
+        
+    def test_history_since_seq(self):
+        """Test paging through the log from a known sequence number"""
+        self._create_note('a')
+        seq = BoardOperation.objects.latest('id').id
+        self._create_note('b')
+        self._create_note('c')
+        
+        response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/history/', {'since': seq, 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['operations']), 1)
+        self.assertEqual(response.data['operations'][0]['payload']['note']['content'], 'b')
+        self.assertTrue(response.data['has_next'])
+        
+    @override_settings(OPLOG_RETENTION_DAYS=0)
+    def test_prune_only_drops_covered_operations(self):
+        """Test that retention never drops ops the latest snapshot doesn't include"""
+        self._create_note('covered')
+        take_snapshot(self.whiteboard.id)
+        take_snapshot(self.whiteboard.id)
+        take_snapshot(self.whiteboard.id)
+        self._create_note('tail')
+        
+        self.assertEqual(prune_board(self.whiteboard.id), 1)
+        self.assertEqual(BoardSnapshot.objects.filter(whiteboard=self.whiteboard).count(), 2)
+        state, _ = load_state(self.whiteboard)
+        self.assertEqual(sorted(n['content'] for n in state['sticky_notes'].values()), ['covered', 'tail'])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.viewer = User.objects.create_user(username='viewer', password='testpass')
+        self.client.force_login(self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Async Board', owner=self.user)
+        WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=self.viewer, role='view')
+        self.note = StickyNote.objects.create(whiteboard=self.whiteboard, content='Hello', created_by=self.user)
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 1,1', created_by=self.user)
+        self.addCleanup(view_settings_buffer.flush)
+        
+    def test_snapshot_matches_sync_endpoint(self):
+        """Test that the async board snapshot returns what the viewset returns"""
+        live = self.client.get(f'/api/live/whiteboards/{self.whiteboard.id}/')
+        self.assertEqual(live.status_code, status.HTTP_200_OK)
+        sync = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/')
+        self.assertEqual(live.json(), sync.json())
+        
+    def test_note_patch(self):
+        """Test moving a note and the access checks of the async endpoint"""
+        url = f'/api/live/sticky-notes/{self.note.id}/'
+        response = self.client.patch(url, {'x': 40, 'y': 60, 'whiteboard': 999}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.json()['x'], response.json()['y']), (40, 60))
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.x, self.note.y, self.note.whiteboard_id), (40, 60, self.whiteboard.id))
+        self.assertTrue(BoardOperation.objects.filter(target_id=self.note.id, op_type='note_updated').exists())
+        
+        self.assertEqual(self.client.patch(url, {'width': 'wide'}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        
+        viewer = APIClient()
+        viewer.force_login(self.viewer)
+        self.assertEqual(viewer.patch(url, {'x': 0}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(APIClient().patch(url, {'x': 0}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        
+    def test_view_settings_round_trip(self):
+        """Test reading defaults, saving and reading back view settings"""
+        url = f'/api/live/view-settings/{self.whiteboard.id}/'
+        self.assertEqual(self.client.get(url).json(), {'zoom': 1.0, 'pan_x': 0.0, 'pan_y': 0.0})
+        response = self.client.post(url, {'zoom': 2.5, 'pan_x': 10, 'pan_y': -5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).json()['zoom'], 2.5)
+        self.assertEqual(self.client.get('/api/live/view-settings/999999/').status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_user_search(self):
+        """Test that the async user search returns the sync endpoint's results"""
+        live = self.client.get('/api/live/users/search/', {'q': 'view'})
+        self.assertEqual([u['username'] for u in live.json()], ['viewer'])
+        self.assertEqual(self.client.get('/api/live/users/search/', {'q': 'v'}).json(), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Primary and replica are two SQLite databases; replication is a manual copy"""
+    # '__all__' so the alias registered in setUpClass is included
+    databases = '__all__'
+    
+    @classmethod
+    def setUpClass(cls):
+        fd, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connections.settings['replica'] = {**connections.settings['default'], 'NAME': cls.replica_path}
+        super().setUpClass()
+        
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(cls.replica_path)
+        
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Replicated', owner=self.user)
+        StickyNote.objects.create(whiteboard=self.whiteboard, content='replicated', created_by=self.user)
+        self.replicate()
+        # Written after the copy, so only the primary has it
+        StickyNote.objects.create(whiteboard=self.whiteboard, content='lagging', created_by=self.user)
+        
+    def replicate(self):
+        connections['replica'].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+        
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+        
+    def note_contents(self, client):
+        response = client.get('/api/sticky-notes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(note['content'] for note in response.data)
+        
+    def test_reads_go_to_replica(self):
+        """Test that safe requests are served from the (lagging) replica"""
+        self.assertEqual(self.note_contents(self.client_for(self.user)), ['replicated'])
+        # Outside of a request everything stays on the primary
+        self.assertEqual(StickyNote.objects.count(), 2)
+        
+    def test_writer_is_pinned_to_primary(self):
+        """Test read-your-writes: after a write the same client reads from the primary"""
+        writer = self.client_for(self.user)
+        response = writer.post('/api/sticky-notes/', {'whiteboard': self.whiteboard.id, 'content': 'new'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertEqual(response.cookies[PIN_COOKIE]['samesite'], settings.SESSION_COOKIE_SAMESITE)
+        self.assertEqual(response.cookies[PIN_COOKIE]['secure'], settings.SESSION_COOKIE_SECURE)
+        self.assertEqual(StickyNote.objects.using('replica').filter(content='new').count(), 0)
+        
+        self.assertEqual(self.note_contents(writer), ['lagging', 'new', 'replicated'])
+        self.assertEqual(self.note_contents(self.client_for(self.user)), ['replicated'])
+
+
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Busy Board', owner=self.user)
+        
+    def test_writes_commit_in_batches(self):
+        """Test that queued writes share a transaction and a failing write doesn't sink the batch"""
+        writer = WriteQueue(batch_size=10, batch_wait=0.2)
+        
+        def write(content):
+            if content == 'bad':
+                raise ValueError(content)
+            StickyNote.objects.create(whiteboard=self.whiteboard, content=content, created_by=self.user)
+            return id(connection.atomic_blocks[0])
+        
+        futures = [writer.submit(write, content) for content in ['one', 'bad', 'two']]
+        outer, bad, other = futures
+        self.assertEqual(outer.result(timeout=10), other.result(timeout=10))
+        with self.assertRaises(ValueError):
+            bad.result(timeout=10)
+        self.assertEqual(sorted(StickyNote.objects.values_list('content', flat=True)), ['one', 'two'])
+        
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_api_writes_go_through_queue(self):
+        """Test that note writes made through the API are performed by the writer thread"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        threads = []
+        original = StickyNote.save
+        
+        def save(note, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(note, *args, **kwargs)
+        
+        with mock.patch.object(StickyNote, 'save', save):
+            response = client.post('/api/sticky-notes/', {'whiteboard': self.whiteboard.id, 'content': 'queued'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(threads, ['SQLite writer'])
+        self.assertTrue(BoardOperation.objects.filter(target_id=response.data['id'], op_type='note_created').exists())
+
+
+class BoardPurgeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Doomed', owner=self.user)
+        
+    def test_delete_hides_board_then_purge_removes_everything(self):
+        """Test that DELETE only soft-deletes and the purge removes rows and media in batches"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            group = NoteGroup.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+            notes = [
+                StickyNote.objects.create(whiteboard=self.whiteboard, content=f'Note {i}', note_group=group, created_by=self.user)
+                for i in range(5)
+            ]
+            image = StickyNoteImage.objects.create(sticky_note=notes[0], image=ContentFile(b'bytes', name='doomed.png'))
+            Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 1,1', created_by=self.user)
+            path = image.image.path
+            
+            response = self.client.delete(f'/api/whiteboards/{self.whiteboard.id}/')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            self.assertEqual(self.client.get(f'/api/whiteboards/{self.whiteboard.id}/').status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.get('/api/sticky-notes/').data, [])
+            self.assertEqual(StickyNote.objects.count(), 5)
+            
+            progress = []
+            counts = purge_board(self.whiteboard.id, batch_size=2, report=lambda label, count: progress.append((label, count)))
+            self.assertEqual(counts['notes'], 5)
+            self.assertIn(('notes', 2), progress)
+            self.assertEqual(progress[-1], ('whiteboard', 1))
+            self.assertFalse(Whiteboard.all_objects.filter(id=self.whiteboard.id).exists())
+            self.assertEqual((StickyNote.objects.count(), NoteGroup.objects.count(), Drawing.objects.count()), (0, 0, 0))
+            self.assertFalse(os.path.exists(path))
+            
+    def test_shared_media_survives(self):
+        """Test that a file still used by another board is not deleted"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            note = StickyNote.objects.create(whiteboard=self.whiteboard, created_by=self.user)
+            image = StickyNoteImage.objects.create(sticky_note=note, image=ContentFile(b'bytes', name='shared.png'))
+            other = Whiteboard.objects.create(name='Keeper', owner=self.user)
+            other_note = StickyNote.objects.create(whiteboard=other, created_by=self.user)
+            StickyNoteImage.objects.create(sticky_note=other_note, image=image.image.name)
+            
+            self.client.delete(f'/api/whiteboards/{self.whiteboard.id}/')
+            purge_board(self.whiteboard.id)
+            self.assertTrue(os.path.exists(image.image.path))
+            
+    def test_purge_ignores_live_boards(self):
+        """Test that only soft-deleted boards are purged"""
+        self.assertEqual(purge_board(self.whiteboard.id), {})
+        self.assertTrue(Whiteboard.objects.filter(id=self.whiteboard.id).exists())
+
+
+flaky_calls = []
+
+
+@tasks.task(max_attempts=2, retry_delay=60)
+def flaky_task(value):
+    flaky_calls.append(value)
+    raise ValueError(f'cannot handle {value}')
+
+
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Test Whiteboard', owner=self.user)
+        flaky_calls.clear()
+        
+    def test_identical_pending_calls_are_merged(self):
+        """Test that enqueueing a pending call again only raises its priority"""
+        first = flaky_task.enqueue(42, delay=60)
+        second = flaky_task.enqueue(42, priority=5)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(second.priority, 5)
+        self.assertLessEqual(second.run_after, first.run_after)
+        self.assertNotEqual(flaky_task.enqueue(43).id, first.id)
+        self.assertEqual(BackgroundTask.objects.count(), 2)
+        
+    def test_claims_by_priority_and_due_time(self):
+        """Test that the highest-priority due task is claimed first"""
+        low = flaky_task.enqueue(1)
+        high = flaky_task.enqueue(2, priority=10)
+        flaky_task.enqueue(3, priority=20, delay=60)
+        self.assertEqual(tasks.claim_next('test').id, high.id)
+        self.assertEqual(tasks.claim_next('test').id, low.id)
+        self.assertIsNone(tasks.claim_next('test'))
+        # A running call does not block queueing it again
+        self.assertNotEqual(flaky_task.enqueue(2).id, high.id)
+        
+    def test_failures_are_retried_then_failed(self):
+        """Test retries with backoff up to max_attempts"""
+        task = flaky_task.enqueue(7)
+        self.assertEqual(tasks.run_task(tasks.claim_next('test')), 'retry')
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('pending', 1))
+        self.assertIn('cannot handle 7', task.last_error)
+        self.assertIsNone(tasks.claim_next('test'))
+        
+        BackgroundTask.objects.filter(id=task.id).update(run_after=task.created_at)
+        self.assertEqual(tasks.run_task(tasks.claim_next('test')), 'failed')
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('failed', 2))
+        self.assertEqual(flaky_calls, [7, 7])
+        
+    def test_stale_running_tasks_are_reclaimed(self):
+        """Test that tasks of a lost worker are retried"""
+        task = flaky_task.enqueue(8)
+        tasks.claim_next('gone')
+        self.assertEqual(tasks.reclaim_stale(timeout=3600), 0)
+        BackgroundTask.objects.filter(id=task.id).update(locked_at=task.created_at.replace(year=2000))
+        self.assertEqual(tasks.reclaim_stale(timeout=3600), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'pending')
+        self.assertIn('gone', task.last_error)
+        
+    @override_settings(BACKGROUND_TASKS='worker')
+    def test_background_jobs_go_through_the_queue(self):
+        """Test that board purges are queued for the worker and run by it"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.delete(f'/api/whiteboards/{self.whiteboard.id}/')
+        queued = BackgroundTask.objects.get(name='whiteboard.purge.purge_board')
+        self.assertEqual((queued.args, queued.status), ([self.whiteboard.id], 'pending'))
+        
+        out = io.StringIO()
+        call_command('run_worker', processes=0, burst=True, stdout=out)
+        self.assertIn('done', out.getvalue())
+        self.assertFalse(Whiteboard.all_objects.filter(id=self.whiteboard.id).exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Test Whiteboard', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+        
+    def test_request_metrics(self):
+        """Test that latency, query counts and serializer time are recorded per view"""
+        requests = self.sample('stickytux_http_request_duration_seconds_count', view='whiteboard-detail', method='GET')
+        queries = self.sample('stickytux_http_request_db_queries_sum', view='whiteboard-detail')
+        serializer = self.sample('stickytux_serializer_duration_seconds_count', serializer='WhiteboardSerializer')
+        notes = self.sample('stickytux_serializer_duration_seconds_count', serializer='StickyNoteSerializer[]')
+        
+        self.client.get(f'/api/whiteboards/{self.whiteboard.id}/')
+        self.client.get('/api/sticky-notes/')
+        
+        self.assertEqual(self.sample('stickytux_http_request_duration_seconds_count', view='whiteboard-detail', method='GET'), requests + 1)
+        self.assertGreater(self.sample('stickytux_http_request_db_queries_sum', view='whiteboard-detail'), queries)
+        self.assertEqual(self.sample('stickytux_serializer_duration_seconds_count', serializer='WhiteboardSerializer'), serializer + 1)
+        self.assertEqual(self.sample('stickytux_serializer_duration_seconds_count', serializer='StickyNoteSerializer[]'), notes + 1)
+        
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'stickytux_http_requests_total{method="GET",status="200",view="whiteboard-detail"}', response.content)
+        
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test that a configured token is required to scrape"""
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        
+    def test_websocket_metrics(self):
+        """Test connection, message and fan-out metrics of a board room"""
+        room = str(self.whiteboard.id)
+        fanouts = self.sample('stickytux_websocket_fanout_seconds_count')
+        connections = self.sample('stickytux_websocket_connections')
+        received = self.sample('stickytux_websocket_messages_total', direction='in')
+        sent = self.sample('stickytux_websocket_messages_total', direction='out')
+        
+        async def exchange():
+            scope = {'type': 'websocket', 'path': f'/ws/whiteboard/{room}/', 'headers': [], 'user': AnonymousUser()}
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output(timeout=5))['type'], 'websocket.accept')
+            self.assertEqual(self.sample('stickytux_websocket_connections'), connections + 1)
+            await communicator.send_input({'type': 'websocket.receive', 'text': '{"type": "cursor", "x": 1}'})
+            self.assertEqual((await communicator.receive_output(timeout=5))['text'], '{"type": "cursor", "x": 1}')
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(timeout=5)
+            
+        async_to_sync(exchange)()
+        self.assertEqual(self.sample('stickytux_websocket_connections'), connections)
+        self.assertEqual(self.sample('stickytux_websocket_messages_total', direction='in'), received + 1)
+        self.assertEqual(self.sample('stickytux_websocket_messages_total', direction='out'), sent + 1)
+        # Boards are not a label, so the number of series stays fixed
+        self.assertNotIn(b'room=', self.client.get('/metrics').content)
+        self.assertEqual(self.sample('stickytux_websocket_fanout_seconds_count'), fanouts + 1)
+
+
+# Query budgets of the hot endpoints, by (method, URL name). They are
+# measured on a board with several of everything, so an N+1 query blows the
+# budget; raise one only together with the change that needs it. Each
+# includes the session save (3 queries); the session and user lookups are
+# served from a shared cache. Writes also count the savepoint the change and
+# its operation log entry commit under.
+ENDPOINT_BUDGETS = {
+    ('GET', 'whiteboard-list'): 10,
+    ('GET', 'whiteboard-detail'): 10,
+    ('GET', 'whiteboard-state'): 12,
+    ('GET', 'live_whiteboard'): 11,
+    ('GET', 'stickynote-list'): 5,
+    ('POST', 'stickynote-list'): 12,
+    ('PATCH', 'stickynote-detail'): 13,
+    ('PATCH', 'live_sticky_note'): 13,
+    ('GET', 'drawing-list'): 4,
+    ('POST', 'drawing-list'): 10,
+    ('GET', 'notegroup-list'): 4,
+    ('GET', 'viewsettings-for-whiteboard'): 5,
+    ('POST', 'viewsettings-for-whiteboard'): 4,
+    ('GET', 'live_view_settings'): 5,
+    ('GET', 'search_users'): 8,
+}
+# Generous on purpose: catches pathological slowdowns without making the suite flaky
+LATENCY_BUDGET_MS = 1000
+
+# Session and user caching as configured with a shared cache; the test
+# process is the only worker, so locmem stands in for it
+CACHED_AUTH_SETTINGS = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'AUTH_USER_CACHE_SECONDS': 60,
+}
+
+
+@override_settings(**CACHED_AUTH_SETTINGS)
+class EndpointBudgetTests(TestCase):
+    """Query and latency budgets of the hot endpoints"""
+    
+    def setUp(self):
+        # Keep the periodic snapshot check out of the measured requests
+        oplog._appended.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Busy Board', owner=self.user)
+        for i in range(3):
+            peer = User.objects.create_user(username=f'peer{i}', password='testpass')
+            WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=peer, role='edit')
+            other = Whiteboard.objects.create(name=f'Board {i}', owner=peer)
+            WhiteboardAccess.objects.create(whiteboard=other, user=self.user, role='view')
+        groups = [NoteGroup.objects.create(whiteboard=self.whiteboard, offset_x=i * 100, created_by=self.user) for i in range(2)]
+        self.notes = [
+            StickyNote.objects.create(
+                whiteboard=self.whiteboard, content=f'Note {i}', note_group=groups[i % 2],
+                order_key=f'a{i}', created_by=self.user,
+            )
+            for i in range(6)
+        ]
+        for note in self.notes[:2]:
+            StickyNoteImage.objects.create(sticky_note=note, image='sticky_notes/budget.png')
+        for i in range(6):
+            Drawing.objects.create(whiteboard=self.whiteboard, path_data=f'M {i},0 L {i},9', created_by=self.user)
+        WhiteboardViewSettings.objects.create(user=self.user, whiteboard=self.whiteboard, zoom=2)
+        # Budgets are for a warm cache: the first request caches the user
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.get('/api/custom-colors/')
+        self.addCleanup(view_settings_buffer.flush)
+        
+    def assertWithinBudget(self, method, url, data=None):
+        """Request ``url`` and fail if it exceeds its endpoint's budgets"""
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method.lower())(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        view = response.resolver_match.view_name
+        budget = ENDPOINT_BUDGETS[(method, view)]
+        profile = response.profile
+        queries = '\n'.join(query['sql'] for query in captured.captured_queries)
+        self.assertLessEqual(
+            profile.queries, budget, f'{method} {view} ran {profile.queries} queries, budget is {budget}:\n{queries}'
+        )
+        self.assertLessEqual(
+            profile.total_seconds * 1000, LATENCY_BUDGET_MS,
+            f'{method} {view} took {profile.total_seconds * 1000:.0f}ms, budget is {LATENCY_BUDGET_MS}ms',
+        )
+        return response
+        
+    def test_board_endpoints(self):
+        """Test the budgets of reading a whole board"""
+        board = self.whiteboard.id
+        self.assertWithinBudget('GET', '/api/whiteboards/')
+        self.assertWithinBudget('GET', f'/api/whiteboards/{board}/')
+        self.assertWithinBudget('GET', f'/api/whiteboards/{board}/state/')
+        self.assertWithinBudget('GET', f'/api/live/whiteboards/{board}/')
+        
+    def test_note_endpoints(self):
+        """Test the budgets of listing, creating and moving notes"""
+        note = self.notes[0].id
+        self.assertWithinBudget('GET', '/api/sticky-notes/', {'whiteboard': self.whiteboard.id})
+        self.assertWithinBudget('POST', '/api/sticky-notes/', {'whiteboard': self.whiteboard.id, 'content': 'New'})
+        self.assertWithinBudget('PATCH', f'/api/sticky-notes/{note}/', {'x': 10, 'y': 20})
+        self.assertWithinBudget('PATCH', f'/api/live/sticky-notes/{note}/', {'x': 30, 'y': 40})
+        self.assertWithinBudget('GET', '/api/note-groups/', {'whiteboard': self.whiteboard.id})
+        
+    def test_drawing_endpoints(self):
+        """Test the budgets of listing and creating drawings"""
+        self.assertWithinBudget('GET', '/api/drawings/', {'whiteboard': self.whiteboard.id})
+        self.assertWithinBudget('POST', '/api/drawings/', {'whiteboard': self.whiteboard.id, 'path_data': 'M 0,0 L 5,5'})
+        
+    def test_view_settings_and_search(self):
+        """Test the budgets of view settings and user search"""
+        board = self.whiteboard.id
+        self.assertWithinBudget('GET', '/api/view-settings/for_whiteboard/', {'whiteboard_id': board})
+        self.assertWithinBudget('POST', '/api/view-settings/for_whiteboard/', {'whiteboard': board, 'zoom': 1.5})
+        self.assertWithinBudget('GET', f'/api/live/view-settings/{board}/')
+        self.assertWithinBudget('GET', '/api/users/search/', {'q': 'peer'})
+        
+    def test_server_timing_in_debug_mode(self):
+        """Test that the request profile is exposed as Server-Timing in debug mode"""
+        url = f'/api/whiteboards/{self.whiteboard.id}/'
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        with override_settings(DEBUG=True):
+            response = self.client.get(url)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{response.profile.queries} queries"', timing)
+        self.assertIn('serializer;dur=', timing)
+        self.assertGreater(response.profile.serializer_seconds, 0)
+        self.assertLess(response.profile.serializer_seconds, response.profile.total_seconds)
+
+
+class DatasetBenchmarkTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        
+    def generate(self, **options):
+        call_command(
+            'generate_dataset', seed=7, notes=30, groups=1, strokes=45, images=6, image_files=2,
+            collaborators=4, batch_size=10, stdout=io.StringIO(), **options
+        )
+        return Whiteboard.objects.get(name='dataset board 1')
+        
+    def test_dataset_is_deterministic(self):
+        """Test that the generator builds the requested sizes, identically for a seed"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            board = self.generate()
+            self.assertEqual(board.sticky_notes.count(), 30)
+            self.assertEqual(board.sticky_notes.filter(note_group__isnull=False).count(), 20)
+            self.assertEqual(board.drawings.count(), 45)
+            self.assertEqual(StickyNoteImage.objects.filter(sticky_note__whiteboard=board).count(), 6)
+            self.assertEqual(board.access_rights.count(), 4)
+            contents = list(board.sticky_notes.order_by('order_key').values_list('content', 'x', 'color'))
+            paths = list(board.drawings.order_by('id').values_list('path_data', flat=True))
+            
+            regenerated = self.generate(replace=True)
+            self.assertNotEqual(regenerated.id, board.id)
+            self.assertFalse(Whiteboard.all_objects.filter(id=board.id).exists())
+            self.assertEqual(list(regenerated.sticky_notes.order_by('order_key').values_list('content', 'x', 'color')), contents)
+            self.assertEqual(list(regenerated.drawings.order_by('id').values_list('path_data', flat=True)), paths)
+            self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'sticky_notes'))), ['dataset-0.png', 'dataset-1.png'])
+            
+    def test_benchmark_writes_json(self):
+        """Test that the REST benchmark records every scenario and cleans up after itself"""
+        output = os.path.join(self.media_root, 'benchmark.json')
+        with override_settings(MEDIA_ROOT=self.media_root):
+            board = self.generate()
+            call_command('benchmark_rest', iterations=2, warmup=0, output=output, stdout=io.StringIO())
+            
+            with open(output) as result_file:
+                report = json.load(result_file)
+            self.assertEqual(set(report['results']), {
+                'board_retrieve', 'board_list', 'bulk_move', 'note_create', 'image_add', 'user_search',
+            })
+            for result in report['results'].values():
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['queries'], 0)
+                self.assertGreater(result['peak_memory_kib'], 0)
+            self.assertEqual(report['dataset']['notes'], 30)
+            self.assertEqual(board.sticky_notes.count(), 30)
+            self.assertEqual(StickyNoteImage.objects.filter(sticky_note__whiteboard=board).count(), 6)
+            
+            out = io.StringIO()
+            call_command('benchmark_rest', iterations=1, warmup=0, scenarios=['bulk_move'], compare=output, stdout=out)
+            self.assertIn('bulk_move       p50', out.getvalue())
+
+
+class StartupTests(TestCase):
+    def test_readiness_probe(self):
+        """Test that the readiness probe passes once warmed up and reports the startup phases"""
+        response = self.client.get('/api/ready/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['ready'])
+        self.assertIn('warm-up: urls and views', data['phases_ms'])
+        
+        with mock.patch.object(startup, 'is_ready', return_value=False):
+            response = self.client.get('/api/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'starting')
+        
+    def test_warm_up_failure_is_retried(self):
+        """Test that a failed warm-up is reported and succeeds on retry"""
+        unreachable = mock.Mock(connection=None)
+        unreachable.cursor.side_effect = sqlite3.OperationalError('unable to open database file')
+        with mock.patch.object(startup, '_ready', False), mock.patch.object(connections, 'all', return_value=[unreachable]):
+            self.assertFalse(startup.warm_up())
+            self.assertIn('unable to open database file', startup.status()['error'])
+        self.assertTrue(startup.warm_up())
+        self.assertIsNone(startup.status()['error'])
+        
+    def test_fresh_process_defers_heavy_imports(self):
+        """Test that starting the ASGI application warms up without loading Pillow or the admin"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{directory}/startup.sqlite3', 'STARTUP_PROFILE': 'True'}
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        modules = ['PIL', 'whiteboard.admin', 'whiteboard.serializers', 'rest_framework.views']
+        result = subprocess.run(
+            [sys.executable, '-c', f'import backend.asgi, sys; print([m for m in {modules!r} if m in sys.modules])'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "['whiteboard.serializers', 'rest_framework.views']")
+        self.assertIn('ready after', result.stderr)
+        self.assertIn('by package:', result.stderr)
+
+
+@override_settings(ROOM_STATE=True, ROOM_FLUSH_SECONDS=60, ROOM_IDLE_SECONDS=60)
+class RoomStateTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='roomowner', password='testpass123')
+        self.viewer = User.objects.create_user(username='roomviewer', password='testpass123')
+        self.whiteboard = Whiteboard.objects.create(name='Room Board', owner=self.owner)
+        WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=self.viewer, role='view')
+        self.group = NoteGroup.objects.create(whiteboard=self.whiteboard, created_by=self.owner, offset_x=10)
+        self.note = StickyNote.objects.create(whiteboard=self.whiteboard, content='Live', x=1, y=2, created_by=self.owner)
+        self.member = StickyNote.objects.create(
+            whiteboard=self.whiteboard, content='Member', note_group=self.group, created_by=self.owner
+        )
+        self.drawing = Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 5,5', created_by=self.owner)
+        self.addCleanup(rooms.rooms.clear)
+        
+    async def connect(self, user):
+        scope = {'type': 'websocket', 'path': f'/ws/whiteboard/{self.whiteboard.id}/', 'headers': [], 'user': user}
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(timeout=5))['type'], 'websocket.accept')
+        return communicator, await self.receive(communicator)
+        
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(timeout=5))['text'])
+        
+    async def send(self, communicator, message):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+        return await self.receive(communicator)
+        
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(timeout=5)
+        
+    def test_snapshot_matches_the_api(self):
+        """Test that joining clients get the board from memory in the API's format"""
+        StickyNoteImage.objects.create(sticky_note=self.note, image='sticky_notes/room.png', order=1)
+        
+        async def join():
+            communicator, snapshot = await self.connect(self.owner)
+            await self.disconnect(communicator)
+            return snapshot
+            
+        snapshot = async_to_sync(join)()
+        self.assertEqual(snapshot['type'], 'room_snapshot')
+        notes = StickyNote.objects.filter(whiteboard=self.whiteboard).order_by('id')
+        expected = [{**note, 'text_version': 0} for note in StickyNoteSerializer(notes, many=True).data]
+        self.assertEqual(snapshot['sticky_notes'], json.loads(json.dumps(expected)))
+        self.assertEqual(snapshot['note_groups'], json.loads(json.dumps(NoteGroupSerializer([self.group], many=True).data)))
+        self.assertEqual([(d['id'], d['path_data']) for d in snapshot['drawings']], [(self.drawing.id, 'M 0,0 L 5,5')])
+        
+    def test_ops_are_applied_in_memory_and_written_back(self):
+        """Test that socket edits are validated, fanned out normalized and flushed once when the room empties"""
+        version = self.whiteboard.version
+        
+        async def edit():
+            owner, _ = await self.connect(self.owner)
+            peer, _ = await self.connect(self.owner)
+            for x in (50, 100):
+                sent = await self.send(owner, {'type': 'note_updated', 'note': {'id': self.note.id, 'x': x, 'created_by': 'ignored'}})
+                self.assertEqual(await self.receive(peer), sent)
+            self.assertEqual(sent['note']['x'], 100.0)
+            self.assertEqual(sent['note']['created_by']['username'], 'roomowner')
+            
+            error = await self.send(owner, {'type': 'note_updated', 'note': {'id': self.note.id, 'color': 'chartreuse'}})
+            self.assertEqual(error['type'], 'error')
+            moved = await self.send(owner, {'type': 'group_updated', 'group': {'id': self.group.id, 'offset_x': 40}})
+            self.assertEqual(await self.receive(peer), moved)
+            
+            # Not written back yet, but served to new clients from memory
+            self.assertEqual(await StickyNote.objects.filter(id=self.note.id).values_list('x', flat=True).afirst(), 1)
+            late, snapshot = await self.connect(self.owner)
+            self.assertEqual({n['id']: n['x'] for n in snapshot['sticky_notes']}[self.note.id], 100)
+            for communicator in (owner, peer, late):
+                await self.disconnect(communicator)
+                
+        async_to_sync(edit)()
+        self.note.refresh_from_db()
+        self.group.refresh_from_db()
+        self.whiteboard.refresh_from_db()
+        self.assertEqual((self.note.x, self.note.color, self.group.offset_x), (100, 'yellow', 40))
+        self.assertGreater(self.whiteboard.version, version)
+        operations = BoardOperation.objects.filter(whiteboard=self.whiteboard)
+        self.assertEqual(list(operations.values_list('op_type', 'previous')), [
+            ('note_updated', {'x': 1.0}), ('group_updated', {'offset_x': 10.0}),
+        ])
+        self.assertEqual(load_state(self.whiteboard)[0]['sticky_notes'][str(self.note.id)]['x'], 100)
+        
+    def test_viewers_cannot_change_the_board(self):
+        """Test that ops from users without write access are rejected and not relayed"""
+        async def edit():
+            viewer, _ = await self.connect(self.viewer)
+            peer, _ = await self.connect(self.viewer)
+            reply = await self.send(viewer, {'type': 'note_updated', 'note': {'id': self.note.id, 'x': 9}})
+            self.assertEqual(reply['type'], 'error')
+            # Everything else is still relayed
+            self.assertEqual(await self.send(viewer, {'type': 'cursor', 'x': 1}), {'type': 'cursor', 'x': 1})
+            self.assertEqual(await self.receive(peer), {'type': 'cursor', 'x': 1})
+            for communicator in (viewer, peer):
+                await self.disconnect(communicator)
+                
+        async_to_sync(edit)()
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.x, 1)
+        
+    def test_rest_changes_announced_over_the_socket_are_reloaded(self):
+        """Test that images, stacking and grouping in a note_updated op are taken from the database"""
+        def change_through_the_api():
+            image = StickyNoteImage.objects.create(sticky_note=self.note, image='sticky_notes/new.png')
+            group = NoteGroup.objects.create(whiteboard=self.whiteboard, created_by=self.owner, offset_x=100, scale=2)
+            StickyNote.objects.filter(id=self.note.id).update(order_key='zz', note_group=group, x=-49.5, y=1)
+            return image.id, group.id
+            
+        async def announce():
+            owner, _ = await self.connect(self.owner)
+            peer, _ = await self.connect(self.owner)
+            # Unflushed move, replaced by the grouping's converted coordinates
+            await self.send(owner, {'type': 'note_updated', 'note': {'id': self.note.id, 'x': 70}})
+            await self.receive(peer)
+            image_id, group_id = await sync_to_async(change_through_the_api)()
+            
+            # What the canvas sends after an upload: the whole note, stale fields included
+            sent = await self.send(owner, {'type': 'note_updated', 'note': {
+                'id': self.note.id, 'images': [{'id': image_id}], 'order_key': 'stale', 'note_group': group_id,
+            }})
+            self.assertEqual(await self.receive(peer), sent)
+            note = sent['note']
+            self.assertEqual([image['id'] for image in note['images']], [image_id])
+            self.assertEqual((note['order_key'], note['note_group'], note['x']), ('zz', group_id, -49.5))
+            
+            moved = await self.send(owner, {'type': 'group_updated', 'group': {'id': group_id, 'offset_x': 120}})
+            self.assertEqual(moved['group']['offset_x'], 120)
+            late, snapshot = await self.connect(self.owner)
+            self.assertEqual({n['id']: n['images'] for n in snapshot['sticky_notes']}[self.note.id][0]['id'], image_id)
+            self.assertIn(group_id, [group['id'] for group in snapshot['note_groups']])
+            for communicator in (owner, peer, late):
+                await self.disconnect(communicator)
+            return group_id
+            
+        group_id = async_to_sync(announce)()
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.x, self.note.order_key), (-49.5, 'zz'))
+        self.assertEqual(NoteGroup.objects.get(id=group_id).offset_x, 120)
+        
+    def test_sockets_without_a_role_get_no_snapshot(self):
+        """Test that anonymous sockets and strangers are closed instead of being sent the board"""
+        stranger = User.objects.create_user(username='roomstranger', password='testpass123')
+        
+        async def connect(user):
+            scope = {'type': 'websocket', 'path': f'/ws/whiteboard/{self.whiteboard.id}/', 'headers': [], 'user': user}
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            message = await communicator.receive_output(timeout=5)
+            await communicator.wait(timeout=5)
+            return message
+            
+        for user in (AnonymousUser(), stranger):
+            self.assertEqual(async_to_sync(connect)(user)['type'], 'websocket.close')
+        self.assertEqual(rooms.rooms, {})
+        
+    def test_creates_and_deletes_are_checked_against_the_database(self):
+        """Test that announced creates and deletes are only applied once the API made them"""
+        async def announce():
+            owner, _ = await self.connect(self.owner)
+            self.assertEqual((await self.send(owner, {'type': 'note_added', 'note': {'id': 999999}}))['type'], 'error')
+            self.assertEqual((await self.send(owner, {'type': 'note_deleted', 'noteId': self.note.id}))['type'], 'error')
+            
+            note = await StickyNote.objects.acreate(whiteboard=self.whiteboard, content='Fresh', created_by=self.owner)
+            added = await self.send(owner, {'type': 'note_added', 'note': {'id': note.id, 'content': 'Forged'}})
+            self.assertEqual(added['note']['content'], 'Fresh')
+            stroke = await Drawing.objects.acreate(whiteboard=self.whiteboard, path_data='M 1,1 L 2,2', created_by=self.owner)
+            drawn = await self.send(owner, {'type': 'drawing_added', 'drawing': {'id': stroke.id}})
+            self.assertEqual(drawn['drawing']['created_by'], {'id': self.owner.id, 'username': 'roomowner'})
+            
+            await StickyNote.objects.filter(id=self.note.id).adelete()
+            self.assertEqual(await self.send(owner, {'type': 'note_deleted', 'noteId': self.note.id}), {'type': 'note_deleted', 'noteId': self.note.id})
+            room = rooms.rooms[self.whiteboard.id]
+            await self.disconnect(owner)
+            return room, note.id
+            
+        room, note_id = async_to_sync(announce)()
+        self.assertEqual(set(room.notes), {self.member.id, note_id})
+        self.assertEqual(len(room.strokes), 2)
+        
+    def test_rejoining_reads_changes_made_without_clients(self):
+        """Test that the room is dropped with its last client, so REST changes made meanwhile show on rejoin"""
+        async def rejoin():
+            owner, _ = await self.connect(self.owner)
+            await self.disconnect(owner)
+            self.assertNotIn(self.whiteboard.id, rooms.rooms)
+            
+            await StickyNote.objects.filter(id=self.note.id).aupdate(content='Edited elsewhere')
+            note = await StickyNote.objects.acreate(whiteboard=self.whiteboard, content='Fresh', created_by=self.owner)
+            owner, snapshot = await self.connect(self.owner)
+            await self.disconnect(owner)
+            return note.id, {n['id']: n['content'] for n in snapshot['sticky_notes']}
+            
+        note_id, contents = async_to_sync(rejoin)()
+        self.assertEqual(contents[self.note.id], 'Edited elsewhere')
+        self.assertEqual(contents[note_id], 'Fresh')
+        
+    def test_concurrent_text_deltas_converge(self):
+        """Test that deltas typed against the same version are merged and written back once"""
+        async def type_text():
+            alice, _ = await self.connect(self.owner)
+            bob, _ = await self.connect(self.owner)
+            first = {'type': 'note_text', 'noteId': self.note.id, 'version': 0, 'ops': [{'pos': 4, 'insert': ' 😀 board'}], 'client': 'a'}
+            second = {'type': 'note_text', 'noteId': self.note.id, 'version': 0, 'ops': [{'pos': 0, 'delete': 1}, {'pos': 0, 'insert': 'l'}], 'client': 'b'}
+            self.assertEqual(await self.send(alice, first), {**first, 'version': 1})
+            await self.receive(bob)
+            # Bob had not seen Alice's delta yet
+            rebased = await self.send(bob, second)
+            self.assertEqual((rebased['version'], rebased['ops']), (2, second['ops']))
+            self.assertEqual(await self.receive(alice), rebased)
+            # Alice, on version 2, deletes the emoji: two UTF-16 code units
+            third = await self.send(alice, {'type': 'note_text', 'noteId': self.note.id, 'version': 2, 'ops': [{'pos': 5, 'delete': 3}]})
+            self.assertEqual(third['version'], 3)
+            await self.receive(bob)
+
+            stale = {'type': 'note_text', 'noteId': self.note.id, 'version': 3, 'ops': [{'pos': 99, 'insert': 'x'}]}
+            error = await self.send(bob, stale)
+            self.assertEqual((error['type'], error['op']), ('error', stale))
+            resync = await self.receive(bob)
+            self.assertEqual((resync['type'], resync['note']['content'], resync['note']['text_version']), ('note_updated', 'live board', 3))
+            for communicator in (alice, bob):
+                await self.disconnect(communicator)
+
+        async_to_sync(type_text)()
+        self.assertEqual(StickyNote.objects.get(id=self.note.id).content, 'live board')
+        operations = BoardOperation.objects.filter(whiteboard=self.whiteboard)
+        self.assertEqual(list(operations.values_list('op_type', 'previous')), [('note_updated', {'content': 'Live'})])
+
+    @override_settings(ROOM_FLUSH_SECONDS=0.01, ROOM_IDLE_SECONDS=0.01)
+    def test_timer_flush_and_idle_eviction(self):
+        """Test that changes are written back on the timer and idle rooms are dropped"""
+        async def edit():
+            owner, _ = await self.connect(self.owner)
+            await self.send(owner, {'type': 'note_updated', 'note': {'id': self.note.id, 'content': 'Flushed'}})
+            for _ in range(100):
+                if await StickyNote.objects.filter(id=self.note.id, content='Flushed').aexists():
+                    break
+                await asyncio.sleep(0.01)
+            self.assertIn(self.whiteboard.id, rooms.rooms)
+            await self.disconnect(owner)
+            for _ in range(100):
+                if self.whiteboard.id not in rooms.rooms:
+                    break
+                await asyncio.sleep(0.01)
+                
+        async_to_sync(edit)()
+        self.assertEqual(StickyNote.objects.get(id=self.note.id).content, 'Flushed')
+        self.assertNotIn(self.whiteboard.id, rooms.rooms)
+
+
+class TextDeltaTests(TestCase):
+    def test_apply_counts_utf16_code_units(self):
+        """Test that positions are counted like browsers count string indices"""
+        self.assertEqual(textops.apply('a😀b', [{'pos': 3, 'insert': 'c'}, {'pos': 0, 'delete': 1}]), '😀cb')
+        with self.assertRaises(ValueError):
+            textops.apply('a😀b', [{'pos': 2, 'delete': 1}])
+        with self.assertRaises(ValueError):
+            textops.apply('ab', [{'pos': 3, 'insert': 'c'}])
+        with self.assertRaises(ValueError):
+            textops.clean([{'pos': 0, 'insert': 'a', 'delete': 1}])
+
+    def test_transformed_deltas_converge(self):
+        """Test that both orders of applying concurrent deltas give the same text"""
+        cases = [
+            ('hello', [{'pos': 5, 'insert': '!'}], [{'pos': 0, 'insert': 'oh, '}]),
+            ('hello', [{'pos': 1, 'delete': 3}], [{'pos': 2, 'insert': 'XY'}]),
+            ('hello', [{'pos': 0, 'delete': 4}], [{'pos': 2, 'delete': 3}]),
+            ('hello', [{'pos': 2, 'insert': 'a'}], [{'pos': 2, 'insert': 'b'}, {'pos': 0, 'delete': 1}]),
+            ('', [{'pos': 0, 'insert': 'a'}], [{'pos': 0, 'insert': 'b'}]),
+        ]
+        for text, a, b in cases:
+            for a_first in (True, False):
+                a2, b2 = textops.transform(a, b, a_first)
+                self.assertEqual(textops.apply(textops.apply(text, b), a2), textops.apply(textops.apply(text, a), b2))
+        # Tied inserts: the one applied first stays in front
+        a2, _ = textops.transform([{'pos': 2, 'insert': 'a'}], [{'pos': 2, 'insert': 'b'}])
+        self.assertEqual(textops.apply('hello', [{'pos': 2, 'insert': 'b'}, *a2]), 'heballo')
+
+
+class ViewportFanoutTests(TestCase):
+    def setUp(self):
+        self.path = '/ws/whiteboard/4242/'
+        
+    async def connect(self):
+        scope = {'type': 'websocket', 'path': self.path, 'headers': [], 'user': AnonymousUser()}
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(timeout=5))['type'], 'websocket.accept')
+        return communicator
+        
+    async def send(self, communicator, message):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+        
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(timeout=5))['text'])
+        
+    async def disconnect(self, *communicators):
+        for communicator in communicators:
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(timeout=5)
+            
+    def note(self, x, **fields):
+        return {'type': 'note_updated', 'note': {'id': 1, 'x': x, 'y': 100, 'width': 200, 'height': 200, 'note_group': None, **fields}}
+        
+    def test_out_of_view_messages_are_dropped_or_batched(self):
+        """Test that ephemeral messages outside the viewport are dropped and durable ones batched in order"""
+        async def exchange():
+            sender, viewer = await self.connect(), await self.connect()
+            # Shows board x -500..1500 (plus margin) at zoom 0.5 on a 1000x800 canvas
+            await self.send(viewer, {'type': 'viewport', 'zoom': 0.5, 'pan_x': 250, 'pan_y': 0, 'width': 1000, 'height': 800})
+            held = [
+                self.note(4000), {**self.note(4050), 'type': 'note_added'}, self.note(4100),
+                self.note(4200), {'type': 'drawing_added', 'drawing': {'id': 7, 'path_data': 'M 5000,5000 L 5100,5100'}},
+            ]
+            for message in [
+                {'type': 'cursor', 'x': 9000, 'y': 10},
+                {'type': 'note_moving', 'noteId': 1, 'x': 3000, 'y': 0, 'width': 200, 'height': 200, 'note_group': None},
+                *held,
+                {'type': 'cursor', 'x': 100, 'y': 10},
+            ]:
+                await self.send(sender, message)
+                # The sender registered no viewport and gets everything
+                self.assertEqual(await self.receive(sender), message)
+                
+            # The held changes come first, consecutive updates of a note merged
+            self.assertEqual(await self.receive(viewer), {'type': 'batch', 'messages': [held[0], held[1], held[3], held[4]]})
+            self.assertEqual(await self.receive(viewer), {'type': 'cursor', 'x': 100, 'y': 10})
+            self.assertTrue(await viewer.receive_nothing(timeout=0.1))
+            await self.disconnect(sender, viewer)
+            
+        async_to_sync(exchange)()
+        
+    @override_settings(VIEWPORT_BATCH_SECONDS=0.01)
+    def test_held_messages_are_sent_on_a_timer(self):
+        """Test that held-back changes arrive by themselves, and that bad viewports are rejected"""
+        async def exchange():
+            viewer = await self.connect()
+            await self.send(viewer, {'type': 'viewport', 'zoom': 0, 'pan_x': 0, 'pan_y': 0, 'width': 1000, 'height': 800})
+            self.assertEqual((await self.receive(viewer))['type'], 'error')
+            await self.send(viewer, {'type': 'viewport', 'zoom': 1, 'pan_x': 0, 'pan_y': 0, 'width': 1000, 'height': 800})
+            await self.send(viewer, self.note(-5000))
+            self.assertEqual(await self.receive(viewer), {'type': 'batch', 'messages': [self.note(-5000)]})
+            await self.disconnect(viewer)
+            
+        async_to_sync(exchange)()
+
+
+@override_settings(TILE_LEVELS=3)
+class DrawingTileTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Tiled', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+    def draw(self, path_data, **fields):
+        return Drawing.objects.create(whiteboard=self.whiteboard, path_data=path_data, created_by=self.user, **fields)
+        
+    def versions(self):
+        return {(t.level, t.x, t.y): t.version for t in DrawingTile.objects.filter(whiteboard=self.whiteboard)}
+        
+    def test_tiles_are_rendered_and_invalidated_where_strokes_change(self):
+        """Test that tiles are seeded from existing strokes and only re-rendered where strokes change"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.draw('M 10,10 L 100,100', color='#ff0000', stroke_width=8)
+            far = self.draw('M 5000,5000 L 5100,5100')
+            # Strokes drawn before the tiles existed are picked up when they are first asked for
+            DrawingTile.objects.all().delete()
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/tiles/?level=1')
+            self.assertEqual((response.data['ready'], response.data['tiles']), (False, []))
+            
+            self.assertEqual(render_tiles(self.whiteboard.id), 6)
+            versions = self.versions()
+            self.assertEqual(set(versions), {
+                (1, 0, 0), (2, 0, 0), (3, 0, 0), (1, 9, 9), (2, 4, 4), (3, 2, 2),
+            })
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/tiles/?level=1')
+            self.assertTrue(response.data['ready'])
+            self.assertEqual(response.data['span'], 512)
+            self.assertEqual(response.data['tiles'][0], {'x': 0, 'y': 0, 'url': f'/media/tiles/board_{self.whiteboard.id}/1/0_0.png?v=1'})
+            with Image.open(os.path.join(self.media_root, tile_name(self.whiteboard.id, 1, 0, 0))) as image:
+                # Board (50, 50) at zoom 1/2
+                self.assertEqual(image.getpixel((25, 25))[0], 255)
+                self.assertEqual(image.getpixel((200, 25))[3], 0)
+                
+            self.draw('M 20,300 L 40,320')
+            far.delete()
+            self.assertEqual(render_tiles(self.whiteboard.id), 3)
+            self.assertEqual(self.versions(), {(1, 0, 0): 2, (2, 0, 0): 2, (3, 0, 0): 2})
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, tile_name(self.whiteboard.id, 1, 9, 9))))
+            self.assertEqual(render_tiles(self.whiteboard.id), 0)
+            
+    def test_tile_level_is_validated(self):
+        """Test that only the configured levels can be listed"""
+        for level in ('0', '4', 'x'):
+            response = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/tiles/?level={level}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(**CACHED_AUTH_SETTINGS)
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.admin = User.objects.create_user(username='admin', password='adminpass', is_staff=True)
+        self.client = APIClient()
+        self.client.post('/api/auth/login/', {'username': 'testuser', 'password': 'testpass'}, format='json')
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(user=self.admin)
+        
+    def test_session_and_user_are_served_from_the_cache(self):
+        """Test that an authenticated request does not read the session or user rows"""
+        self.client.get('/api/custom-colors/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/custom-colors/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tables = ' '.join(query['sql'] for query in captured.captured_queries if query['sql'].startswith('SELECT'))
+        self.assertNotIn('"auth_user"', tables)
+        self.assertNotIn('"django_session"', tables)
+        
+    def test_user_edits_and_logout_invalidate_the_cache(self):
+        """Test that editing a user through the API and logging out drop the cached user"""
+        self.client.get('/api/custom-colors/')
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+        response = self.admin_client.patch(f'/api/users/{self.user.id}/', {'is_active': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+        self.assertEqual(self.client.get('/api/custom-colors/').status_code, status.HTTP_403_FORBIDDEN)
+        
+        User.objects.filter(id=self.user.id).update(is_active=True)
+        self.client.post('/api/auth/login/', {'username': 'testuser', 'password': 'testpass'}, format='json')
+        self.client.get('/api/custom-colors/')
+        self.client.post('/api/auth/logout/')
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+        self.assertEqual(self.client.get('/api/custom-colors/').status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'stickytux_cache'}},
+    **CACHED_AUTH_SETTINGS,
+)
+class SharedCacheLogoutTests(TestCase):
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = APIClient()
+        self.client.post('/api/auth/login/', {'username': 'testuser', 'password': 'testpass'}, format='json')
+        
+    def test_logout_reaches_other_workers(self):
+        """Test that a session logged out on one worker is rejected through another worker's cache"""
+        self.client.get('/api/custom-colors/')
+        session_key = self.client.cookies['sessionid'].value
+        # What another worker process would open for the same cache
+        other = caches.create_connection('default')
+        session_cache_key = CachedSessionStore(session_key).cache_key
+        self.assertIsNotNone(other.get(session_cache_key))
+        self.assertIsNotNone(other.get(user_cache_key(self.user.id)))
+        
+        self.client.post('/api/auth/logout/')
+        self.assertIsNone(other.get(session_cache_key))
+        self.assertIsNone(other.get(user_cache_key(self.user.id)))
+        replay = APIClient()
+        replay.cookies['sessionid'] = session_key
+        self.assertEqual(replay.get('/api/custom-colors/').status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+class ViewSettingsBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.stranger = User.objects.create_user(username='stranger', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Panned', owner=self.user)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.url = '/api/view-settings/for_whiteboard/'
+        self.addCleanup(view_settings_buffer.flush)
+        
+    def save(self, client=None, **values):
+        return (client or self.client).post(self.url, {'whiteboard': self.whiteboard.id, **values}, format='json')
+        
+    def test_saves_are_buffered_and_flushed_in_bulk(self):
+        """Test that only the latest save is kept, served from the buffer and written on flush"""
+        self.assertEqual(self.save(zoom=1.5, pan_x=10).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.save(zoom=2, pan_x=20, pan_y=-5)
+        # Access was checked by the first save; only the session is saved
+        self.assertFalse([query for query in captured.captured_queries if 'whiteboard_' in query['sql']])
+        self.assertEqual((response.data['zoom'], response.data['pan_x'], response.data['pan_y']), (2.0, 20.0, -5.0))
+        self.assertFalse(WhiteboardViewSettings.objects.exists())
+        
+        self.assertEqual(self.client.get(self.url, {'whiteboard_id': self.whiteboard.id}).data['zoom'], 2.0)
+        self.assertEqual(self.client.get(f'/api/live/view-settings/{self.whiteboard.id}/').json()['pan_x'], 20.0)
+        
+        self.assertEqual(view_settings_buffer.flush(), 1)
+        settings_row = WhiteboardViewSettings.objects.get(user=self.user, whiteboard=self.whiteboard)
+        self.assertEqual((settings_row.zoom, settings_row.pan_x, settings_row.pan_y), (2.0, 20.0, -5.0))
+        self.save(zoom=3)
+        self.assertEqual(view_settings_buffer.flush(), 1)
+        self.assertEqual(WhiteboardViewSettings.objects.get().zoom, 3.0)
+        
+    def test_access_and_values_are_checked(self):
+        """Test that saves need board access and numeric values, and deleted boards are skipped"""
+        stranger = APIClient()
+        stranger.force_login(self.stranger)
+        self.assertEqual(self.save(stranger, zoom=2).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.save(zoom='far').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(view_settings_buffer.flush(), 0)
+        
+        self.save(zoom=2)
+        self.whiteboard.delete()
+        self.assertEqual(view_settings_buffer.flush(), 0)
+        
+    @override_settings(VIEW_SETTINGS_FLUSH_SECONDS=0)
+    def test_write_through(self):
+        """Test that saves are written right away when buffering is off"""
+        response = self.client.post(f'/api/live/view-settings/{self.whiteboard.id}/', {'zoom': 0.5}, format='json')
+        self.assertEqual(response.json()['id'], WhiteboardViewSettings.objects.get(zoom=0.5).id)
+
+
+@override_settings(DRAWING_COMPACT_AFTER_SECONDS=0, DRAWING_COMPACT_MIN_STROKES=1)
+class BoardBootstrapTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.viewer = User.objects.create_user(username='viewer', password='testpass')
+        self.whiteboard = Whiteboard.objects.create(name='Bootstrapped', owner=self.user)
+        WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=self.viewer, role='view')
+        self.note = StickyNote.objects.create(whiteboard=self.whiteboard, content='Hello', created_by=self.user)
+        StickyNoteImage.objects.create(sticky_note=self.note, image='sticky_notes/boot.png')
+        NoteGroup.objects.create(whiteboard=self.whiteboard, offset_x=5, created_by=self.user)
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 5,5', created_by=self.user)
+        compact_board(self.whiteboard.id)
+        Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 9,9 L 5,5', created_by=self.user)
+        WhiteboardViewSettings.objects.create(user=self.user, whiteboard=self.whiteboard, zoom=2)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.client.post('/api/custom-colors/', {'name': 'custom1', 'hex_color': '#123456'}, format='json')
+        self.url = f'/api/whiteboards/{self.whiteboard.id}/bootstrap/'
+        
+    def bootstrap(self, client=None):
+        response = (client or self.client).get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        return response, json.loads(read_stream(response))
+        
+    def test_bootstrap_matches_the_separate_endpoints(self):
+        """Test that one response carries the board, view settings, colors, role and a CSRF token"""
+        with CaptureQueriesContext(connection) as captured:
+            response, data = self.bootstrap()
+        # The prefetched board plus view settings, log position and colors
+        board_queries = [q for q in captured.captured_queries if 'whiteboard_' in q['sql']]
+        self.assertLessEqual(len(board_queries), 10)
+        board = self.client.get(f'/api/whiteboards/{self.whiteboard.id}/').json()
+        self.assertEqual(data['whiteboard'], board)
+        self.assertEqual(len(board['drawings']), 2)
+        self.assertEqual(data['view_settings'], self.client.get(
+            '/api/view-settings/for_whiteboard/', {'whiteboard_id': self.whiteboard.id}
+        ).json())
+        self.assertEqual(data['custom_colors'], self.client.get('/api/custom-colors/').json())
+        self.assertEqual(data['role'], 'owner')
+        # The cookie holds the secret, the response a masked token for it
+        self.assertTrue(response.cookies['csrftoken'].value and data['csrftoken'])
+        
+        viewer = APIClient()
+        viewer.force_login(self.viewer)
+        _, data = self.bootstrap(viewer)
+        self.assertEqual((data['role'], data['view_settings'], data['custom_colors']), ('view', {'zoom': 1.0, 'pan_x': 0.0, 'pan_y': 0.0}, []))
+        
+        stranger = APIClient()
+        stranger.force_login(User.objects.create_user(username='stranger', password='testpass'))
+        self.assertEqual(stranger.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_resume_token_triggers_resync_when_behind(self):
+        """Test that a socket resuming from a stale bootstrap is told to reload"""
+        _, data = self.bootstrap()
+        
+        async def connect(token):
+            scope = {
+                'type': 'websocket', 'path': f'/ws/whiteboard/{self.whiteboard.id}/',
+                'query_string': f'resume={token}'.encode(), 'headers': [], 'user': self.user,
+            }
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output(timeout=5))['type'], 'websocket.accept')
+            return communicator
+            
+        async def first_message(token):
+            communicator = await connect(token)
+            if await communicator.receive_nothing(timeout=0.2):
+                message = None
+            else:
+                message = json.loads((await communicator.receive_output(timeout=5))['text'])
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(timeout=5)
+            return message
+            
+        self.assertIsNone(async_to_sync(first_message)(data['resume_token']))
+        self.client.patch(f'/api/sticky-notes/{self.note.id}/', {'x': 99}, format='json')
+        message = async_to_sync(first_message)(data['resume_token'])
+        self.assertEqual(message['type'], 'resync')
+        self.assertIsNone(async_to_sync(first_message)(message['resume_token']))
+        self.assertIsNone(async_to_sync(first_message)('forged'))
+        
+    @override_settings(ROOM_STATE=True, ROOM_FLUSH_SECONDS=60, ROOM_IDLE_SECONDS=60)
+    def test_resume_token_does_not_keep_revoked_access(self):
+        """Test that a socket connecting with a token from before a revocation is refused"""
+        self.addCleanup(rooms.rooms.clear)
+        viewer = APIClient()
+        viewer.force_login(self.viewer)
+        _, data = self.bootstrap(viewer)
+        WhiteboardAccess.objects.filter(user=self.viewer).delete()
+        
+        async def connect():
+            scope = {
+                'type': 'websocket', 'path': f'/ws/whiteboard/{self.whiteboard.id}/',
+                'query_string': f"resume={data['resume_token']}".encode(), 'headers': [], 'user': self.viewer,
+            }
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            message = await communicator.receive_output(timeout=5)
+            await communicator.wait(timeout=5)
+            return message
+            
+        self.assertEqual(async_to_sync(connect)()['type'], 'websocket.close')
+
+
+@override_settings(DRAWING_COMPACT_AFTER_SECONDS=0, DRAWING_COMPACT_MIN_STROKES=1, DRAWING_LAYER_MAX_STROKES=2)
+class BoardDuplicateTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.viewer = User.objects.create_user(username='viewer', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.whiteboard = Whiteboard.objects.create(name='Retro', owner=self.user, background_color='#123456', is_template=True)
+        WhiteboardAccess.objects.create(whiteboard=self.whiteboard, user=self.viewer, role='view')
+        
+    def test_duplicate_copies_contents_and_shares_media(self):
+        """Test that groups, notes, images and drawings are copied with remapped ids and shared files"""
+        with override_settings(MEDIA_ROOT=self.media_root, BOARD_TRANSFER_CHUNK_SIZE=2):
+            group = NoteGroup.objects.create(whiteboard=self.whiteboard, offset_x=50, scale=2, created_by=self.user)
+            notes = [
+                StickyNote.objects.create(
+                    whiteboard=self.whiteboard, content=f'Note {i}', x=i, created_by=self.viewer,
+                    note_group=group if i % 2 else None,
+                )
+                for i in range(5)
+            ]
+            image = StickyNoteImage.objects.create(sticky_note=notes[3], image=ContentFile(b'bytes', name='shared.png'), order=1)
+            for i in range(3):
+                Drawing.objects.create(whiteboard=self.whiteboard, path_data=f'M 0,0 L {i},{i}', created_by=self.user)
+            compact_board(self.whiteboard.id)
+            Drawing.objects.create(whiteboard=self.whiteboard, path_data='M 0,0 L 9,9', created_by=self.user)
+            
+            response = self.client.post(f'/api/whiteboards/{self.whiteboard.id}/duplicate/', {}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertNotIn('sticky_notes', response.data)
+            
+            copy = Whiteboard.objects.get(id=response.data['id'])
+            self.assertEqual((copy.name, copy.owner, copy.background_color, copy.is_template), ('Retro (copy)', self.user, '#123456', False))
+            self.assertFalse(copy.access_rights.exists())
+            copied_group = copy.note_groups.get()
+            self.assertNotEqual(copied_group.id, group.id)
+            self.assertEqual((copied_group.offset_x, copied_group.scale), (50, 2))
+            
+            copied = list(copy.sticky_notes.order_by('x'))
+            self.assertEqual([n.content for n in copied], [f'Note {i}' for i in range(5)])
+            self.assertEqual([n.order_key for n in copied], [n.order_key for n in notes])
+            self.assertEqual([n.note_group_id for n in copied], [None, copied_group.id, None, copied_group.id, None])
+            self.assertEqual(copied[0].created_by, self.viewer)
+            
+            copied_image = StickyNoteImage.objects.get(sticky_note__whiteboard=copy)
+            self.assertEqual((copied_image.sticky_note, copied_image.order), (copied[3], 1))
+            self.assertEqual(copied_image.image.name, image.image.name)
+            self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'sticky_notes'))), 1)
+            
+            self.assertEqual(
+                sorted(copy.drawings.values_list('path_data', flat=True)),
+                ['M 0,0 L 0,0', 'M 0,0 L 1,1', 'M 0,0 L 2,2', 'M 0,0 L 9,9'],
+            )
+            
+            # Deleting the source leaves the copy's files alone
+            self.client.delete(f'/api/whiteboards/{self.whiteboard.id}/')
+            purge_board(self.whiteboard.id)
+            self.assertTrue(os.path.exists(copied_image.image.path))
+            
+    def test_viewers_can_duplicate_and_strangers_cannot(self):
+        """Test that view access is enough to copy a board and the copy belongs to the caller"""
+        self.client.force_authenticate(user=self.viewer)
+        response = self.client.post(
+            f'/api/whiteboards/{self.whiteboard.id}/duplicate/',
+            {'name': 'Sprint 12 retro', 'is_template': False}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Whiteboard.objects.get(id=response.data['id']).owner, self.viewer)
+        self.assertEqual(response.data['name'], 'Sprint 12 retro')
+        
+        response = self.client.post(f'/api/whiteboards/{self.whiteboard.id}/duplicate/', {'is_template': 'maybe'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        # Form posts send booleans as strings
+        response = self.client.post(f'/api/whiteboards/{self.whiteboard.id}/duplicate/', {'is_template': 'true'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Whiteboard.objects.get(id=response.data['id']).is_template)
+        
+        self.client.force_authenticate(user=User.objects.create_user(username='stranger', password='pass'))
+        response = self.client.post(f'/api/whiteboards/{self.whiteboard.id}/duplicate/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_duplicate_gives_client_groups_fresh_ids(self):
+        """Test that notes sharing a group_id still share one in the copy, but not the source's"""
+        for i, group_id in enumerate(['a', 'a', 'b', None]):
+            StickyNote.objects.create(whiteboard=self.whiteboard, content=f'Note {i}', x=i, group_id=group_id, created_by=self.user)
+        
+        with override_settings(BOARD_TRANSFER_CHUNK_SIZE=2):
+            copy = duplicate_board(self.whiteboard, self.user)
+        
+        copied = list(copy.sticky_notes.order_by('x').values_list('group_id', flat=True))
+        self.assertEqual(copied[0], copied[1])
+        self.assertNotIn(copied[0], {'a', 'b', None})
+        self.assertNotIn(copied[2], {'a', 'b', None, copied[0]})
+        self.assertIsNone(copied[3])
+        
+    def test_list_filters_templates(self):
+        """Test that ?is_template= narrows the board list"""
+        Whiteboard.objects.create(name='Plain', owner=self.user)
+        response = self.client.get('/api/whiteboards/?is_template=true')
+        self.assertEqual([b['name'] for b in response.data], ['Retro'])
+        response = self.client.get('/api/whiteboards/?is_template=false')
+        self.assertEqual([b['name'] for b in response.data], ['Plain'])
@@ -0,0 +1,117 @@
+"""
+Text deltas for editing sticky note content over the WebSocket.
+
+A delta is a list of operations applied in order, each either
+``{"pos": n, "insert": "text"}`` or ``{"pos": n, "delete": count}``.
+Positions and counts are in UTF-16 code units, which is how the browser
+indexes strings, so emoji and other astral characters count twice.
+
+Concurrent deltas are reconciled by operational transformation: the room
+(see rooms.py) numbers the deltas it applies to a note, and a delta made
+against an older version is transformed against the ones applied since.
+Clients do the same with the deltas they receive while their own are in
+flight, so everyone converges on the same text. The frontend has a port
+of ``transform()`` in src/services/textDelta.js; keep the two in step.
+"""
+
+# Operations accepted in one delta
+MAX_OPS = 100
+
+
+def clean(ops):
+    """Validate a delta from a client; raises ValueError"""
+    if not isinstance(ops, list) or not 0 < len(ops) <= MAX_OPS:
+        raise ValueError(f'ops must be a list of 1 to {MAX_OPS} operations')
+    cleaned = []
+    for op in ops:
+        if not isinstance(op, dict) or not _count(op.get('pos'), 0):
+            raise ValueError('Every operation needs a pos')
+        if 'insert' in op and isinstance(op['insert'], str) and op['insert'] and 'delete' not in op:
+            cleaned.append({'pos': op['pos'], 'insert': op['insert']})
+        elif 'delete' in op and _count(op['delete'], 1) and 'insert' not in op:
+            cleaned.append({'pos': op['pos'], 'delete': op['delete']})
+        else:
+            raise ValueError('Every operation needs either a non-empty insert or a positive delete')
+    return cleaned
+
+
+def _count(value, minimum):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+
+def length(text):
+    """Length in UTF-16 code units"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def apply(text, ops):
+    """Apply a delta; raises ValueError if it does not fit the text"""
+    units = text.encode('utf-16-le')
+    for op in ops:
+        start = op['pos'] * 2
+        if 'insert' in op:
+            end = start
+        else:
+            end = start + op['delete'] * 2
+        if end > len(units):
+            raise ValueError('The operation is outside the text')
+        units = units[:start] + op.get('insert', '').encode('utf-16-le') + units[end:]
+    # Raises UnicodeDecodeError (a ValueError) if a surrogate pair was split
+    return units.decode('utf-16-le')
+
+
+def _transform_op(a, b, a_first):
+    """Operation ``a`` rewritten to apply after ``b``; both were made against the same text
+
+    ``a_first`` decides which insert goes first when both insert at the
+    same position. Returns a list: a delete can be split in two by an
+    insert into the range it removes.
+    """
+    pos = a['pos']
+    if 'insert' in b:
+        inserted = length(b['insert'])
+        if 'insert' in a:
+            if b['pos'] < pos or (b['pos'] == pos and not a_first):
+                pos += inserted
+            return [{**a, 'pos': pos}]
+        end = pos + a['delete']
+        if b['pos'] <= pos:
+            return [{**a, 'pos': pos + inserted}]
+        if b['pos'] >= end:
+            return [a]
+        # Keep the inserted text, delete around it
+        before = b['pos'] - pos
+        return [{'pos': pos, 'delete': before}, {'pos': pos + inserted, 'delete': a['delete'] - before}]
+
+    b_end = b['pos'] + b['delete']
+    if 'insert' in a:
+        if pos <= b['pos']:
+            return [a]
+        return [{**a, 'pos': max(pos - b['delete'], b['pos'])}]
+    end = pos + a['delete']
+    overlap = max(0, min(end, b_end) - max(pos, b['pos']))
+    count = a['delete'] - overlap
+    if count == 0:
+        return []
+    if pos >= b['pos']:
+        pos = max(pos - b['delete'], b['pos'])
+    return [{'pos': pos, 'delete': count}]
+
+
+def transform(a, b, a_first=False):
+    """Deltas ``a`` and ``b``, made against the same text, rewritten to apply after each other
+
+    Returns ``(a2, b2)`` such that applying ``b`` then ``a2`` gives the same
+    text as applying ``a`` then ``b2``.
+    """
+    if not a or not b:
+        return a, b
+    if len(a) > 1:
+        head, b = transform(a[:1], b, a_first)
+        rest, b = transform(a[1:], b, a_first)
+        return head + rest, b
+    if len(b) > 1:
+        a, head = transform(a, b[:1], a_first)
+        a, rest = transform(a, b[1:], a_first)
+        return a, head + rest
+    return _transform_op(a[0], b[0], a_first), _transform_op(b[0], a[0], not a_first)
@@ -0,0 +1,216 @@
+"""
+Raster tiles of the drawing strokes for zoomed-out views.
+
+Painting a board with 100k vector strokes at overview zoom is slow, so the
+strokes are also rendered into square ``settings.TILE_SIZE`` pixel PNG
+tiles with transparent backgrounds. Level ``n`` shows the board at zoom
+``1 / 2**n``, so one tile covers ``TILE_SIZE * 2**n`` board units, and
+tile ``(x, y)`` starts at board position ``(x, y)`` times that span.
+
+Only tiles a stroke touches exist (as DrawingTile rows). Adding, changing
+or deleting a stroke marks just the tiles its bounding box touches as
+dirty, and a debounced background job re-renders those with Pillow; a
+tile left without strokes is removed. The first time a board's tiles are
+asked for, the job enters all of its existing strokes (seeding).
+
+The rendered files are cached under ``MEDIA_ROOT``; the URLs carry the
+tile's version so browsers can cache them for good.
+"""
+import io
+import math
+import os
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .background import Debouncer
+from .compaction import iter_strokes
+from .models import Whiteboard, DrawingTile
+from .previews import parse_path_data
+
+# Tiles are drawn this many times larger and scaled down, which smooths
+# the lines Pillow draws without anti-aliasing
+SUPERSAMPLE = 2
+
+
+def tile_span(level):
+    """Board units covered by one tile side at a level"""
+    return settings.TILE_SIZE * 2 ** level
+
+
+def tile_name(whiteboard_id, level, x, y):
+    """Storage-relative path of a tile image"""
+    return f"{settings.TILE_DIR}/board_{whiteboard_id}/{level}/{x}_{y}.png"
+
+
+def tile_url(tile):
+    return f"{settings.MEDIA_URL}{tile_name(tile.whiteboard_id, tile.level, tile.x, tile.y)}?v={tile.version}"
+
+
+def stroke_bounds(path_data, stroke_width):
+    """Bounding box of a stroke including its width, or None if it has no points"""
+    points = parse_path_data(path_data)
+    if not points:
+        return None
+    pad = (stroke_width or 0) / 2
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+
+
+def _tile_range(bounds, level):
+    span = tile_span(level)
+    return (
+        range(math.floor(bounds[0] / span), math.floor(bounds[2] / span) + 1),
+        range(math.floor(bounds[1] / span), math.floor(bounds[3] / span) + 1),
+    )
+
+
+def _tiles_touched(bounds_list):
+    """Every ``(level, x, y)`` touched by the given bounding boxes"""
+    tiles = set()
+    for bounds in bounds_list:
+        for level in range(1, settings.TILE_LEVELS + 1):
+            xs, ys = _tile_range(bounds, level)
+            tiles.update((level, x, y) for x in xs for y in ys)
+    return tiles
+
+
+def _mark_dirty(whiteboard_id, tiles):
+    DrawingTile.objects.bulk_create(
+        [DrawingTile(whiteboard_id=whiteboard_id, level=level, x=x, y=y) for level, x, y in tiles],
+        update_conflicts=True, unique_fields=['whiteboard', 'level', 'x', 'y'], update_fields=['dirty'],
+    )
+
+
+def invalidate_strokes(whiteboard_id, strokes):
+    """Mark the tiles under the given strokes, ``(path_data, stroke_width)`` pairs, for re-rendering"""
+    if not settings.TILES_ENABLED:
+        return
+    bounds = [b for b in (stroke_bounds(path_data, width) for path_data, width in strokes) if b]
+    if not bounds:
+        return
+    _mark_dirty(whiteboard_id, _tiles_touched(bounds))
+    schedule_tiles(whiteboard_id)
+
+
+def render_tile(strokes, level, x, y):
+    """PNG bytes of one tile; ``strokes`` are ``(points, color, stroke_width)`` tuples"""
+    from PIL import Image, ImageDraw
+
+    span = tile_span(level)
+    scale = SUPERSAMPLE / 2 ** level
+    size = settings.TILE_SIZE * SUPERSAMPLE
+    origin_x, origin_y = x * span, y * span
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for points, color, stroke_width in strokes:
+        line = [((px - origin_x) * scale, (py - origin_y) * scale) for px, py in points]
+        width = max(1, round(stroke_width * scale))
+        try:
+            draw.line(line, fill=color, width=width, joint='curve')
+        except ValueError:
+            draw.line(line, fill='black', width=width, joint='curve')
+    image = image.resize((settings.TILE_SIZE, settings.TILE_SIZE), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _write(name, data):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a partial image
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _seed(whiteboard):
+    tiles = _tiles_touched(
+        bounds for bounds in (
+            stroke_bounds(stroke['path_data'], stroke['stroke_width']) for stroke in iter_strokes(whiteboard)
+        ) if bounds
+    )
+    _mark_dirty(whiteboard.id, tiles)
+    Whiteboard.objects.filter(id=whiteboard.id).update(tiles_seeded=True)
+
+
+def render_tiles(whiteboard_id):
+    """Render a board's dirty tiles (seeding them first if needed); returns the number rendered"""
+    whiteboard = Whiteboard.objects.filter(id=whiteboard_id).first()
+    if whiteboard is None:
+        return 0
+    if not whiteboard.tiles_seeded:
+        _seed(whiteboard)
+
+    with transaction.atomic():
+        dirty = list(DrawingTile.objects.select_for_update().filter(whiteboard_id=whiteboard_id, dirty=True))
+        # Strokes changed while rendering mark their tiles dirty again
+        DrawingTile.objects.filter(id__in=[tile.id for tile in dirty]).update(dirty=False)
+    if not dirty:
+        return 0
+
+    try:
+        return _render(whiteboard, dirty)
+    except Exception:
+        # Rendered again next time
+        DrawingTile.objects.filter(id__in=[tile.id for tile in dirty]).update(dirty=True)
+        raise
+
+
+def _render(whiteboard, dirty):
+    wanted = defaultdict(set)
+    for tile in dirty:
+        wanted[tile.level].add((tile.x, tile.y))
+    # Only layers overlapping a dirty tile are read
+    area = (
+        min(tile.x * tile_span(tile.level) for tile in dirty),
+        min(tile.y * tile_span(tile.level) for tile in dirty),
+        max((tile.x + 1) * tile_span(tile.level) for tile in dirty),
+        max((tile.y + 1) * tile_span(tile.level) for tile in dirty),
+    )
+    strokes_by_tile = defaultdict(list)
+    for stroke in iter_strokes(whiteboard, area=area):
+        points = parse_path_data(stroke['path_data'])
+        if len(points) < 2:
+            continue
+        bounds = stroke_bounds(stroke['path_data'], stroke['stroke_width'])
+        for level, positions in wanted.items():
+            xs, ys = _tile_range(bounds, level)
+            for x in xs:
+                for y in ys:
+                    if (x, y) in positions:
+                        strokes_by_tile[level, x, y].append((points, stroke['color'], stroke['stroke_width']))
+
+    rendered = 0
+    for tile in dirty:
+        strokes = strokes_by_tile.get((tile.level, tile.x, tile.y))
+        name = tile_name(whiteboard.id, tile.level, tile.x, tile.y)
+        if not strokes:
+            # Nothing left on it, unless a stroke arrived meanwhile
+            if DrawingTile.objects.filter(id=tile.id, dirty=False).delete()[0]:
+                default_storage.delete(name)
+            continue
+        _write(name, render_tile(strokes, tile.level, tile.x, tile.y))
+        tile.version += 1
+        DrawingTile.objects.filter(id=tile.id).update(version=tile.version)
+        rendered += 1
+    return rendered
+
+
+def delete_tiles(whiteboard_id):
+    """Remove a board's tile images"""
+    shutil.rmtree(default_storage.path(f"{settings.TILE_DIR}/board_{whiteboard_id}"), ignore_errors=True)
+
+
+_debouncer = Debouncer(render_tiles, lambda: settings.TILE_DEBOUNCE_SECONDS, name='Tile rendering', priority=-5)
+
+
+def schedule_tiles(whiteboard_id):
+    """Queue a debounced render of the board's dirty tiles once the current transaction commits"""
+    if settings.TILES_ENABLED:
+        _debouncer.schedule(whiteboard_id)
@@ -0,0 +1,495 @@
+"""
+Streaming export and import of whole whiteboards.
+
+A board archive is a gzipped tar stream containing:
+
+    manifest.json            board attributes and format version
+    groups/NNNNNN.ndjson     note groups
+    notes/NNNNNN.ndjson      sticky notes, one JSON record per line
+    media/<path>             image files referenced by notes and note images
+    images/NNNNNN.ndjson     sticky note image metadata
+    drawings/NNNNNN.ndjson   drawings
+    access/NNNNNN.ndjson     access rights (by username)
+
+Records are written in bounded chunks straight from queryset iterators and
+read back member by member, so memory stays flat regardless of board size.
+
+Duplicating a board (e.g. from a template) skips the archive: rows are
+copied table by table with batched bulk inserts in one transaction, and the
+copies point at the same media files instead of duplicating them. Files are
+never rewritten in place, and the board purge only removes those no other
+board references, so sharing them is safe.
+"""
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DataError, IntegrityError, transaction
+
+from .models import Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing
+from .signals import bump_whiteboard_version
+from .compaction import iter_strokes, schedule_compaction
+from .ordering import is_valid_key, rebalance_board
+
+ARCHIVE_FORMAT = 'stickytux-board'
+ARCHIVE_VERSION = 1
+
+GROUP_FIELDS = ['id', 'offset_x', 'offset_y', 'scale', 'created_by__username']
+NOTE_FIELDS = [
+    'id', 'content', 'image', 'link', 'color', 'x', 'y', 'width', 'height',
+    'group_id', 'note_group_id', 'z_index', 'order_key', 'created_by__username',
+]
+IMAGE_FIELDS = ['id', 'sticky_note_id', 'image', 'order']
+ACCESS_FIELDS = ['user__username', 'role']
+
+# Columns copied by duplicate_board, besides the remapped foreign keys
+COPY_GROUP_FIELDS = ['offset_x', 'offset_y', 'scale', 'created_by_id']
+COPY_NOTE_FIELDS = [
+    'content', 'image', 'link', 'color', 'x', 'y', 'width', 'height',
+    'group_id', 'z_index', 'order_key', 'created_by_id',
+]
+COPY_IMAGE_FIELDS = ['image', 'order']
+# Image formats kept from imported archives, with the extension they are stored under
+IMPORT_IMAGE_FORMATS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif', 'WEBP': 'webp', 'BMP': 'bmp'}
+
+
+class ArchiveError(Exception):
+    """Raised when a board archive is malformed or of an unsupported version"""
+
+
+class _StreamBuffer:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _iter_ndjson_members(tar, buffer, prefix, rows, chunk_size):
+    """Write rows as numbered NDJSON members of at most ``chunk_size`` records"""
+    lines = []
+    part = 0
+    for row in rows:
+        lines.append(json.dumps(row, default=str))
+        if len(lines) >= chunk_size:
+            _add_bytes(tar, f'{prefix}/{part:06d}.ndjson', ('\n'.join(lines) + '\n').encode())
+            lines = []
+            part += 1
+            yield buffer.drain()
+    if lines:
+        _add_bytes(tar, f'{prefix}/{part:06d}.ndjson', ('\n'.join(lines) + '\n').encode())
+        yield buffer.drain()
+
+
+def _media_names(whiteboard, chunk_size):
+    """Each media file the board's notes and note images use, once"""
+    seen = set()
+    notes = StickyNote.objects.filter(whiteboard=whiteboard).exclude(image='').exclude(image__isnull=True)
+    images = StickyNoteImage.objects.filter(sticky_note__whiteboard=whiteboard)
+    for queryset in (notes, images):
+        for name in queryset.values_list('image', flat=True).distinct().iterator(chunk_size=chunk_size):
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+
+def iter_export(whiteboard, chunk_size=None):
+    """Yield a whiteboard archive as a sequence of gzipped tar byte chunks"""
+    chunk_size = chunk_size or settings.BOARD_TRANSFER_CHUNK_SIZE
+    buffer = _StreamBuffer()
+    tar = tarfile.open(fileobj=buffer, mode='w|gz')
+
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'whiteboard': {
+            'id': whiteboard.id,
+            'name': whiteboard.name,
+            'background_color': whiteboard.background_color,
+            'owner': whiteboard.owner.username,
+        },
+    }
+    _add_bytes(tar, 'manifest.json', json.dumps(manifest).encode())
+    yield buffer.drain()
+
+    groups = NoteGroup.objects.filter(whiteboard=whiteboard).order_by('id').values(*GROUP_FIELDS)
+    yield from _iter_ndjson_members(tar, buffer, 'groups', groups.iterator(chunk_size=chunk_size), chunk_size)
+
+    notes = StickyNote.objects.filter(whiteboard=whiteboard).order_by('id').values(*NOTE_FIELDS)
+    yield from _iter_ndjson_members(tar, buffer, 'notes', notes.iterator(chunk_size=chunk_size), chunk_size)
+
+    for name in _media_names(whiteboard, chunk_size):
+        if not name or not default_storage.exists(name):
+            continue
+        info = tarfile.TarInfo(f'media/{name}')
+        info.size = default_storage.size(name)
+        info.mtime = int(time.time())
+        with default_storage.open(name, 'rb') as f:
+            tar.addfile(info, f)
+        yield buffer.drain()
+
+    images = StickyNoteImage.objects.filter(sticky_note__whiteboard=whiteboard).order_by('id').values(*IMAGE_FIELDS)
+    yield from _iter_ndjson_members(tar, buffer, 'images', images.iterator(chunk_size=chunk_size), chunk_size)
+
+    drawings = (
+        {
+            'path_data': stroke['path_data'],
+            'color': stroke['color'],
+            'stroke_width': stroke['stroke_width'],
+            'created_by__username': stroke['created_by_username'],
+        }
+        for stroke in iter_strokes(whiteboard, chunk_size=chunk_size)
+    )
+    yield from _iter_ndjson_members(tar, buffer, 'drawings', drawings, chunk_size)
+
+    access = WhiteboardAccess.objects.filter(whiteboard=whiteboard).order_by('id').values(*ACCESS_FIELDS)
+    yield from _iter_ndjson_members(tar, buffer, 'access', access.iterator(chunk_size=chunk_size), chunk_size)
+
+    tar.close()
+    yield buffer.drain()
+
+
+def _iter_records(fileobj):
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class _UserCache:
+    """Resolves exported usernames to users, falling back to the importing user"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._users = {fallback.username: fallback}
+
+    def get(self, username, default=True):
+        if username not in self._users:
+            self._users[username] = User.objects.filter(username=username).first()
+        user = self._users[username]
+        if user is None and default:
+            return self.fallback
+        return user
+
+
+def import_board(fileobj, owner, name=None, batch_size=None):
+    """Create a new whiteboard owned by ``owner`` from an archive file object
+
+    Notes and note images only get media files the archive itself
+    contains; references to anything else are dropped, so an archive cannot
+    point them at files already in storage. Media files are only kept if
+    Pillow reads them as images and a record uses them, and are stored under
+    generated names.
+    """
+    batch_size = batch_size or settings.BOARD_TRANSFER_CHUNK_SIZE
+    users = _UserCache(owner)
+    group_ids = {}
+    note_ids = {}
+    # Archive media name -> stored name, and -> ids of notes with it as their legacy image
+    media_names = {}
+    legacy_images = defaultdict(list)
+    used_media = set()
+    saved_files = []
+    whiteboard = None
+    # Older archives carry order keys in an alphabet key_between() rejects
+    rekey = False
+
+    try:
+        with transaction.atomic(), tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                data = tar.extractfile(member)
+
+                if member.name == 'manifest.json':
+                    manifest = json.load(data)
+                    if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('version') != ARCHIVE_VERSION:
+                        raise ArchiveError('Unsupported archive format')
+                    board = manifest['whiteboard']
+                    whiteboard = Whiteboard.objects.create(
+                        name=name or board['name'],
+                        owner=owner,
+                        background_color=board.get('background_color') or '#ffffff',
+                    )
+                    continue
+
+                if whiteboard is None:
+                    raise ArchiveError('Archive does not start with a manifest')
+
+                if member.name.startswith('media/'):
+                    stored = _save_image(data)
+                    if stored:
+                        saved_files.append(stored)
+                        media_names[member.name[len('media/'):]] = stored
+                elif member.name.startswith('groups/'):
+                    _import_groups(whiteboard, _iter_records(data), users, group_ids, batch_size)
+                elif member.name.startswith('notes/'):
+                    rekey = _import_notes(
+                        whiteboard, _iter_records(data), users, group_ids, note_ids, legacy_images, batch_size
+                    ) or rekey
+                elif member.name.startswith('images/'):
+                    _import_images(_iter_records(data), note_ids, media_names, used_media, batch_size)
+                elif member.name.startswith('drawings/'):
+                    _import_drawings(whiteboard, _iter_records(data), users, batch_size)
+                elif member.name.startswith('access/'):
+                    _import_access(whiteboard, _iter_records(data), users, owner, batch_size)
+
+            if whiteboard is None:
+                raise ArchiveError('Archive does not contain a manifest')
+
+            # Notes with a legacy single image were created before their media arrived
+            for original, ids in legacy_images.items():
+                if original in media_names:
+                    used_media.add(original)
+                    for batch in _batched(ids, batch_size):
+                        StickyNote.objects.filter(id__in=batch).update(image=media_names[original])
+            # Image records follow the media, so files nothing used are only known now
+            for original, stored in media_names.items():
+                if original not in used_media:
+                    default_storage.delete(stored)
+                    saved_files.remove(stored)
+
+            if rekey:
+                rebalance_board(whiteboard.id)
+            # bulk_create() bypasses the model signals
+            bump_whiteboard_version(whiteboard.id)
+    except (tarfile.TarError, json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError,
+            IntegrityError, DataError) as exc:
+        for stored in saved_files:
+            default_storage.delete(stored)
+        raise ArchiveError(f'Invalid archive: {exc}') from exc
+    except Exception:
+        for stored in saved_files:
+            default_storage.delete(stored)
+        raise
+
+    return whiteboard
+
+
+def _batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import_groups(whiteboard, records, users, group_ids, batch_size):
+    for batch in _batched(records, batch_size):
+        groups = [
+            NoteGroup(
+                whiteboard=whiteboard,
+                offset_x=r.get('offset_x', 0),
+                offset_y=r.get('offset_y', 0),
+                scale=r.get('scale', 1.0),
+                created_by=users.get(r.get('created_by__username')),
+            )
+            for r in batch
+        ]
+        NoteGroup.objects.bulk_create(groups)
+        for record, group in zip(batch, groups):
+            group_ids[record['id']] = group.id
+
+
+def _import_notes(whiteboard, records, users, group_ids, note_ids, legacy_images, batch_size):
+    """Create the notes of one archive member; returns whether any order key needs re-keying"""
+    rekey = False
+    for batch in _batched(records, batch_size):
+        notes = [
+            StickyNote(
+                whiteboard=whiteboard,
+                content=r.get('content') or '',
+                link=r.get('link'),
+                color=r.get('color') or 'yellow',
+                x=r.get('x', 0),
+                y=r.get('y', 0),
+                width=r.get('width', 200),
+                height=r.get('height', 200),
+                group_id=r.get('group_id'),
+                note_group_id=group_ids.get(r.get('note_group_id')),
+                z_index=r.get('z_index', 0),
+                order_key=r.get('order_key') or '',
+                created_by=users.get(r.get('created_by__username')),
+            )
+            for r in batch
+        ]
+        StickyNote.objects.bulk_create(notes)
+        for record, note in zip(batch, notes):
+            note_ids[record['id']] = note.id
+            if record.get('image'):
+                legacy_images[record['image']].append(note.id)
+            rekey = rekey or not is_valid_key(note.order_key)
+    return rekey
+
+
+def _save_image(data):
+    """Store an archive media file under a generated name; None if it is not an image
+
+    Checked with Pillow the way ImageField checks uploads.
+    """
+    from PIL import Image
+
+    with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as buffer:
+        shutil.copyfileobj(data, buffer)
+        buffer.seek(0)
+        try:
+            with Image.open(buffer) as image:
+                image.verify()
+                extension = IMPORT_IMAGE_FORMATS.get(image.format)
+        except Exception:
+            return None
+        if extension is None:
+            return None
+        buffer.seek(0)
+        return default_storage.save(f'sticky_notes/{uuid.uuid4().hex}.{extension}', File(buffer))
+
+
+def _import_images(records, note_ids, media_names, used_media, batch_size):
+    for batch in _batched(records, batch_size):
+        rows = [r for r in batch if r['sticky_note_id'] in note_ids and r['image'] in media_names]
+        StickyNoteImage.objects.bulk_create([
+            StickyNoteImage(
+                sticky_note_id=note_ids[r['sticky_note_id']],
+                image=media_names[r['image']],
+                order=r.get('order', 0),
+            )
+            for r in rows
+        ])
+        used_media.update(r['image'] for r in rows)
+
+
+def _import_drawings(whiteboard, records, users, batch_size):
+    for batch in _batched(records, batch_size):
+        Drawing.objects.bulk_create([
+            Drawing(
+                whiteboard=whiteboard,
+                path_data=r['path_data'],
+                color=r.get('color') or 'black',
+                stroke_width=r.get('stroke_width', 2),
+                created_by=users.get(r.get('created_by__username')),
+            )
+            for r in batch
+        ])
+
+
+def _import_access(whiteboard, records, users, owner, batch_size):
+    for batch in _batched(records, batch_size):
+        rows = []
+        for r in batch:
+            user = users.get(r.get('user__username'), default=False)
+            if user is None or user == owner:
+                continue
+            rows.append(WhiteboardAccess(whiteboard=whiteboard, user=user, role=r.get('role') or 'view'))
+        WhiteboardAccess.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def duplicate_board(source, owner, name=None, is_template=False, batch_size=None):
+    """Create a copy of ``source`` owned by ``owner``, with its groups, notes, images and drawings
+
+    Access rights are not copied. Compacted strokes become plain drawings
+    again and are compacted anew in the background. Client-side ``group_id``
+    strings get fresh values, so the copy's groupings stay apart from the
+    source's.
+    """
+    batch_size = batch_size or settings.BOARD_TRANSFER_CHUNK_SIZE
+    group_ids = {}
+    note_ids = {}
+    legacy_group_ids = {}
+
+    def copy_note(r):
+        old = r.pop('group_id')
+        if old is not None and old not in legacy_group_ids:
+            legacy_group_ids[old] = uuid.uuid4().hex
+        return StickyNote(
+            whiteboard=whiteboard,
+            group_id=legacy_group_ids.get(old),
+            note_group_id=group_ids.get(r.pop('note_group_id')),
+            **r,
+        )
+
+    with transaction.atomic():
+        whiteboard = Whiteboard.objects.create(
+            name=name or source.name,
+            owner=owner,
+            background_color=source.background_color,
+            is_template=is_template,
+        )
+        _copy_rows(
+            NoteGroup.objects.filter(whiteboard=source), COPY_GROUP_FIELDS,
+            lambda r: NoteGroup(whiteboard=whiteboard, **r),
+            batch_size, group_ids,
+        )
+        _copy_rows(
+            StickyNote.objects.filter(whiteboard=source), COPY_NOTE_FIELDS + ['note_group_id'],
+            copy_note, batch_size, note_ids,
+        )
+        # Same file names: the media is shared, not copied
+        _copy_rows(
+            StickyNoteImage.objects.filter(sticky_note__whiteboard=source), COPY_IMAGE_FIELDS + ['sticky_note_id'],
+            lambda r: StickyNoteImage(sticky_note_id=note_ids[r.pop('sticky_note_id')], **r),
+            batch_size,
+        )
+        for batch in _batched(iter_strokes(source, chunk_size=batch_size), batch_size):
+            Drawing.objects.bulk_create([
+                Drawing(
+                    whiteboard=whiteboard,
+                    path_data=stroke['path_data'],
+                    color=stroke['color'],
+                    stroke_width=stroke['stroke_width'],
+                    created_by_id=stroke['created_by'],
+                )
+                for stroke in batch
+            ])
+        # bulk_create() bypasses the model signals
+        bump_whiteboard_version(whiteboard.id)
+
+    schedule_compaction(whiteboard.id)
+    return whiteboard
+
+
+def _copy_rows(queryset, fields, make, batch_size, id_map=None):
+    """Bulk insert ``make(values)`` for every row of ``queryset``, reading it in id order
+
+    With ``id_map``, the new id of each row is recorded under its old one.
+    """
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values('id', *fields)[:batch_size])
+        if not rows:
+            return
+        old_ids = [row.pop('id') for row in rows]
+        copies = [make(row) for row in rows]
+        queryset.model.objects.bulk_create(copies)
+        if id_map is not None:
+            id_map.update(zip(old_ids, (copy.id for copy in copies)))
+        last_id = old_ids[-1]
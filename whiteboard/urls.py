@@ -3,10 +3,12 @@ from rest_framework.routers import DefaultRouter
 from . import views
 from . import auth_views
 from . import user_views
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'whiteboards', views.WhiteboardViewSet, basename='whiteboard')
 router.register(r'sticky-notes', views.StickyNoteViewSet, basename='stickynote')
+router.register(r'note-groups', views.NoteGroupViewSet, basename='notegroup')
 router.register(r'sticky-note-images', views.StickyNoteImageViewSet, basename='stickynoteimage')
 router.register(r'drawings', views.DrawingViewSet, basename='drawing')
 router.register(r'custom-colors', views.CustomColorViewSet, basename='customcolor')
@@ -14,10 +16,18 @@ router.register(r'users', views.UserViewSet, basename='user')
 router.register(r'view-settings', views.WhiteboardViewSettingsViewSet, basename='viewsettings')
 
 urlpatterns = [
+    # Must come before the router, otherwise users/<pk>/ swallows "search"
+    path('users/search/', user_views.search_users, name='search_users'),
     path('', include(router.urls)),
+    # Async versions of the hottest endpoints
+    path('live/whiteboards/<int:pk>/', async_views.whiteboard_snapshot, name='live_whiteboard'),
+    path('live/sticky-notes/<int:pk>/', async_views.update_note, name='live_sticky_note'),
+    path('live/view-settings/<int:whiteboard_id>/', async_views.view_settings, name='live_view_settings'),
+    path('live/users/search/', async_views.search_users, name='live_search_users'),
     path('health/', views.health_check, name='health'),
+    path('ready/', views.readiness_check, name='ready'),
     path('auth/login/', auth_views.login_view, name='login'),
     path('auth/logout/', auth_views.logout_view, name='logout'),
     path('auth/csrf/', auth_views.csrf_token_view, name='csrf'),
-    path('users/search/', user_views.search_users, name='search_users'),
+    path('search/', views.search, name='search'),
 ]
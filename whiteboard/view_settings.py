@@ -0,0 +1,148 @@
+"""
+Write-behind buffer for the per-user zoom and pan of a whiteboard.
+
+The canvas saves its view settings continuously while a user navigates,
+and nobody reads them until that user opens the board again. Saves only
+replace the latest values per user and board in memory; every
+``settings.VIEW_SETTINGS_FLUSH_SECONDS`` the buffered values are written
+with one bulk upsert, and whatever is left is written when the process
+exits. Reads look in the buffer before the database.
+
+A buffered entry also records that the user's access to the board was
+checked when it was saved, so further saves until the next flush skip
+that lookup.
+
+The buffer belongs to the process: with several worker processes a read
+served by another one can miss a save for up to one flush interval. Set
+``VIEW_SETTINGS_FLUSH_SECONDS=0`` to write every save through.
+"""
+import atexit
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from .background import run_write
+from .models import Whiteboard, WhiteboardViewSettings
+from .serializers import WhiteboardViewSettingsSerializer
+
+DEFAULT_VIEW_SETTINGS = {'zoom': 1.0, 'pan_x': 0.0, 'pan_y': 0.0}
+
+
+def clean_view_settings(data):
+    """Zoom and pan from request data as floats (defaults for missing ones); raises ValueError"""
+    values = {}
+    for field, default in DEFAULT_VIEW_SETTINGS.items():
+        value = data.get(field, default)
+        if isinstance(value, bool):
+            raise ValueError(f'{field} must be a number')
+        try:
+            values[field] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number') from None
+    return values
+
+
+class ViewSettingsBuffer:
+    """Latest unsaved view settings per ``(user id, whiteboard id)``, flushed in bulk"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+        self._exit_hook = False
+
+    def get(self, user_id, whiteboard_id):
+        """The buffered settings as a response dict, or None"""
+        with self._lock:
+            entry = self._pending.get((user_id, whiteboard_id))
+        return dict(entry) if entry else None
+
+    def put(self, user_id, whiteboard_id, values):
+        """Buffer the settings (replacing older unsaved ones) and return them as a response dict"""
+        if not settings.VIEW_SETTINGS_FLUSH_SECONDS:
+            row, _ = run_write(
+                WhiteboardViewSettings.objects.update_or_create,
+                user_id=user_id, whiteboard_id=whiteboard_id, defaults=values,
+            )
+            return WhiteboardViewSettingsSerializer(row).data
+        # The row id is not known before the flush
+        entry = {'id': None, 'whiteboard': whiteboard_id, **values, 'updated_at': timezone.now()}
+        with self._lock:
+            self._pending[user_id, whiteboard_id] = entry
+            self._schedule()
+            if not self._exit_hook:
+                atexit.register(self.flush)
+                self._exit_hook = True
+        return dict(entry)
+
+    async def aput(self, user_id, whiteboard_id, values):
+        if not settings.VIEW_SETTINGS_FLUSH_SECONDS:
+            return await sync_to_async(self.put)(user_id, whiteboard_id, values)
+        return self.put(user_id, whiteboard_id, values)
+
+    def discard(self, user_id, whiteboard_id):
+        """Forget unsaved settings, e.g. when the row is edited or deleted directly"""
+        with self._lock:
+            self._pending.pop((user_id, whiteboard_id), None)
+
+    def flush(self):
+        """Write all buffered settings; returns the number of rows written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            return self._write(pending)
+        except Exception:
+            # Keep them for the next flush unless newer values arrived meanwhile
+            with self._lock:
+                for key, entry in pending.items():
+                    self._pending.setdefault(key, entry)
+                self._schedule()
+            raise
+
+    def _schedule(self):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(settings.VIEW_SETTINGS_FLUSH_SECONDS, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception as exc:
+            print(f"View settings flush failed: {exc}")
+        finally:
+            # Timer threads get their own DB connection; don't leak it
+            connection.close()
+
+    def _write(self, pending):
+        # Boards or users deleted since the save would fail the whole upsert
+        boards = set(Whiteboard.objects.filter(id__in={w for _, w in pending}).values_list('id', flat=True))
+        users = set(User.objects.filter(id__in={u for u, _ in pending}).values_list('id', flat=True))
+        rows = [
+            WhiteboardViewSettings(
+                user_id=user_id, whiteboard_id=whiteboard_id,
+                zoom=entry['zoom'], pan_x=entry['pan_x'], pan_y=entry['pan_y'],
+            )
+            for (user_id, whiteboard_id), entry in pending.items()
+            if user_id in users and whiteboard_id in boards
+        ]
+        run_write(
+            WhiteboardViewSettings.objects.bulk_create, rows,
+            update_conflicts=True, unique_fields=['user', 'whiteboard'], update_fields=['zoom', 'pan_x', 'pan_y', 'updated_at'],
+        )
+        return len(rows)
+
+
+buffer = ViewSettingsBuffer()
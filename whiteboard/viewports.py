@@ -0,0 +1,147 @@
+"""
+Viewport-aware fan-out for the whiteboard WebSocket.
+
+On large boards most of the traffic concerns items no client looks at.
+Clients therefore register the part of the board they show with a
+``viewport`` message: the zoom and pan of WhiteboardViewSettings plus the
+canvas size in pixels (screen = pan + board * zoom). Messages fanned out
+to a board carry the board rectangle they concern, when it is known, and
+the receiving consumer
+
+* drops ephemeral messages (``note_moving`` drag previews, ``cursor``)
+  outside its client's viewport, and
+* holds durable changes outside the viewport back, sending them as one
+  ``batch`` message every ``settings.VIEWPORT_BATCH_SECONDS``; of several
+  updates of the same item in a row only the latest is kept.
+
+Messages with no known position, and everything for clients that did not
+register a viewport, are sent right away. Held-back messages are sent
+before any other message and whenever the viewport changes, so clients
+always see changes in order.
+"""
+import math
+
+from .previews import parse_path_data
+
+EPHEMERAL_TYPES = {'note_moving', 'cursor'}
+# Updates that replace the whole item; consecutive ones are merged
+REPLACING_TYPES = {'note_updated', 'group_updated'}
+# Share of the viewport added on every side, so items about to scroll into
+# view are kept current
+MARGIN = 0.25
+# Largest canvas accepted, in pixels
+MAX_CANVAS = 20000
+
+
+def parse_viewport(message):
+    """The board rectangle ``(x1, y1, x2, y2)`` a ``viewport`` message shows; raises ValueError"""
+    values = []
+    for field in ('zoom', 'pan_x', 'pan_y', 'width', 'height'):
+        value = message.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f'{field} must be a number')
+        values.append(float(value))
+    zoom, pan_x, pan_y, width, height = values
+    if zoom <= 0 or not 0 < width <= MAX_CANVAS or not 0 < height <= MAX_CANVAS:
+        raise ValueError('zoom, width and height must be positive')
+    x1, y1 = -pan_x / zoom, -pan_y / zoom
+    x2, y2 = x1 + width / zoom, y1 + height / zoom
+    margin_x, margin_y = (x2 - x1) * MARGIN, (y2 - y1) * MARGIN
+    return (x1 - margin_x, y1 - margin_y, x2 + margin_x, y2 + margin_y)
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _note_bounds(note, room):
+    if not isinstance(note, dict) or not all(_number(note.get(field)) for field in ('x', 'y')):
+        return None
+    width, height = note.get('width'), note.get('height')
+    width, height = (width if _number(width) else 0), (height if _number(height) else 0)
+    x, y = note['x'], note['y']
+    if note.get('note_group') is not None:
+        # Positioned relative to its group, which only the room knows
+        group_id = note['note_group']
+        group = room.groups.get(group_id) if room is not None and isinstance(group_id, int) else None
+        if group is None:
+            return None
+        x, y = group.offset_x + x * group.scale, group.offset_y + y * group.scale
+        width, height = width * group.scale, height * group.scale
+    return (x, y, x + width, y + height)
+
+
+def message_bounds(message, room=None):
+    """The board rectangle a message concerns, or None if it is not known"""
+    if not isinstance(message, dict):
+        return None
+    kind = message.get('type')
+    if kind in ('note_added', 'note_updated'):
+        return _note_bounds(message.get('note'), room)
+    if kind in ('note_moving', 'note_text'):
+        note_id = message.get('noteId')
+        current = room.notes.get(note_id) if room is not None and isinstance(note_id, int) else None
+        if current is None:
+            # Drag previews carry the position in the note's own coordinates
+            return _note_bounds(message, room) if kind == 'note_moving' else None
+        note = {
+            'x': current.x, 'y': current.y, 'width': current.width, 'height': current.height,
+            'note_group': current.note_group,
+        }
+        if kind == 'note_moving':
+            note.update(x=message.get('x'), y=message.get('y'))
+        return _note_bounds(note, room)
+    if kind == 'cursor':
+        x, y = message.get('x'), message.get('y')
+        return (x, y, x, y) if _number(x) and _number(y) else None
+    if kind == 'drawing_added':
+        drawing = message.get('drawing')
+        points = parse_path_data(drawing.get('path_data')) if isinstance(drawing, dict) else []
+        if not points:
+            return None
+        xs, ys = [x for x, _ in points], [y for _, y in points]
+        return (min(xs), min(ys), max(xs), max(ys))
+    return None
+
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _item_key(message):
+    kind = message.get('type', '')
+    for prefix, id_field in (('note', 'noteId'), ('group', 'groupId')):
+        if kind.startswith(prefix + '_'):
+            item = message.get(prefix)
+            item_id = item.get('id') if isinstance(item, dict) else message.get(id_field)
+            return (prefix, item_id) if isinstance(item_id, int) else None
+    return None
+
+
+class HeldMessages:
+    """Durable messages held back for a client until the next batch"""
+
+    def __init__(self):
+        self._messages = []
+        # item -> index of the latest held message about it
+        self._latest = {}
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, message):
+        key = _item_key(message)
+        if key is not None and message['type'] in REPLACING_TYPES:
+            index = self._latest.get(key)
+            if index is not None and self._messages[index]['type'] == message['type']:
+                # Superseded, and nothing else about the item came after it
+                self._messages[index] = None
+        if key is not None:
+            self._latest[key] = len(self._messages)
+        self._messages.append(message)
+
+    def take(self):
+        """The held messages in order; empties the buffer"""
+        messages = [message for message in self._messages if message is not None]
+        self._messages, self._latest = [], {}
+        return messages
@@ -1,14 +1,34 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q, Max
+from rest_framework.generics import get_object_or_404
+from django.db import transaction
+from django.db.models import Q, F, Max, Min, Prefetch
 from django.contrib.auth.models import User
-from django.http import JsonResponse
-from .models import Whiteboard, WhiteboardAccess, StickyNote, StickyNoteImage, Drawing, CustomColor, WhiteboardViewSettings
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.conf import settings
+from django.middleware.csrf import get_token
+from asgiref.sync import sync_to_async
+from .models import Whiteboard, WhiteboardAccess, NoteGroup, StickyNote, StickyNoteImage, Drawing, DrawingTile, CustomColor, WhiteboardViewSettings
 from .serializers import (
-    WhiteboardSerializer, WhiteboardAccessSerializer,
-    StickyNoteSerializer, StickyNoteImageSerializer, DrawingSerializer, CustomColorSerializer, WhiteboardViewSettingsSerializer
+    WhiteboardSerializer, WhiteboardAccessSerializer, NoteGroupSerializer,
+    StickyNoteSerializer, StickyNoteImageSerializer, DrawingSerializer, CustomColorSerializer, WhiteboardViewSettingsSerializer,
+    WhiteboardSummarySerializer,
 )
+from .previews import preview_name, update_preview
+from .transfer import ArchiveError, iter_export, import_board, duplicate_board
+from .ordering import key_between, schedule_rebalance
+from .search import search_notes
+from .compaction import find_compacted_stroke, layers_for_user, remove_compacted_stroke, restore_stroke, serialize_stroke
+from .signals import bump_whiteboard_version
+from .background import queued_write
+from .purge import soft_delete
+from .view_settings import DEFAULT_VIEW_SETTINGS, buffer as view_settings_buffer, clean_view_settings
+from .tiles import invalidate_strokes, schedule_tiles, tile_span, tile_url
+from .bootstrap import board_role, bootstrap_head, iter_bootstrap
+from .oplog import record_operation, changed_fields, note_data, load_state, state_as_lists
+from . import startup
 
 
 @api_view(['GET'])
@@ -21,6 +41,78 @@ def health_check(request):
     })
 
 
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def readiness_check(request):
+    """Readiness probe: passes once this process is warmed up (see startup.py)"""
+    ready = startup.is_ready()
+    return JsonResponse(
+        {'status': 'ready' if ready else 'starting', **startup.status()},
+        status=200 if ready else 503
+    )
+
+
+@api_view(['GET'])
+def search(request):
+    """Full-text search over sticky notes on every whiteboard the user can access"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', settings.SEARCH_PAGE_SIZE)), 1), settings.SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response(
+            {'error': 'page and page_size must be integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Fetch one extra row to know whether there is a next page without a COUNT(*)
+    matches = search_notes(request.user, query, limit=page_size + 1, offset=(page - 1) * page_size)
+    results = [
+        {
+            'id': note.id,
+            'whiteboard': note.whiteboard_id,
+            'whiteboard_name': note.whiteboard.name,
+            'content': note.content,
+            'link': note.link,
+            'color': note.color,
+            'rank': rank,
+            'updated_at': note.updated_at,
+        }
+        for note, rank in matches[:page_size]
+    ]
+    return Response({
+        'results': results,
+        'page': page,
+        'page_size': page_size,
+        'has_next': len(matches) > page_size,
+    })
+
+
+async def stream_async(iterator):
+    """Yield the items of a sync iterator, producing each in a worker thread
+    
+    Under ASGI, StreamingHttpResponse reads a sync iterator to the end
+    before sending anything; an async one is sent as it is produced.
+    """
+    iterator = iter(iterator)
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(next)(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # The client may have gone away halfway; release what the generator holds
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def log_note_updated(note, request):
+    """Log a note whose images changed, with its full current state"""
+    record_operation(note.whiteboard_id, 'note_updated', {'note': note_data(note)}, target_id=note.id, user=request.user)
+
+
 class IsWhiteboardOwnerOrHasAccess(permissions.BasePermission):
     """Custom permission to only allow owners or users with access to view/edit"""
     
@@ -39,8 +131,8 @@ class IsWhiteboardOwnerOrHasAccess(permissions.BasePermission):
                     return True  # View access is sufficient for GET
                 return access.role in ['edit', 'admin']  # Edit or admin needed for modifications
         
-        # For StickyNote and Drawing, check whiteboard access
-        elif isinstance(obj, (StickyNote, Drawing)):
+        # For StickyNote, NoteGroup and Drawing, check whiteboard access
+        elif isinstance(obj, (StickyNote, NoteGroup, Drawing)):
             return self.has_object_permission(request, view, obj.whiteboard)
         
         # For StickyNoteImage, check sticky note's whiteboard access
@@ -57,13 +149,174 @@ class WhiteboardViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # Return whiteboards owned by user or accessible to user
         user = self.request.user
-        return Whiteboard.objects.filter(
+        queryset = Whiteboard.objects.filter(
             Q(owner=user) | Q(access_rights__user=user)
         ).distinct()
+        if self.action == 'list' and 'is_template' in self.request.query_params:
+            queryset = queryset.filter(is_template=self.request.query_params['is_template'] in ('1', 'true'))
+        if self.action in ('list', 'retrieve', 'update', 'partial_update', 'bootstrap'):
+            # Prefetch everything WhiteboardSerializer renders so a board costs a fixed number of queries
+            queryset = queryset.select_related('owner').prefetch_related(
+                Prefetch('sticky_notes', queryset=StickyNote.objects.select_related('created_by').prefetch_related('images')),
+                Prefetch('drawings', queryset=Drawing.objects.select_related('created_by')),
+                'drawing_layers',
+                'note_groups',
+                Prefetch('access_rights', queryset=WhiteboardAccess.objects.select_related('user')),
+            )
+        return queryset
     
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
     
+    def perform_destroy(self, instance):
+        # Returns right away; rows and media are removed by a background purge
+        soft_delete(instance)
+    
+    @queued_write
+    def perform_update(self, serializer):
+        previous = changed_fields(serializer.instance, serializer.validated_data)
+        whiteboard = serializer.save()
+        record_operation(
+            whiteboard.id, 'board_updated',
+            {'whiteboard': {'name': whiteboard.name, 'background_color': whiteboard.background_color}},
+            target_id=whiteboard.id, user=self.request.user, previous=previous,
+        )
+    
+    @action(detail=True, methods=['get'])
+    def state(self, request, pk=None):
+        """Return the board rebuilt from its latest snapshot plus the operations after it"""
+        whiteboard = self.get_object()
+        state, seq = load_state(whiteboard)
+        return Response({**state_as_lists(state), 'seq': seq})
+    
+    @action(detail=True, methods=['get'])
+    def bootstrap(self, request, pk=None):
+        """Stream the board with the caller's view settings, custom colors, role and a WebSocket resume token (see bootstrap.py)"""
+        whiteboard = self.get_object()
+        view_settings = view_settings_buffer.get(request.user.id, whiteboard.id)
+        if view_settings is None:
+            row = WhiteboardViewSettings.objects.filter(user=request.user, whiteboard=whiteboard).first()
+            view_settings = WhiteboardViewSettingsSerializer(row).data if row else dict(DEFAULT_VIEW_SETTINGS)
+        head = bootstrap_head(
+            whiteboard, request.user, board_role(whiteboard, request.user), get_token(request),
+            view_settings, CustomColor.objects.filter(user=request.user),
+        )
+        return StreamingHttpResponse(
+            stream_async(iter_bootstrap(whiteboard, head, self.get_serializer_context())), content_type='application/json'
+        )
+    
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Return logged operations after ``?since=<seq>``, oldest first"""
+        whiteboard = self.get_object()
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(max(int(request.query_params.get('limit', settings.OPLOG_PAGE_SIZE)), 1), settings.OPLOG_PAGE_SIZE)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        operations = list(
+            whiteboard.operations.filter(id__gt=since)
+            .order_by('id')
+            .values('id', 'op_type', 'target_id', 'payload', 'previous', 'user', 'created_at')[:limit + 1]
+        )
+        return Response({
+            'operations': operations[:limit],
+            'has_next': len(operations) > limit,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """Return the cached preview thumbnail, rendering it first if it is stale"""
+        whiteboard = self.get_object()
+        if whiteboard.preview_version != whiteboard.version:
+            update_preview(whiteboard.id)
+        name = preview_name(whiteboard.id)
+        if not default_storage.exists(name):
+            raise Http404('Preview not available')
+        return FileResponse(default_storage.open(name, 'rb'))
+    
+    @action(detail=True, methods=['get'])
+    def tiles(self, request, pk=None):
+        """List the rendered drawing tiles of one zoom level (``?level=1`` is zoom 1/2, see tiles.py)"""
+        whiteboard = self.get_object()
+        try:
+            level = int(request.query_params.get('level', 1))
+        except ValueError:
+            level = 0
+        if not settings.TILES_ENABLED or not 1 <= level <= settings.TILE_LEVELS:
+            return Response(
+                {'error': f'level must be between 1 and {settings.TILE_LEVELS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not whiteboard.tiles_seeded:
+            # Clients draw the strokes themselves until the tiles exist
+            schedule_tiles(whiteboard.id)
+        tiles = DrawingTile.objects.filter(whiteboard=whiteboard, level=level, version__gt=0).order_by('y', 'x')
+        return Response({
+            'ready': whiteboard.tiles_seeded,
+            'level': level,
+            'levels': settings.TILE_LEVELS,
+            'tile_size': settings.TILE_SIZE,
+            'span': tile_span(level),
+            'tiles': [{'x': tile.x, 'y': tile.y, 'url': tile_url(tile)} for tile in tiles],
+        })
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream the whole whiteboard as a .tar.gz archive"""
+        whiteboard = self.get_object()
+        response = StreamingHttpResponse(stream_async(iter_export(whiteboard)), content_type='application/gzip')
+        response['Content-Disposition'] = f'attachment; filename="whiteboard-{whiteboard.id}.tar.gz"'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_archive(self, request):
+        """Create a new whiteboard from an uploaded export archive"""
+        archive = request.FILES.get('archive')
+        if not archive:
+            return Response(
+                {'error': 'No archive file provided'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            whiteboard = import_board(archive, request.user, name=request.data.get('name'))
+        except ArchiveError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = self.get_serializer(whiteboard)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def duplicate(self, request, pk=None):
+        """Copy the whiteboard into a new one owned by the caller (e.g. a board from a template)"""
+        # Copying only reads the source, so view access is enough
+        source = get_object_or_404(self.get_queryset(), pk=pk)
+        
+        name = request.data.get('name') or f'{source.name} (copy)'
+        try:
+            # Accepts JSON booleans as well as form values like "true"
+            is_template = serializers.BooleanField().to_internal_value(request.data.get('is_template', False))
+        except serializers.ValidationError:
+            is_template = None
+        if not isinstance(name, str) or is_template is None:
+            return Response(
+                {'error': 'name must be a string and is_template a boolean'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        whiteboard = duplicate_board(source, request.user, name=name[:255], is_template=is_template)
+        # The copy can be large; clients load its contents when they open it
+        serializer = WhiteboardSummarySerializer(whiteboard, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['post'])
     def grant_access(self, request, pk=None):
         """Grant access to a user for this whiteboard"""
@@ -159,10 +412,87 @@ class StickyNoteViewSet(viewsets.ModelViewSet):
         accessible_whiteboards = Whiteboard.objects.filter(
             Q(owner=user) | Q(access_rights__user=user)
         ).distinct()
-        return StickyNote.objects.filter(whiteboard__in=accessible_whiteboards)
+        queryset = StickyNote.objects.filter(whiteboard__in=accessible_whiteboards).select_related('created_by')
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related('images')
+        return queryset
     
+    @queued_write
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        note = serializer.save(created_by=self.request.user)
+        record_operation(note.whiteboard_id, 'note_created', {'note': note_data(note)}, target_id=note.id, user=self.request.user)
+    
+    @queued_write
+    def perform_update(self, serializer):
+        previous = changed_fields(serializer.instance, serializer.validated_data)
+        note = serializer.save()
+        record_operation(
+            note.whiteboard_id, 'note_updated', {'note': note_data(note)},
+            target_id=note.id, user=self.request.user, previous=previous,
+        )
+    
+    @queued_write
+    def perform_destroy(self, instance):
+        previous = note_data(instance)
+        whiteboard_id, note_id = instance.whiteboard_id, instance.id
+        instance.delete()
+        record_operation(whiteboard_id, 'note_deleted', {'id': note_id}, target_id=note_id, user=self.request.user, previous=previous)
+    
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        """Move this note in the stacking order by rewriting only its order key
+        
+        Accepts ``{"position": "front"|"back"}`` or ``{"above": <note id>}`` /
+        ``{"below": <note id>}`` to place it directly next to another note.
+        """
+        note = self.get_object()
+        siblings = StickyNote.objects.filter(whiteboard_id=note.whiteboard_id).exclude(id=note.id)
+        position = request.data.get('position')
+        target_id = request.data.get('above') or request.data.get('below')
+        
+        try:
+            if position == 'front':
+                top = siblings.aggregate(Max('order_key'))['order_key__max']
+                key = key_between(top, None)
+            elif position == 'back':
+                bottom = siblings.aggregate(Min('order_key'))['order_key__min']
+                key = key_between(None, bottom)
+            elif target_id:
+                target = siblings.filter(id=target_id).values_list('order_key', flat=True).first()
+                if target is None:
+                    return Response(
+                        {'error': 'Target note not found on this whiteboard'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                if request.data.get('above'):
+                    upper = siblings.filter(order_key__gt=target).aggregate(Min('order_key'))['order_key__min']
+                    key = key_between(target, upper)
+                else:
+                    lower = siblings.filter(order_key__lt=target).aggregate(Max('order_key'))['order_key__max']
+                    key = key_between(lower, target)
+            else:
+                return Response(
+                    {'error': 'position, above or below is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        except ValueError:
+            # Keys not made by ordering.py (e.g. from an old archive); the
+            # board is re-keyed and the client gets the new keys over the socket
+            schedule_rebalance(note.whiteboard_id)
+            return Response(
+                {'error': 'The stacking order is being repaired, please try again'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        previous = {'order_key': note.order_key}
+        note.order_key = key
+        with transaction.atomic():
+            note.save(update_fields=['order_key', 'updated_at'])
+            record_operation(
+                note.whiteboard_id, 'note_updated', {'note': note_data(note)},
+                target_id=note.id, user=request.user, previous=previous,
+            )
+        return Response(self.get_serializer(note).data)
     
     @action(detail=True, methods=['post'])
     def add_image(self, request, pk=None):
@@ -179,16 +509,125 @@ class StickyNoteViewSet(viewsets.ModelViewSet):
         # Get the current max order
         max_order = note.images.aggregate(Max('order'))['order__max'] or -1
         
-        image = StickyNoteImage.objects.create(
-            sticky_note=note,
-            image=image_file,
-            order=max_order + 1
-        )
+        with transaction.atomic():
+            image = StickyNoteImage.objects.create(
+                sticky_note=note,
+                image=image_file,
+                order=max_order + 1
+            )
+            log_note_updated(note, request)
         
         serializer = StickyNoteImageSerializer(image)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class NoteGroupViewSet(viewsets.ModelViewSet):
+    """Groups of sticky notes that move as one unit
+    
+    Creating a group with ``note_ids`` converts those notes to coordinates
+    relative to the group; moving the group is then a single PATCH of
+    ``offset_x``/``offset_y`` (and optionally ``scale``).
+    """
+    serializer_class = NoteGroupSerializer
+    permission_classes = [permissions.IsAuthenticated, IsWhiteboardOwnerOrHasAccess]
+    
+    def get_queryset(self):
+        user = self.request.user
+        accessible_whiteboards = Whiteboard.objects.filter(
+            Q(owner=user) | Q(access_rights__user=user)
+        ).distinct()
+        return NoteGroup.objects.filter(whiteboard__in=accessible_whiteboards)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        whiteboard = serializer.validated_data['whiteboard']
+        self.check_object_permissions(request, whiteboard)
+        note_ids = serializer.validated_data.pop('note_ids', [])
+        
+        with transaction.atomic():
+            notes = StickyNote.objects.select_for_update().filter(whiteboard=whiteboard, id__in=note_ids)
+            if len(notes) != len(set(note_ids)):
+                return Response(
+                    {'error': 'All notes must exist on this whiteboard'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if any(note.note_group_id for note in notes):
+                return Response(
+                    {'error': 'Notes must be ungrouped before joining another group'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Anchor the group at the top-left corner of its members by default
+            corner = notes.aggregate(x=Min('x'), y=Min('y'))
+            group = serializer.save(
+                created_by=request.user,
+                offset_x=serializer.validated_data.get('offset_x', corner['x'] or 0),
+                offset_y=serializer.validated_data.get('offset_y', corner['y'] or 0),
+            )
+            # relative = (absolute - offset) / scale, in one UPDATE
+            StickyNote.objects.filter(id__in=note_ids).update(
+                note_group=group,
+                x=(F('x') - group.offset_x) / group.scale,
+                y=(F('y') - group.offset_y) / group.scale,
+                width=F('width') / group.scale,
+                height=F('height') / group.scale,
+            )
+            # queryset.update() skips the note signals; the preview shows the members
+            bump_whiteboard_version(group.whiteboard_id)
+            data = self.get_serializer(group).data
+            record_operation(
+                group.whiteboard_id, 'group_created', {'group': data, 'notes': [note_data(note) for note in group.notes.all()]},
+                target_id=group.id, user=request.user,
+            )
+        
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    @queued_write
+    def perform_update(self, serializer):
+        previous = changed_fields(serializer.instance, serializer.validated_data)
+        group = serializer.save()
+        # Members are stored relative to the group, so only the group row changes
+        record_operation(
+            group.whiteboard_id, 'group_updated', {'group': serializer.data},
+            target_id=group.id, user=self.request.user, previous=previous,
+        )
+    
+    def perform_destroy(self, instance):
+        self._ungroup(instance)
+    
+    @action(detail=True, methods=['post'])
+    def ungroup(self, request, pk=None):
+        """Dissolve the group, converting members back to board coordinates"""
+        group = self.get_object()
+        note_ids = list(group.notes.values_list('id', flat=True))
+        self._ungroup(group)
+        return Response({'note_ids': note_ids})
+    
+    def _ungroup(self, group):
+        with transaction.atomic():
+            previous = self.get_serializer(group).data
+            note_ids = list(group.notes.values_list('id', flat=True))
+            # absolute = offset + scale * relative, in one UPDATE
+            group.notes.update(
+                note_group=None,
+                x=F('x') * group.scale + group.offset_x,
+                y=F('y') * group.scale + group.offset_y,
+                width=F('width') * group.scale,
+                height=F('height') * group.scale,
+            )
+            whiteboard_id, group_id = group.whiteboard_id, group.id
+            group.delete()
+            # queryset.update() skips the note signals; the preview shows the members
+            bump_whiteboard_version(whiteboard_id)
+            notes = StickyNote.objects.filter(id__in=note_ids)
+            record_operation(
+                whiteboard_id, 'group_deleted',
+                {'id': group_id, 'notes': [note_data(note) for note in notes]},
+                target_id=group_id, user=self.request.user, previous=previous,
+            )
+
+
 class StickyNoteImageViewSet(viewsets.ModelViewSet):
     serializer_class = StickyNoteImageSerializer
     permission_classes = [permissions.IsAuthenticated, IsWhiteboardOwnerOrHasAccess]
@@ -206,6 +645,23 @@ class StickyNoteImageViewSet(viewsets.ModelViewSet):
         # Check permissions on the whiteboard
         self.check_object_permissions(self.request, obj.sticky_note.whiteboard)
         return obj
+    
+    # Not queued_write: uploads shouldn't hold up the SQLite writer's batch
+    @transaction.atomic
+    def perform_create(self, serializer):
+        image = serializer.save()
+        log_note_updated(image.sticky_note, self.request)
+    
+    @transaction.atomic
+    def perform_update(self, serializer):
+        image = serializer.save()
+        log_note_updated(image.sticky_note, self.request)
+    
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        note = instance.sticky_note
+        instance.delete()
+        log_note_updated(note, self.request)
 
 
 class DrawingViewSet(viewsets.ModelViewSet):
@@ -218,10 +674,79 @@ class DrawingViewSet(viewsets.ModelViewSet):
         accessible_whiteboards = Whiteboard.objects.filter(
             Q(owner=user) | Q(access_rights__user=user)
         ).distinct()
-        return Drawing.objects.filter(whiteboard__in=accessible_whiteboards)
+        queryset = Drawing.objects.filter(whiteboard__in=accessible_whiteboards)
+        if self.action == 'list':
+            queryset = queryset.select_related('created_by')
+        return queryset
     
+    @queued_write
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        drawing = serializer.save(created_by=self.request.user)
+        record_operation(drawing.whiteboard_id, 'drawing_created', {'drawing': serializer.data}, target_id=drawing.id, user=self.request.user)
+    
+    @queued_write
+    def perform_update(self, serializer):
+        previous = changed_fields(serializer.instance, serializer.validated_data)
+        # The save invalidates the tiles at the new position, these the old one
+        old_stroke = (serializer.instance.path_data, serializer.instance.stroke_width)
+        drawing = serializer.save()
+        invalidate_strokes(drawing.whiteboard_id, [old_stroke])
+        record_operation(
+            drawing.whiteboard_id, 'drawing_updated', {'drawing': serializer.data},
+            target_id=drawing.id, user=self.request.user, previous=previous,
+        )
+    
+    @queued_write
+    def perform_destroy(self, instance):
+        previous = self.get_serializer(instance).data
+        whiteboard_id, drawing_id = instance.whiteboard_id, instance.id
+        instance.delete()
+        record_operation(whiteboard_id, 'drawing_deleted', {'id': drawing_id}, target_id=drawing_id, user=self.request.user, previous=previous)
+    
+    def _stroke_id(self):
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+    
+    def _find_compacted(self):
+        """Look up a stroke that has been compacted into a DrawingLayer"""
+        layer, stroke = find_compacted_stroke(layers_for_user(self.request.user), self._stroke_id())
+        if layer is None:
+            raise Http404
+        self.check_object_permissions(self.request, layer.whiteboard)
+        return layer, stroke
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # Edits need a real row again, so move the stroke out of its layer
+            layer, stroke = self._find_compacted()
+            drawing = restore_stroke(layer, stroke)
+            if drawing is None:
+                raise
+            return drawing
+    
+    def retrieve(self, request, *args, **kwargs):
+        if self.get_queryset().filter(pk=self._stroke_id()).exists():
+            return super().retrieve(request, *args, **kwargs)
+        layer, stroke = self._find_compacted()
+        return Response(serialize_stroke(stroke, layer.whiteboard_id))
+    
+    def destroy(self, request, *args, **kwargs):
+        if self.get_queryset().filter(pk=self._stroke_id()).exists():
+            return super().destroy(request, *args, **kwargs)
+        layer, stroke = self._find_compacted()
+        with transaction.atomic():
+            remove_compacted_stroke(layer, stroke['id'])
+            bump_whiteboard_version(layer.whiteboard_id)
+            invalidate_strokes(layer.whiteboard_id, [(stroke['path_data'], stroke['stroke_width'])])
+            record_operation(
+                layer.whiteboard_id, 'drawing_deleted', {'id': stroke['id']},
+                target_id=stroke['id'], user=request.user, previous=serialize_stroke(stroke, layer.whiteboard_id),
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class CustomColorViewSet(viewsets.ModelViewSet):
@@ -266,7 +791,16 @@ class WhiteboardViewSettingsViewSet(viewsets.ModelViewSet):
         return WhiteboardViewSettings.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        view_settings = serializer.save(user=self.request.user)
+        view_settings_buffer.discard(view_settings.user_id, view_settings.whiteboard_id)
+    
+    def perform_update(self, serializer):
+        view_settings = serializer.save()
+        view_settings_buffer.discard(view_settings.user_id, view_settings.whiteboard_id)
+    
+    def perform_destroy(self, instance):
+        view_settings_buffer.discard(instance.user_id, instance.whiteboard_id)
+        instance.delete()
     
     @action(detail=False, methods=['get', 'post'])
     def for_whiteboard(self, request):
@@ -279,53 +813,58 @@ class WhiteboardViewSettingsViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verify user has access to this whiteboard
         try:
-            whiteboard = Whiteboard.objects.get(id=whiteboard_id)
-            if whiteboard.owner != request.user:
-                access = WhiteboardAccess.objects.filter(
-                    whiteboard=whiteboard,
-                    user=request.user
-                ).first()
-                if not access:
-                    return Response(
-                        {'error': 'You do not have access to this whiteboard'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-        except Whiteboard.DoesNotExist:
+            whiteboard_id = int(whiteboard_id)
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'Whiteboard not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
+        # Unsaved settings are newer than the row; access was checked when they were buffered
+        buffered = view_settings_buffer.get(request.user.id, whiteboard_id)
+        
+        # Verify user has access to this whiteboard
+        if buffered is None:
+            try:
+                whiteboard = Whiteboard.objects.get(id=whiteboard_id)
+                if whiteboard.owner_id != request.user.id:
+                    access = WhiteboardAccess.objects.filter(
+                        whiteboard=whiteboard,
+                        user=request.user
+                    ).first()
+                    if not access:
+                        return Response(
+                            {'error': 'You do not have access to this whiteboard'},
+                            status=status.HTTP_403_FORBIDDEN
+                        )
+            except Whiteboard.DoesNotExist:
+                return Response(
+                    {'error': 'Whiteboard not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
         if request.method == 'GET':
+            if buffered is not None:
+                return Response(buffered)
+            
             # Get existing settings or return defaults
-            settings = WhiteboardViewSettings.objects.filter(
+            view_settings = WhiteboardViewSettings.objects.filter(
                 user=request.user,
                 whiteboard_id=whiteboard_id
             ).first()
             
-            if settings:
-                serializer = self.get_serializer(settings)
+            if view_settings:
+                serializer = self.get_serializer(view_settings)
                 return Response(serializer.data)
             else:
                 # Return default settings
-                return Response({
-                    'zoom': 1.0,
-                    'pan_x': 0.0,
-                    'pan_y': 0.0
-                })
+                return Response(dict(DEFAULT_VIEW_SETTINGS))
         
         elif request.method == 'POST':
-            # Update or create settings
-            settings, created = WhiteboardViewSettings.objects.update_or_create(
-                user=request.user,
-                whiteboard_id=whiteboard_id,
-                defaults={
-                    'zoom': request.data.get('zoom', 1.0),
-                    'pan_x': request.data.get('pan_x', 0.0),
-                    'pan_y': request.data.get('pan_y', 0.0)
-                }
-            )
-            serializer = self.get_serializer(settings)
-            return Response(serializer.data)
+            try:
+                values = clean_view_settings(request.data)
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            # Written in bulk in the background (see view_settings.py)
+            return Response(view_settings_buffer.put(request.user.id, whiteboard_id, values))